@@ -8,11 +8,13 @@ __all__ = [
     'ElasticSearchClient',
     'FacebookClient',
     'GoogleClient',
+    'LocalQueueClient',
     'MediaConvertClient',
     'PinpointClient',
     'PostVerificationClient',
     'S3Client',
     'SecretsManagerClient',
+    'SqsClient',
 ]
 from .apple import AppleClient
 from .appstore import AppStoreClient
@@ -28,3 +30,4 @@ from .pinpoint import PinpointClient
 from .post_verification import PostVerificationClient
 from .s3 import S3Client
 from .secretsmanager import SecretsManagerClient
+from .sqs import LocalQueueClient, SqsClient
@@ -1,11 +1,23 @@
+import concurrent.futures
+import contextlib
+import contextvars
 import logging
 import os
+import threading
+import time
 
 import boto3
 import gql.transport.requests
+import requests
 import requests_aws4auth
 
 APPSYNC_GRAPHQL_URL = os.environ.get('APPSYNC_GRAPHQL_URL')
+# notifications without extra fields are sent to a user at most once within this many seconds, the last of a burst
+# once the window has passed, holding up the sending invocation until then. Unset disables.
+APPSYNC_NOTIFICATION_DEBOUNCE_SECONDS = float(os.environ.get('APPSYNC_NOTIFICATION_DEBOUNCE_SECONDS') or 0)
+
+NOTIFICATION_BATCH_SIZE = 25  # mutations per request
+NOTIFICATION_MAX_WORKERS = 8  # requests in flight at once
 
 logger = logging.getLogger()
 
@@ -18,10 +30,38 @@ class AppSyncClient:
         'Content-Type': 'application/json',
     }
 
-    def __init__(self, appsync_graphql_url=APPSYNC_GRAPHQL_URL):
+    def __init__(
+        self, appsync_graphql_url=APPSYNC_GRAPHQL_URL, debounce_seconds=APPSYNC_NOTIFICATION_DEBOUNCE_SECONDS
+    ):
         self.appsync_graphql_url = appsync_graphql_url
+        self.debounce_seconds = debounce_seconds
+        self._notification_batch_var = contextvars.ContextVar('notification_batch', default=None)
+        self._notification_lock = threading.Lock()
+        self._last_sent = {}  # {(user_id, notification_type): time.monotonic()}, for debouncing
+        # connections are kept alive between the requests of batches
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=NOTIFICATION_MAX_WORKERS)
+        self.session.mount('https://', adapter)
+
+    @contextlib.contextmanager
+    def notification_batch(self, batch):
+        """
+        Within this context, fire_notification() does not send notifications. Instead they are collected into
+        the dict `batch`, each distinct notification once, to be sent by flush_notifications(). Contexts in
+        different threads may share the same `batch`.
+        """
+        token = self._notification_batch_var.set(batch)
+        try:
+            yield
+        finally:
+            self._notification_batch_var.reset(token)
 
     def fire_notification(self, user_id, notification_type, **extra):
+        batch = self._notification_batch_var.get()
+        if batch is not None:
+            with self._notification_lock:
+                batch[(user_id, notification_type, tuple(sorted(extra.items())))] = None
+            return
         mutation = gql.gql(
             f'''
             mutation TriggerNotification ($input: NotificationInput!) {{
@@ -40,18 +80,102 @@ class AppSyncClient:
         }
         self.send(mutation, {'input': input_obj})
 
-    def send(self, query, variables):
+    def flush_notifications(self, batch):
+        """
+        Send the notifications collected by notification_batch() contexts, then clear them. Many are sent
+        to a request, and several requests at a time. Those held back by debouncing are sent once their window
+        has passed, this waiting until then. Raises if any request failed, after trying them all.
+        """
+        notifications, held_notifications, wait_seconds = self.debounce(list(batch))
+        batch.clear()
+        errors, chunk_cnt = self.send_notification_chunks(notifications)
+        if held_notifications:
+            time.sleep(wait_seconds)
+            held_errors, held_chunk_cnt = self.send_notification_chunks(held_notifications)
+            errors, chunk_cnt = errors + held_errors, chunk_cnt + held_chunk_cnt
+        if errors:
+            raise Exception(
+                f'Failed to send {len(errors)} of {chunk_cnt} batches of notifications: `{errors[0]}`'
+            )
+
+    def debounce(self, notifications):
+        """
+        Hold back the notifications without extra fields that were sent to the same user within the debounce
+        window. Returns those to send now, those held back, and the seconds until all their windows have passed.
+        """
+        if not self.debounce_seconds:
+            return notifications, [], 0
+        now = time.monotonic()
+        kept, held, wait_seconds = [], [], 0
+        with self._notification_lock:
+            # forget what's outside the window, so the memory used stays bounded in long-lived containers
+            self._last_sent = {k: v for k, v in self._last_sent.items() if now - v < self.debounce_seconds}
+            for user_id, notification_type, extra in notifications:
+                last_sent = None if extra else self._last_sent.get((user_id, notification_type))
+                if last_sent is None:
+                    kept.append((user_id, notification_type, extra))
+                else:
+                    held.append((user_id, notification_type, extra))
+                    wait_seconds = max(wait_seconds, last_sent + self.debounce_seconds - now)
+        return kept, held, wait_seconds
+
+    def send_notification_chunks(self, notifications):
+        "Send the notifications in chunks, several at a time. Returns the errors of chunks that failed and the count"
+        chunks = [
+            notifications[i : i + NOTIFICATION_BATCH_SIZE]
+            for i in range(0, len(notifications), NOTIFICATION_BATCH_SIZE)
+        ]
+        if not chunks:
+            return [], 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(chunks), NOTIFICATION_MAX_WORKERS)) as ex:
+            futures = [ex.submit(self.send_notifications, chunk) for chunk in chunks]
+        errors = [future.exception() for future in futures if future.exception()]
+        if self.debounce_seconds:
+            # debounce windows start once notifications are sent, not when they're tried
+            sent_at = time.monotonic()
+            with self._notification_lock:
+                for chunk, future in zip(chunks, futures):
+                    if future.exception():
+                        continue
+                    for user_id, notification_type, extra in chunk:
+                        if not extra:
+                            self._last_sent[(user_id, notification_type)] = sent_at
+        return errors, len(chunks)
+
+    def send_notifications(self, notifications):
+        "Send the notifications in a single request, as aliased mutations"
+        params, fields, variables = [], [], {}
+        for i, (user_id, notification_type, extra) in enumerate(notifications):
+            params.append(f'$input{i}: NotificationInput!')
+            selection = ' '.join(['userId', 'type', *(k for k, _ in extra)])
+            fields.append(f'n{i}: triggerNotification (input: $input{i}) {{ {selection} }}')
+            variables[f'input{i}'] = {'userId': user_id, 'type': notification_type, **dict(extra)}
+        query = f'mutation TriggerNotifications ({", ".join(params)}) {{ {" ".join(fields)} }}'
+        resp = self.session.post(
+            self.appsync_graphql_url,
+            json={'query': query, 'variables': variables},
+            headers=self.headers,
+            auth=self.auth(),
+        )
+        resp.raise_for_status()
+        errors = resp.json().get('errors')
+        if errors:
+            raise Exception(f'Appsync resp error: `{errors}` from query `{query}`, variables `{variables}`')
+
+    def auth(self):
         aws_session = boto3.session.Session()
         creds = aws_session.get_credentials().get_frozen_credentials()
-        auth = requests_aws4auth.AWS4Auth(
+        return requests_aws4auth.AWS4Auth(
             creds.access_key,
             creds.secret_key,
             aws_session.region_name,
             self.service_name,
             session_token=creds.token,
         )
+
+    def send(self, query, variables):
         transport = gql.transport.requests.RequestsHTTPTransport(
-            url=self.appsync_graphql_url, use_json=True, headers=self.headers, auth=auth,
+            url=self.appsync_graphql_url, use_json=True, headers=self.headers, auth=self.auth(),
         )
         resp = transport.execute(query, variables)
         if resp.errors:
@@ -1,20 +1,62 @@
 import base64
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import copy
+import itertools
 import json
 import logging
 import os
+import queue
+import random
 import re
+import threading
+import time
 
 import boto3
+import botocore.exceptions
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from app.logging import LogLevelContext
+from app.utils import TokenBucket
 
 DYNAMO_TABLE = os.environ.get('DYNAMO_TABLE')
+DYNAMO_TRACK_USAGE = os.environ.get('DYNAMO_TRACK_USAGE')
+
+BATCH_GET_CHUNK_SIZE = 100  # dynamo's limit
+BATCH_GET_MAX_WORKERS = 8
+BATCH_GET_MAX_ATTEMPTS = 8
+BATCH_WRITE_CHUNK_SIZE = 25  # dynamo's limit
+BATCH_WRITE_MAX_WORKERS = 8
+BATCH_WRITE_MAX_ATTEMPTS = 8
+BATCH_WRITE_LOG_THRESHOLD = 1000  # log the throughput of batch writes of at least this many items
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_CAP_SECONDS = 2
+THROTTLE_MAX_ATTEMPTS = 5
+THROTTLE_ERROR_CODES = ('ProvisionedThroughputExceededException', 'RequestLimitExceeded', 'ThrottlingException')
+WRITE_OPERATIONS = ('delete_item', 'put_item', 'update_item')
 logger = logging.getLogger()
 
 
+def backoff_seconds(attempt):
+    "Exponential backoff with full jitter, see aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter"
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
 class DynamoClient:
-    def __init__(self, table_name=DYNAMO_TABLE, create_table_schema=None):
+    def __init__(
+        self,
+        table_name=DYNAMO_TABLE,
+        create_table_schema=None,
+        track_usage=DYNAMO_TRACK_USAGE,
+        throttle_max_attempts=THROTTLE_MAX_ATTEMPTS,
+    ):
         """
         If create_table_schema is not None, then the table will be created
         on-the-fly. Useful when testing with a mocked dynamodb backend.
+        If track_usage is set, usage_tracking() contexts track consumed capacity.
+        Calls that are still throttled after botocore's retries are tried up to throttle_max_attempts times.
         """
         assert table_name, "Table name is required"
         self.table_name = table_name
@@ -28,6 +70,205 @@ class DynamoClient:
         self.table = boto3_resource.Table(table_name)
         self.boto3_client = boto3.client('dynamodb')
         self.exceptions = self.boto3_client.exceptions
+        self.deserialize = TypeDeserializer().deserialize
+        self.serialize = TypeSerializer().serialize
+        self._key_names = None
+        # context variables, rather than attributes, so that concurrent threads each have their own
+        self._item_cache_var = contextvars.ContextVar('item_cache', default=(None, None))
+        self._usage_label_var = contextvars.ContextVar('usage_label', default=None)
+        self._counter_deltas_var = contextvars.ContextVar('counter_deltas', default=None)
+        self._counter_deltas_lock = threading.Lock()
+        self.track_usage = track_usage
+        self._usage = None
+        self._usage_lock = threading.Lock()
+        self.throttle_max_attempts = throttle_max_attempts
+        self.throttle_counts = collections.Counter()
+        self.write_rate_limits = {}
+
+    @contextlib.contextmanager
+    def usage_tracking(self, label=None):
+        """
+        Within this context, if usage tracking is enabled, every call to dynamo requests its consumed
+        capacity, and the capacity, call count and wall time are aggregated by usage label, operation
+        and table or index. On exit the aggregate is logged as one structured record.
+        """
+        if not self.track_usage:
+            yield
+            return
+        self._usage = {}
+        try:
+            with self.usage_label(label):
+                yield
+            with LogLevelContext(logger, logging.INFO):
+                logger.info(
+                    f'Dynamo usage of table `{self.table_name}`', extra={'dynamo_usage': self.usage_summary()}
+                )
+        finally:
+            self._usage = None
+
+    @contextlib.contextmanager
+    def usage_label(self, label):
+        "Attribute usage within this context to `label`, ex: a graphql field or a stream listener"
+        token = self._usage_label_var.set(label)
+        try:
+            yield
+        finally:
+            self._usage_label_var.reset(token)
+
+    @property
+    def _usage_label(self):
+        return self._usage_label_var.get()
+
+    def usage_summary(self):
+        return [
+            {'label': label, 'operation': operation, **stats}
+            for (label, operation), stats in sorted(self._usage.items(), key=lambda kv: str(kv[0]))
+        ]
+
+    @contextlib.contextmanager
+    def usage_recorder(self, operation):
+        "Record the call count & wall time of the enclosed call. Yields a func to record consumed capacity"
+        if self._usage is None:
+            yield lambda consumed_capacity: None
+            return
+        consumed_capacities = []
+        start = time.perf_counter()
+        try:
+            yield consumed_capacities.append
+        finally:
+            seconds = time.perf_counter() - start
+            with self._usage_lock:
+                stats = self._usage.setdefault(
+                    (self._usage_label, operation), {'calls': 0, 'seconds': 0, 'capacityUnits': {}}
+                )
+                stats['calls'] += 1
+                stats['seconds'] += seconds
+                for consumed_capacity in consumed_capacities:
+                    self.add_capacity_units(stats['capacityUnits'], consumed_capacity)
+
+    def add_capacity_units(self, capacity_units, consumed_capacity):
+        "Sum a ConsumedCapacity response into `capacity_units`, a dict of table or index name to units"
+        # batch & transact operations return a list with one entry per table
+        if isinstance(consumed_capacity, list):
+            for capacity in consumed_capacity:
+                self.add_capacity_units(capacity_units, capacity)
+            return
+        units_by_name = {'table': consumed_capacity.get('Table', {}).get('CapacityUnits', 0)}
+        for index_name, index_capacity in consumed_capacity.get('GlobalSecondaryIndexes', {}).items():
+            units_by_name[index_name] = index_capacity.get('CapacityUnits', 0)
+        for name, units in units_by_name.items():
+            if units:
+                capacity_units[name] = capacity_units.get(name, 0) + float(units)
+
+    def call(self, operation, method, **kwargs):
+        "Make a call to dynamo, rate limiting writes, retrying throttles and recording usage if tracking usage"
+        if operation in WRITE_OPERATIONS:
+            self.limit_write_rate(kwargs.get('Key') or kwargs['Item'])
+        if self._usage is None:
+            return self.call_with_throttle_retries(operation, method, **kwargs)
+        with self.usage_recorder(operation) as record_consumed_capacity:
+            resp = self.call_with_throttle_retries(operation, method, **kwargs, ReturnConsumedCapacity='INDEXES')
+            if 'ConsumedCapacity' in resp:
+                record_consumed_capacity(resp['ConsumedCapacity'])
+        return resp
+
+    def call_with_throttle_retries(self, operation, method, **kwargs):
+        """
+        Botocore already retries throttled calls a few times in quick succession. If those all get throttled
+        too, we back off further with jitter before trying again. Throttles are counted in `throttle_counts`.
+        """
+        for attempt in itertools.count(1):
+            try:
+                resp = method(**kwargs)
+            except botocore.exceptions.ClientError as err:
+                throttled = err.response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+                self.count_throttles(operation, err.response, int(throttled))
+                if not throttled or attempt >= self.throttle_max_attempts:
+                    raise
+                logger.warning(f'Dynamo `{operation}` throttled, retrying (attempt {attempt})')
+                time.sleep(backoff_seconds(attempt))
+                continue
+            self.count_throttles(operation, resp)
+            return resp
+
+    def count_throttles(self, operation, resp, extra=0):
+        # for dynamo, botocore retries are almost always due to throttling
+        count = resp.get('ResponseMetadata', {}).get('RetryAttempts', 0) + extra
+        if count:
+            with self._usage_lock:
+                self.throttle_counts[operation] += count
+
+    @contextlib.contextmanager
+    def write_rate_limit(self, writes_per_second, pk_prefix=None):
+        """
+        Within this context, limit writes to items whose partitionKey has prefix `pk_prefix`
+        (or to all items, if not provided) to an average of `writes_per_second`.
+        Intended for bulk jobs, so they don't starve interactive traffic of write capacity.
+        """
+        assert pk_prefix not in self.write_rate_limits, f'Write rate limit for `{pk_prefix}` already set'
+        self.write_rate_limits[pk_prefix] = TokenBucket(writes_per_second)
+        try:
+            yield
+        finally:
+            del self.write_rate_limits[pk_prefix]
+
+    def limit_write_rate(self, pk):
+        "Block as needed to respect any write rate limit that applies to the item with key `pk`"
+        if not self.write_rate_limits:
+            return
+        pk_prefix = pk.get('partitionKey', '').split('/')[0]
+        for bucket in filter(None, (self.write_rate_limits.get(pk_prefix), self.write_rate_limits.get(None))):
+            bucket.acquire()
+
+    @contextlib.contextmanager
+    def item_cache(self):
+        """
+        Within this context, items read by primary key are remembered in an identity map keyed
+        by (partitionKey, sortKey) so that repeat reads of the same item are served locally.
+
+        Writes made through this client write through to the map. The ALL_NEW result of an update,
+        the item of a put and the post-transaction state of transaction puts & deletes are known to
+        be the latest state of the item, as is the result of a strongly consistent read. Strongly
+        consistent reads are served locally only for such known items. Intended to wrap a single
+        lambda invocation.
+
+        The cache is held in a context variable, so it is shared only with threads that run in a copy
+        of this context, see contextvars.copy_context().
+        """
+        token = self._item_cache_var.set(({}, set()))
+        try:
+            yield
+        finally:
+            self._item_cache_var.reset(token)
+
+    @property
+    def _item_cache(self):
+        return self._item_cache_var.get()[0]
+
+    @property
+    def _item_cache_known(self):
+        return self._item_cache_var.get()[1]
+
+    def cache_key(self, pk):
+        if self._item_cache is None or 'partitionKey' not in pk or 'sortKey' not in pk:
+            return None
+        return (pk['partitionKey'], pk['sortKey'])
+
+    def cache_set(self, pk, item, known=False):
+        "Remember `item`. Set `known` if `item` is known to be the latest state, ex: it was just written."
+        key = self.cache_key(pk)
+        if key:
+            self._item_cache[key] = copy.deepcopy(item)
+            if known:
+                self._item_cache_known.add(key)
+            else:
+                self._item_cache_known.discard(key)
+
+    def cache_discard(self, pk):
+        key = self.cache_key(pk)
+        if key:
+            self._item_cache.pop(key, None)
+            self._item_cache_known.discard(key)
 
     def add_item(self, query_kwargs):
         "Put an item and return what was putted"
@@ -36,29 +277,120 @@ class DynamoClient:
         if 'ConditionExpression' in query_kwargs:
             cond_exp += ' and (' + query_kwargs['ConditionExpression'] + ')'
         query_kwargs['ConditionExpression'] = cond_exp
-        self.table.put_item(**query_kwargs)
-        return query_kwargs.get('Item')
+        item = query_kwargs['Item']
+        self.cache_discard(item)
+        self.call('put_item', self.table.put_item, **query_kwargs)
+        # round trip through the serializer so the cached item has the types a read would return
+        self.cache_set(item, self.deserialize_item(self.serialize_item(item)), known=True)
+        return item
 
     def get_item(self, pk, **kwargs):
         "Get an item by its primary key"
-        return self.table.get_item(Key=pk, **kwargs).get('Item')
+        strongly_consistent = bool(kwargs.get('ConsistentRead'))
+        key = self.cache_key(pk) if 'ProjectionExpression' not in kwargs else None
+        if key and key in self._item_cache:
+            if not strongly_consistent or key in self._item_cache_known:
+                return copy.deepcopy(self._item_cache[key])
+        item = self.call('get_item', self.table.get_item, Key=pk, **kwargs).get('Item')
+        if key:
+            self.cache_set(pk, item, known=strongly_consistent)
+        return item
 
     def get_typed_item(self, typed_pk, **kwargs):
         "Get an typed version of the item by its typed primary key"
-        return self.boto3_client.get_item(Key=typed_pk, TableName=self.table_name, **kwargs).get('Item')
+        resp = self.call(
+            'get_item', self.boto3_client.get_item, Key=typed_pk, TableName=self.table_name, **kwargs
+        )
+        return resp.get('Item')
 
-    def batch_get_items(self, typed_keys, projection_expression=None):
+    def batch_get_items(self, keys, projection_expression=None, typed=False, as_dict=False):
         """
-        Get a bunch of items in one batch request.
-        Both the input `typed_keys` and the return value should/will be in
-        verbose format, with types.
-        Order *not* maintained.
+        Get any number of items by their primary keys.
+
+        Keys are split into chunks of 100 that are requested concurrently, and any UnprocessedKeys
+        are retried with jittered exponential backoff. Set `typed` if both the input `keys` and the
+        returned items should be in verbose format, with types.
+
+        Returns a list of items in the same order as `keys`, with None for items that do not exist.
+        If `as_dict` is set, instead returns a dict mapping a tuple of each key's values to its item,
+        for items that exist.
         """
-        assert len(typed_keys) <= 100, "Max 100 items per batch get request"
-        kwargs = {'RequestItems': {self.table_name: {'Keys': typed_keys}}}
+        key_names = list(keys[0].keys()) if keys else []
+        typed_keys = keys if typed else [self.serialize_item(key) for key in keys]
+        lookup = [tuple(self.deserialize(key[name]) for name in key_names) for key in typed_keys]
+
+        found = {}
+        if not typed and not projection_expression and self._item_cache is not None:
+            for key, key_values in zip(keys, lookup):
+                cache_key = self.cache_key(key)
+                if cache_key in self._item_cache:
+                    found[key_values] = copy.deepcopy(self._item_cache[cache_key])
+
+        # dynamo rejects duplicate keys in the same request
+        unique_typed_keys = {}
+        for typed_key, key_values in zip(typed_keys, lookup):
+            if key_values not in found:
+                unique_typed_keys.setdefault(key_values, typed_key)
+        unique_typed_keys = list(unique_typed_keys.values())
+
+        request_kwargs = {}
         if projection_expression:
-            kwargs['RequestItems'][self.table_name]['ProjectionExpression'] = projection_expression
-        return self.boto3_client.batch_get_item(**kwargs)['Responses'][self.table_name]
+            # the key attributes are needed to match up the returned items with the requested keys
+            missing_names = [name for name in key_names if name not in projection_expression.split(', ')]
+            request_kwargs['ProjectionExpression'] = ', '.join([projection_expression, *missing_names])
+
+        chunks = [
+            unique_typed_keys[i : i + BATCH_GET_CHUNK_SIZE]
+            for i in range(0, len(unique_typed_keys), BATCH_GET_CHUNK_SIZE)
+        ]
+        if chunks:
+            max_workers = min(len(chunks), BATCH_GET_MAX_WORKERS)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # each worker runs in a copy of our context, so usage is attributed to our usage label
+                futures = [
+                    executor.submit(contextvars.copy_context().run, self._batch_get_chunk, chunk, request_kwargs)
+                    for chunk in chunks
+                ]
+                chunk_results = (future.result() for future in futures)
+                for typed_item in itertools.chain.from_iterable(chunk_results):
+                    item = typed_item if typed else self.deserialize_item(typed_item)
+                    key_values = tuple(self.deserialize(typed_item[name]) for name in key_names)
+                    found[key_values] = item
+                    if not typed and not projection_expression:
+                        self.cache_set({name: item[name] for name in key_names}, item)
+
+        if not typed and not projection_expression:
+            for key, key_values in zip(keys, lookup):
+                if key_values not in found:
+                    self.cache_set(key, None)
+
+        if as_dict:
+            # keys the item cache remembers as missing are held as None
+            return {key_values: item for key_values, item in found.items() if item is not None}
+        return [found.get(key_values) for key_values in lookup]
+
+    def _batch_get_chunk(self, typed_keys, request_kwargs):
+        "Get up to 100 items in one batch request, retrying any keys dynamo leaves unprocessed"
+        typed_items = []
+        request_items = {self.table_name: {'Keys': typed_keys, **request_kwargs}}
+        for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(backoff_seconds(attempt))
+            resp = self.call('batch_get_item', self.boto3_client.batch_get_item, RequestItems=request_items)
+            typed_items.extend(resp['Responses'].get(self.table_name, []))
+            request_items = resp.get('UnprocessedKeys')
+            if not request_items:
+                return typed_items
+        unprocessed_cnt = len(request_items[self.table_name]['Keys'])
+        raise Exception(
+            f'Batch get left {unprocessed_cnt} keys unprocessed after {BATCH_GET_MAX_ATTEMPTS} attempts'
+        )
+
+    def serialize_item(self, item):
+        return {k: self.serialize(v) for k, v in item.items()}
+
+    def deserialize_item(self, typed_item):
+        return {k: self.deserialize(v) for k, v in typed_item.items()}
 
     def update_item(self, query_kwargs, failure_warning=None):
         """
@@ -72,11 +404,15 @@ class DynamoClient:
         query_kwargs['ConditionExpression'] = cond_exp
         query_kwargs['ReturnValues'] = 'ALL_NEW'
         try:
-            return self.table.update_item(**query_kwargs).get('Attributes')
+            item = self.call('update_item', self.table.update_item, **query_kwargs).get('Attributes')
         except self.exceptions.ConditionalCheckFailedException:
+            self.cache_discard(query_kwargs['Key'])
             if failure_warning is None:
                 raise
             logger.warning(failure_warning)
+            return None
+        self.cache_set(query_kwargs['Key'], item, known=True)
+        return item
 
     def set_attributes(self, key, **attributes):
         """
@@ -90,10 +426,107 @@ class DynamoClient:
             'ExpressionAttributeValues': {f':{k}': v for k, v in attributes.items()},
             'ReturnValues': 'ALL_NEW',
         }
-        return self.table.update_item(**kwargs).get('Attributes')
+        item = self.call('update_item', self.table.update_item, **kwargs).get('Attributes')
+        self.cache_set(key, item, known=True)
+        return item
+
+    def add_to_set(self, key, attribute_name, values, **attributes):
+        """
+        Add the given values to the set attribute, and set the given attributes, for the given key.
+        If the item does not exist, create it. Adding values already in the set changes nothing.
+        """
+        kwargs = {
+            'Key': key,
+            'UpdateExpression': ' '.join(
+                [
+                    f'ADD {attribute_name} :{attribute_name}',
+                    *(['SET ' + ', '.join([f'{k} = :{k}' for k in attributes.keys()])] if attributes else []),
+                ]
+            ),
+            'ExpressionAttributeValues': {
+                f':{attribute_name}': set(values),
+                **{f':{k}': v for k, v in attributes.items()},
+            },
+        }
+        self.call('update_item', self.table.update_item, **kwargs)
+        self.cache_discard(key)
+
+    @contextlib.contextmanager
+    def counter_deltas(self, deltas):
+        """
+        Within this context, increment_count() and decrement_count() do not write to dynamo. Instead their
+        changes are summed into the dict `deltas`, keyed by (partitionKey, sortKey, attribute name), to be
+        written by flush_counts(). Contexts in different threads may share the same `deltas`. Pass `deltas`
+        of None to write changes to counters immediately again within the context.
+        """
+        token = self._counter_deltas_var.set(deltas)
+        try:
+            yield
+        finally:
+            self._counter_deltas_var.reset(token)
+
+    def accumulate_count(self, key, attribute_name, delta):
+        "If within a counter_deltas() context, sum the change into its deltas and return True"
+        deltas = self._counter_deltas_var.get()
+        if deltas is None:
+            return False
+        delta_key = (key['partitionKey'], key['sortKey'], attribute_name)
+        with self._counter_deltas_lock:
+            deltas[delta_key] = deltas.get(delta_key, 0) + delta
+        return True
+
+    def flush_counts(self, deltas):
+        """
+        Write the changes summed by counter_deltas() contexts, one update per counter, then clear them.
+        As with decrement_count(), a counter is not decremented below zero. A counter that fails to update
+        is logged and does not stop the others from being written.
+        """
+        for (partition_key, sort_key, attribute_name), delta in deltas.items():
+            if delta == 0:
+                continue
+            key = {'partitionKey': partition_key, 'sortKey': sort_key}
+            try:
+                self.flush_count(key, attribute_name, delta)
+            except Exception as err:
+                logger.exception(f'Failed to add {delta} to {attribute_name} for key `{key}`: {err}')
+        deltas.clear()
+
+    def flush_count(self, key, attribute_name, delta):
+        "Add `delta` to a counter, taking it no lower than zero. Logs a WARNING upon failure."
+        try:
+            return self.add_to_count(key, attribute_name, delta)
+        except self.exceptions.ConditionalCheckFailedException:
+            if delta > 0:
+                logger.warning(f'Failed to add {delta} to {attribute_name} for key `{key}`')
+                return None
+        # the counter is too low to take all of the decrement, so it stops at zero, as it would have one by one
+        query_kwargs = {
+            'Key': key,
+            'UpdateExpression': 'SET #attrName = :zero',
+            'ExpressionAttributeNames': {'#attrName': attribute_name},
+            'ExpressionAttributeValues': {':zero': 0, ':min': -delta},
+            'ConditionExpression': '#attrName > :zero AND #attrName < :min',
+        }
+        failure_warning = f'Failed to decrement {attribute_name} for key `{key}`'
+        return self.update_item(query_kwargs, failure_warning=failure_warning)
+
+    def add_to_count(self, key, attribute_name, delta):
+        "Add `delta` to a counter, failing if that would take it below zero"
+        query_kwargs = {
+            'Key': key,
+            'UpdateExpression': 'ADD #attrName :delta',
+            'ExpressionAttributeNames': {'#attrName': attribute_name},
+            'ExpressionAttributeValues': {':delta': delta},
+        }
+        if delta < 0:
+            query_kwargs['ExpressionAttributeValues'][':min'] = -delta
+            query_kwargs['ConditionExpression'] = '#attrName >= :min'
+        return self.update_item(query_kwargs)
 
     def increment_count(self, key, attribute_name):
         "Best-effort attempt to increment a counter. Logs a WARNING upon failure."
+        if self.accumulate_count(key, attribute_name, 1):
+            return None
         query_kwargs = {
             'Key': key,
             'UpdateExpression': 'ADD #attrName :one',
@@ -106,6 +539,8 @@ class DynamoClient:
 
     def decrement_count(self, key, attribute_name):
         "Best-effort attempt to decrement a counter. Logs a WARNING upon failure."
+        if self.accumulate_count(key, attribute_name, -1):
+            return None
         query_kwargs = {
             'Key': key,
             'UpdateExpression': 'ADD #attrName :neg_one',
@@ -118,18 +553,17 @@ class DynamoClient:
 
     def batch_put_items(self, generator):
         "Batch put the items yielded by `generator`. Returns count of how many puts requested."
-        cnt = 0
-        with self.table.batch_writer() as batch:
-            for item in generator:
-                batch.put_item(Item=item)
-                cnt += 1
-        return cnt
+        write_requests = ((item, {'PutRequest': {'Item': self.serialize_item(item)}}) for item in generator)
+        return self.batch_write(write_requests)
 
     def delete_item(self, pk, **kwargs):
         "Delete an item and return what was deleted"
         return_values = kwargs.pop('ReturnValues', 'ALL_OLD')
+        self.cache_discard(pk)
+        resp = self.call('delete_item', self.table.delete_item, Key=pk, ReturnValues=return_values, **kwargs)
+        self.cache_set(pk, None, known=True)
         # return None if nothing was deleted, rather than an empty dict
-        return self.table.delete_item(Key=pk, ReturnValues=return_values, **kwargs).get('Attributes') or None
+        return resp.get('Attributes') or None
 
     def batch_delete_items(self, generator):
         "Batch delete the items or keys yielded by `generator`. Returns count of how many deletes requested."
@@ -138,13 +572,72 @@ class DynamoClient:
 
     def batch_delete(self, key_generator):
         "Batch delete items by keys yielded by `generator`. Returns count of how many deletes requested."
+        write_requests = ((key, {'DeleteRequest': {'Key': self.serialize_item(key)}}) for key in key_generator)
+        return self.batch_write(write_requests)
+
+    def batch_write(self, write_requests):
+        """
+        Apply the (primary key, typed write request) pairs yielded by `write_requests`.
+
+        Write requests are grouped into chunks of 25 that are sent concurrently by a pool of worker
+        threads, and any UnprocessedItems are retried with jittered exponential backoff. The number
+        of chunks in flight is bounded, so generators of any size are not buffered in memory. Writes
+        to the same item should not be yielded more than once, as their order is not defined.
+        Returns count of how many writes requested.
+        """
         cnt = 0
-        with self.table.batch_writer() as batch:
-            for key in key_generator:
-                batch.delete_item(Key=key)
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=BATCH_WRITE_MAX_WORKERS) as executor:
+            futures = set()
+
+            def submit(chunk):
+                nonlocal futures
+                if len(futures) >= 2 * BATCH_WRITE_MAX_WORKERS:
+                    done, futures = concurrent.futures.wait(
+                        futures, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        future.result()  # raise any error as soon as possible
+                futures.add(executor.submit(contextvars.copy_context().run, self._batch_write_chunk, chunk))
+
+            chunk = []
+            for pk, write_request in write_requests:
+                self.cache_discard(pk)
+                self.limit_write_rate(pk)
+                chunk.append(write_request)
                 cnt += 1
+                if len(chunk) == BATCH_WRITE_CHUNK_SIZE:
+                    submit(chunk)
+                    chunk = []
+            if chunk:
+                submit(chunk)
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+
+        if cnt >= BATCH_WRITE_LOG_THRESHOLD:
+            seconds = time.perf_counter() - start
+            with LogLevelContext(logger, logging.INFO):
+                logger.info(
+                    f'Dynamo batch wrote {cnt} items to table `{self.table_name}` in {seconds:.2f} seconds '
+                    + f'({cnt / seconds:.0f} items per second)'
+                )
         return cnt
 
+    def _batch_write_chunk(self, write_requests):
+        "Apply up to 25 write requests in one batch request, retrying any dynamo leaves unprocessed"
+        request_items = {self.table_name: write_requests}
+        for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(backoff_seconds(attempt))
+            resp = self.call('batch_write_item', self.boto3_client.batch_write_item, RequestItems=request_items)
+            request_items = resp.get('UnprocessedItems')
+            if not request_items:
+                return
+        unprocessed_cnt = len(request_items[self.table_name])
+        raise Exception(
+            f'Batch write left {unprocessed_cnt} items unprocessed after {BATCH_WRITE_MAX_ATTEMPTS} attempts'
+        )
+
     def encode_pagination_token(self, last_evaluated_key):
         "From a LastEvaluatedKey to a obfucated string"
         # https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/Query.html#Query.Pagination
@@ -154,13 +647,43 @@ class DynamoClient:
         "From a obfucated string to a ExclusiveStartKey"
         return json.loads(base64.b64decode(token.encode('ascii')).decode('utf-8'))
 
-    def query(self, query_kwargs, limit=None, next_token=None):
-        "Query the table and return items & pagination token from the result"
+    @property
+    def key_names(self):
+        "Names of the attributes of the table's primary key"
+        if self._key_names is None:
+            self._key_names = [key['AttributeName'] for key in self.table.key_schema]
+        return self._key_names
+
+    def projection_kwargs(self, query_kwargs, fields=None, keys_only=False):
+        """
+        Return `query_kwargs` with a ProjectionExpression for the given list of `fields`, or for just
+        the table's primary key if `keys_only` is set. Attribute names are substituted with placeholders,
+        so reserved words may be used as fields.
+        """
+        if keys_only:
+            assert not fields, 'Cannot specify both fields and keys_only'
+            fields = self.key_names
+        if not fields:
+            return query_kwargs
+        assert 'ProjectionExpression' not in query_kwargs, 'Cannot specify both fields and a ProjectionExpression'
+        names = {f'#proj{i}': field for i, field in enumerate(fields)}
+        return {
+            **query_kwargs,
+            'ProjectionExpression': ', '.join(names.keys()),
+            'ExpressionAttributeNames': {**query_kwargs.get('ExpressionAttributeNames', {}), **names},
+        }
+
+    def query(self, query_kwargs, limit=None, next_token=None, fields=None, keys_only=False):
+        """
+        Query the table and return items & pagination token from the result.
+        Set `fields` to a list of attribute names to fetch only those, or `keys_only` for only the primary key.
+        """
         if limit:
             query_kwargs['Limit'] = limit
         if next_token:
             query_kwargs['ExclusiveStartKey'] = self.decode_pagination_token(next_token)
-        resp = self.table.query(**query_kwargs)
+        query_kwargs = self.projection_kwargs(query_kwargs, fields=fields, keys_only=keys_only)
+        resp = self.call('query', self.table.query, **query_kwargs)
         last_key = resp.get('LastEvaluatedKey')
         return {
             'items': resp['Items'],
@@ -173,28 +696,106 @@ class DynamoClient:
         # if you want to avoid causing negative performance impacts for the common case
         assert 'FilterExpression' not in query_kwargs
         query_kwargs['Limit'] = 1
-        resp = self.table.query(**query_kwargs)
+        resp = self.call('query', self.table.query, **query_kwargs)
         return resp['Items'][0] if resp['Items'] else None
 
-    def generate_all_query(self, query_kwargs):
-        "Return a generator that iterates over all results of the query"
+    def generate_all_query(self, query_kwargs, fields=None, keys_only=False):
+        """
+        Return a generator that iterates over all results of the query.
+        Set `fields` to a list of attribute names to fetch only those, or `keys_only` for only the primary key.
+        """
+        query_kwargs = self.projection_kwargs(query_kwargs, fields=fields, keys_only=keys_only)
         last_key = False
         while last_key is not None:
             start_kwargs = {'ExclusiveStartKey': last_key} if last_key else {}
-            resp = self.table.query(**query_kwargs, **start_kwargs)
+            resp = self.call('query', self.table.query, **query_kwargs, **start_kwargs)
             for item in resp['Items']:
                 yield item
             last_key = resp.get('LastEvaluatedKey')
 
-    def generate_all_scan(self, scan_kwargs):
-        "Return a generator that iterates over all results of the scan"
-        last_key = False
-        while last_key is not None:
+    def generate_all_scan(self, scan_kwargs, total_segments=None, checkpoint=None):
+        """
+        Return a generator that iterates over all results of the scan.
+        See generate_all_scan_pages() for `total_segments` and `checkpoint`.
+        """
+        for items in self.generate_all_scan_pages(
+            scan_kwargs, total_segments=total_segments, checkpoint=checkpoint
+        ):
+            yield from items
+
+    def generate_all_scan_pages(self, scan_kwargs, total_segments=None, checkpoint=None):
+        """
+        Return a generator that iterates over each page of results of the scan, as a list of items.
+        Pages that matched nothing are included, so callers get a chance to act between every page.
+
+        If `total_segments` is set, the table is scanned as that many segments in parallel threads
+        and results are yielded in no particular order.
+
+        If `checkpoint` is provided it should be a dict, which is kept updated as a map of each segment
+        number (as a string) to the LastEvaluatedKey of the last page that the caller has moved on from,
+        or None once that segment is finished. Passing the checkpoint of an unfinished scan, with
+        the same `total_segments`, resumes that scan.
+        """
+        checkpoint = {} if checkpoint is None else checkpoint
+        segments = [
+            segment
+            for segment in map(str, range(total_segments or 1))
+            if segment not in checkpoint or checkpoint[segment] is not None
+        ]
+        if not total_segments:
+            for segment in segments:
+                for items, last_key in self._generate_scan_pages(scan_kwargs, checkpoint.get(segment)):
+                    yield items
+                    checkpoint[segment] = last_key
+            return
+
+        pages = queue.Queue(maxsize=2 * len(segments))
+        stop = threading.Event()
+
+        def put(page):
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def scan_segment(segment):
+            segment_kwargs = {**scan_kwargs, 'Segment': int(segment), 'TotalSegments': total_segments}
+            try:
+                for items, last_key in self._generate_scan_pages(segment_kwargs, checkpoint.get(segment)):
+                    if not put((segment, items, last_key, None)):
+                        return
+            except Exception as err:
+                put((segment, None, None, err))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(segments), 1)) as executor:
+            for segment in segments:
+                executor.submit(contextvars.copy_context().run, scan_segment, segment)
+            try:
+                unfinished = len(segments)
+                while unfinished:
+                    segment, items, last_key, err = pages.get()
+                    if err:
+                        raise err
+                    yield items
+                    checkpoint[segment] = last_key
+                    if last_key is None:
+                        unfinished -= 1
+            finally:
+                # release any workers still scanning if we're exiting early
+                stop.set()
+
+    def _generate_scan_pages(self, scan_kwargs, last_key=None):
+        "Generate (items, last_key) for each page of the scan, starting after `last_key` if provided"
+        while True:
             start_kwargs = {'ExclusiveStartKey': last_key} if last_key else {}
-            resp = self.table.scan(**scan_kwargs, **start_kwargs)
-            for item in resp['Items']:
-                yield item
+            resp = self.call('scan', self.table.scan, **scan_kwargs, **start_kwargs)
             last_key = resp.get('LastEvaluatedKey')
+            yield resp['Items'], last_key
+            if last_key is None:
+                return
 
     def transact_write_items(self, transact_items, transact_exceptions=None):
         """
@@ -212,11 +813,26 @@ class DynamoClient:
         else:
             assert len(transact_items) == len(transact_exceptions)
 
+        # the state of put & deleted items is known once the transaction succeeds
+        known_items = []
         for ti in transact_items:
-            list(ti.values()).pop()['TableName'] = self.table_name
+            op_kwargs = list(ti.values()).pop()
+            op_kwargs['TableName'] = self.table_name
+            typed_pk = op_kwargs.get('Key') or op_kwargs['Item']
+            pk = {k: self.deserialize(v) for k, v in typed_pk.items() if k in ('partitionKey', 'sortKey')}
+            if 'ConditionCheck' in ti:
+                continue
+            self.cache_discard(pk)
+            self.limit_write_rate(pk)
+            if 'Put' in ti:
+                known_items.append((pk, self.deserialize_item(op_kwargs['Item'])))
+            if 'Delete' in ti:
+                known_items.append((pk, None))
 
         try:
-            self.boto3_client.transact_write_items(TransactItems=transact_items)
+            self.call(
+                'transact_write_items', self.boto3_client.transact_write_items, TransactItems=transact_items
+            )
         except self.boto3_client.exceptions.TransactionCanceledException as err:
             # we want to raise a more specific error than 'the whole transaction failed'
             # there is no way to get the CancellationReasons in boto3, so this is the best we can do
@@ -228,3 +844,6 @@ class DynamoClient:
                     if transact_exception is not None:
                         raise transact_exception from err
             raise err
+
+        for pk, item in known_items:
+            self.cache_set(pk, item, known=True)
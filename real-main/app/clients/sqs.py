@@ -0,0 +1,52 @@
+import collections
+import concurrent.futures
+import json
+
+import boto3
+
+# the most messages sqs accepts in a single SendMessageBatch call
+SEND_BATCH_SIZE = 10
+
+
+class SqsClient:
+    def __init__(self, queue_url):
+        assert queue_url, "Queue url is required"
+        self.queue_url = queue_url
+        self.boto_client = boto3.client('sqs')
+
+    def send_messages(self, bodies):
+        "Send a message for each of the json-serializable `bodies`"
+        entries = [{'Id': str(i), 'MessageBody': json.dumps(body)} for i, body in enumerate(bodies)]
+        for offset in range(0, len(entries), SEND_BATCH_SIZE):
+            chunk = entries[offset : offset + SEND_BATCH_SIZE]
+            resp = self.boto_client.send_message_batch(QueueUrl=self.queue_url, Entries=chunk)
+            if resp.get('Failed'):
+                raise Exception(f'Failed to send {len(resp["Failed"])} messages to `{self.queue_url}`')
+
+
+class LocalQueueClient:
+    """
+    An in-memory stand-in for SqsClient, for the test suite and for local runs. Messages sent are kept
+    until drained by workers in this process.
+    """
+
+    def __init__(self):
+        self.messages = collections.deque()
+
+    def send_messages(self, bodies):
+        # round trip through json, as sqs does
+        self.messages.extend(json.loads(json.dumps(body)) for body in bodies)
+
+    def drain(self, callback, max_workers=1):
+        """
+        Call `callback` with the body of each message, concurrently on up to `max_workers` threads, until
+        there are none left, including those sent by the callbacks. Returns the count of messages processed.
+        """
+        count = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while self.messages:
+                bodies = [self.messages.popleft() for _ in range(min(max_workers, len(self.messages)))]
+                for future in [executor.submit(callback, body) for body in bodies]:
+                    future.result()
+                count += len(bodies)
+        return count
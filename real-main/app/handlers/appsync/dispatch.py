@@ -55,7 +55,8 @@ def dispatch(event, context):
         logger.info(f'Handling AppSync GQL resolution of `{field}`', extra={'gql': gql_details, 'client': client})
 
     try:
-        resp = handler(caller_user_id, arguments, source, context)
+        with routes.invocation_context(field):
+            resp = handler(caller_user_id, arguments, source, context)
     except ClientException as err:
         msg = 'ClientError: ' + str(err)
         logger.warning(msg)
@@ -29,6 +29,7 @@ from .. import xray
 from . import routes
 from .exceptions import ClientException
 
+DYNAMO_FEED_TABLE = os.environ.get('DYNAMO_FEED_TABLE')
 S3_UPLOADS_BUCKET = os.environ.get('S3_UPLOADS_BUCKET')
 S3_PLACEHOLDER_PHOTOS_BUCKET = os.environ.get('S3_PLACEHOLDER_PHOTOS_BUCKET')
 
@@ -43,6 +44,7 @@ clients = {
     'cloudfront': clients.CloudFrontClient(secrets_manager_client.get_cloudfront_key_pair),
     'cognito': clients.CognitoClient(),
     'dynamo': clients.DynamoClient(),
+    'dynamo_feed': clients.DynamoClient(table_name=DYNAMO_FEED_TABLE),
     'facebook': clients.FacebookClient(),
     'google': clients.GoogleClient(secrets_manager_client.get_google_client_ids),
     'pinpoint': clients.PinpointClient(),
@@ -60,11 +62,17 @@ card_manager = managers.get('card') or models.CardManager(clients, managers=mana
 chat_manager = managers.get('chat') or models.ChatManager(clients, managers=managers)
 chat_message_manager = managers.get('chat_message') or models.ChatMessageManager(clients, managers=managers)
 comment_manager = managers.get('comment') or models.CommentManager(clients, managers=managers)
+feed_manager = managers.get('feed') or models.FeedManager(clients, managers=managers)
 follower_manager = managers.get('follower') or models.FollowerManager(clients, managers=managers)
 like_manager = managers.get('like') or models.LikeManager(clients, managers=managers)
 post_manager = managers.get('post') or models.PostManager(clients, managers=managers)
 user_manager = managers.get('user') or models.UserManager(clients, managers=managers)
 
+# re-use items already read from dynamo during the resolution of a single field
+routes.register_invocation_context(lambda field: clients['dynamo'].item_cache())
+# attribute dynamo usage to the field being resolved
+routes.register_invocation_context(lambda field: clients['dynamo'].usage_tracking(label=field))
+
 
 def validate_caller(func):
     "Decorator that inits a caller_user model and verifies the caller is ACTIVE"
@@ -351,6 +359,21 @@ def user_photo(caller_user_id, arguments, source, context):
     }
 
 
+@routes.register('User.feed')
+def user_feed(caller_user_id, arguments, source, context):
+    # feed is private to the user themselves
+    if source['userId'] != caller_user_id:
+        return None
+    limit = arguments.get('limit')
+    limit = 20 if limit is None else limit
+    if limit < 1 or limit > 100:
+        raise ClientException('Limit cannot be less than 1 or greater than 100')
+    post_ids, next_token = feed_manager.get_feed_page(
+        caller_user_id, limit, next_token=arguments.get('nextToken')
+    )
+    return {'items': post_ids, 'nextToken': next_token}
+
+
 @routes.register('Mutation.followUser')
 @validate_caller
 def follow_user(caller_user, arguments, source, context):
@@ -391,7 +414,8 @@ def unfollow_user(caller_user, arguments, source, context):
     except FollowerException as err:
         raise ClientException(str(err)) from err
 
-    resp = user_manager.get_user(followed_user_id, strongly_consistent=True).serialize(caller_user.id)
+    # follow operations do not write the user item (counts are updated by stream handlers)
+    resp = user_manager.get_user(followed_user_id).serialize(caller_user.id)
     resp['followedStatus'] = follow.status
     return resp
 
@@ -411,7 +435,7 @@ def accept_follower_user(caller_user, arguments, source, context):
     except FollowerException as err:
         raise ClientException(str(err)) from err
 
-    resp = user_manager.get_user(follower_user_id, strongly_consistent=True).serialize(caller_user.id)
+    resp = user_manager.get_user(follower_user_id).serialize(caller_user.id)
     resp['followerStatus'] = follow.status
     return resp
 
@@ -431,7 +455,7 @@ def deny_follower_user(caller_user, arguments, source, context):
     except FollowerException as err:
         raise ClientException(str(err)) from err
 
-    resp = user_manager.get_user(follower_user_id, strongly_consistent=True).serialize(caller_user.id)
+    resp = user_manager.get_user(follower_user_id).serialize(caller_user.id)
     resp['followerStatus'] = follow.status
     return resp
 
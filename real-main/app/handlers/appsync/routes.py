@@ -1,12 +1,17 @@
 "Routing table to dispatch graphql calls to the correct handler"
+import contextlib
 import importlib
 
 # graphql field -> python handler
 cache = {}
 
+# context manager factories, called with the graphql field, to be entered around every handler invocation
+invocation_contexts = []
+
 
 def clear():
     cache.clear()
+    invocation_contexts.clear()
 
 
 def register(field):
@@ -19,12 +24,25 @@ def register(field):
     return inner
 
 
+def register_invocation_context(context_factory):
+    "Register a context manager factory to be called with the field and entered around every handler invocation"
+    invocation_contexts.append(context_factory)
+
+
+@contextlib.contextmanager
+def invocation_context(field):
+    with contextlib.ExitStack() as stack:
+        for context_factory in invocation_contexts:
+            stack.enter_context(context_factory(field))
+        yield
+
+
 def get_handler(field):
     return cache.get(field)
 
 
 def discover(path):
-    cache.clear()
+    clear()
     # registers handlers in the routing table as a side effect of importing
     # add more imports here as handlers are spread across files
     importlib.import_module(path)
@@ -67,7 +67,12 @@ def delete_recently_expired_posts(event, context):
 @handler_logging
 def delete_older_expired_posts(event, context):
     now = pendulum.now('utc')
-    post_manager.delete_older_expired_posts(now=now)
+
+    def should_stop():
+        # leave ourselves time to save our progress through the scan before the lambda times out
+        return context.get_remaining_time_in_millis() < 60 * 1000
+
+    post_manager.delete_older_expired_posts(now=now, should_stop=should_stop)
 
 
 @handler_logging
@@ -0,0 +1,79 @@
+import base64
+import collections.abc
+
+from boto3.dynamodb.types import DYNAMODB_CONTEXT, Binary
+
+create_decimal = DYNAMODB_CONTEXT.create_decimal
+
+
+def deserialize(typed_value):
+    """
+    Convert a value in dynamo's typed json format to python, with the same result as boto3's TypeDeserializer.
+    Avoids TypeDeserializer's validation and per-value method lookups, as stream processing does a lot of this.
+    Unlike TypeDeserializer, accepts base64 encoded binary values.
+    """
+    # checked roughly in order of how common each type is in our stream records
+    for dynamo_type, value in typed_value.items():
+        if dynamo_type == 'S':
+            return value
+        if dynamo_type == 'N':
+            return create_decimal(value)
+        if dynamo_type == 'M':
+            return {k: deserialize(v) for k, v in value.items()}
+        if dynamo_type == 'L':
+            return [deserialize(v) for v in value]
+        if dynamo_type == 'BOOL':
+            return value
+        if dynamo_type == 'NULL':
+            return None
+        if dynamo_type == 'SS':
+            return set(value)
+        if dynamo_type == 'NS':
+            return set(map(create_decimal, value))
+        if dynamo_type == 'B':
+            return deserialize_binary(value)
+        if dynamo_type == 'BS':
+            return set(map(deserialize_binary, value))
+        raise TypeError(f'Dynamodb type `{dynamo_type}` is not supported')
+    raise TypeError('Value must be a dict with one dynamodb type as its key')
+
+
+def deserialize_binary(value):
+    # lambda delivers binary values in stream records base64 encoded
+    return Binary(base64.b64decode(value) if isinstance(value, str) else value)
+
+
+class LazyImage(collections.abc.Mapping):
+    "A read-only view of an image in a stream record that deserializes attributes when, and if, they are read"
+
+    def __init__(self, typed_item=None):
+        self.typed_item = typed_item or {}
+        self.deserialized = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.deserialized[name]
+        except KeyError:
+            value = self.deserialized[name] = deserialize(self.typed_item[name])
+            return value
+
+    def __contains__(self, name):
+        return name in self.typed_item
+
+    def get(self, key, default=None):
+        # avoids raising and catching a KeyError for each missing attribute, as Mapping.get() would
+        if key in self.deserialized:
+            return self.deserialized[key]
+        if key not in self.typed_item:
+            return default
+        return self[key]
+
+    def __iter__(self):
+        return iter(self.typed_item)
+
+    def __len__(self):
+        return len(self.typed_item)
+
+    def to_dict(self):
+        "Deserialize all the attributes into a new dict, re-using those already deserialized"
+        return {name: self[name] for name in self.typed_item}
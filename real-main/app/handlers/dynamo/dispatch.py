@@ -1,9 +1,21 @@
+import functools
+import json
 import logging
 from collections import defaultdict
 
+from .deserialize import LazyImage
+
 logger = logging.getLogger()
 
 
+def listener_name(handler):
+    "A readable name for a listener function, ex: `UserManager.sync_pinpoint_attribute('email', 'EMAIL')`"
+    if isinstance(handler, functools.partial):
+        args = ', '.join([*map(repr, handler.args), *(f'{k}={v!r}' for k, v in handler.keywords.items())])
+        return f'{listener_name(handler.func)}({args})'
+    return getattr(handler, '__qualname__', None) or repr(handler)
+
+
 class DynamoDispatch:
     """
     A dispatcher that holds and allows searching over a catalogue of listener functions
@@ -12,31 +24,169 @@ class DynamoDispatch:
 
     def __init__(self):
         self.listeners = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+        self.handlers = []
+        self.prerequisites = {}
+        self.coalesced = set()
+        self.deferring_counts = set()
+        self.index = {}
+        self.routes = None
 
-    def register(self, pk_prefix, sk_prefix, event_names, handler, attributes=None):
+    def register(
+        self,
+        pk_prefix,
+        sk_prefix,
+        event_names,
+        handler,
+        attributes=None,
+        after=None,
+        coalesce=False,
+        defer_counts=False,
+    ):
         """
         Register a handler.
 
         The `attributes` parameter, if provided, should be a dictionary of {name: default_value}.
         If `attributes` is present handler will only be called if at least one of the
         values of `attributes` have changed when applied to the old & new items.
+
+        The `after` parameter, if provided, should be a list of already-registered handlers.
+        When listeners of a record are run concurrently, the handler will not be started
+        until any of those handlers that were also triggered by the record have finished.
+
+        If `coalesce` is set, the handler is called at most once per item per batch of records,
+        with the first old item and the last new item of the batch. Meant for handlers that
+        sync something to the latest state of the item, not for those that apply increments or
+        decrements from the change, which could be applied twice should the handler be retried.
+
+        If `defer_counts` is set, the handler's increments and decrements of counters are summed
+        over the batch of records and written once the batch is processed. Only for handlers
+        that do not use the result of those changes.
         """
+        for prerequisite in after or []:
+            assert prerequisite in self.handlers, f'Handler `{listener_name(prerequisite)}` is not registered'
+        self.handlers.append(handler)
+        if after:
+            self.prerequisites[handler] = after
+        if coalesce:
+            self.coalesced.add(handler)
+        if defer_counts:
+            self.deferring_counts.add(handler)
         for event_name in event_names:
             self.listeners[pk_prefix][sk_prefix][event_name].append(
                 {'handler': handler, 'attributes': attributes}
             )
+        self.index.clear()
+        self.routes = None
+
+    def accepts(self, record):
+        """
+        Whether the stream record may have listeners, judged from its raw typed keys and event name alone,
+        so that records that can't are dropped before anything else is done with them.
+        """
+        keys = record['dynamodb']['Keys']
+        pk_prefix = keys['partitionKey']['S'].split('/', 1)[0]
+        sk_prefix = keys['sortKey']['S'].split('/', 1)[0]
+        return (pk_prefix, sk_prefix, record['eventName']) in self.get_routes()
+
+    def get_routes(self):
+        "The set of (pk prefix, sk prefix, event name) of records that may have listeners"
+        if self.routes is None:
+            self.routes = {
+                (pk_prefix, sk_prefix, event_name)
+                for pk_prefix, sk_prefix, event_names in self.generate_route_groups()
+                for event_name in event_names
+            }
+        return self.routes
+
+    def generate_route_groups(self):
+        "Generate a (pk prefix, sk prefix, event names) per pair of key prefixes with listeners registered"
+        for pk_prefix, sk_listeners in self.listeners.items():
+            for sk_prefix, event_listeners in sk_listeners.items():
+                handlers = {
+                    listener['handler'] for listeners in event_listeners.values() for listener in listeners
+                }
+                if handlers & self.coalesced:
+                    # coalescing an item's records needs all of them, whatever their event
+                    yield pk_prefix, sk_prefix, ('INSERT', 'MODIFY', 'REMOVE')
+                else:
+                    yield pk_prefix, sk_prefix, tuple(name for name, ls in event_listeners.items() if ls)
+
+    def filter_criteria(self):
+        """
+        Filter criteria for a lambda event source mapping that let through the records `accepts` does,
+        so the rest can be dropped before the function is even invoked. There's a filter per partition key
+        prefix and set of event names, note lambda limits the number of filters per event source mapping.
+        """
+        sk_prefixes = defaultdict(list)
+        for pk_prefix, sk_prefix, event_names in self.generate_route_groups():
+            if event_names:
+                sk_prefixes[(pk_prefix, tuple(sorted(event_names)))].append(sk_prefix)
+        filters = []
+        for (pk_prefix, event_names), prefixes in sorted(sk_prefixes.items()):
+            pattern = {
+                'eventName': list(event_names),
+                'dynamodb': {
+                    'Keys': {
+                        'partitionKey': {'S': [{'prefix': f'{pk_prefix}/'}]},
+                        # a sort key prefix matches the whole sort key or the sort key up to a slash
+                        'sortKey': {'S': [v for sk in sorted(prefixes) for v in (sk, {'prefix': f'{sk}/'})]},
+                    },
+                },
+            }
+            filters.append({'Pattern': json.dumps(pattern)})
+        return {'Filters': filters}
 
     def search(self, pk_prefix, sk_prefix, event_name, old_item, new_item):
-        "Returns a set of matching listener functions"
-        matches = []
-        for listener in self.listeners[pk_prefix][sk_prefix][event_name]:
+        "Returns a list of matching listener functions, in the order they were registered"
+        handlers, unconditional, conditional = self.get_index(pk_prefix, sk_prefix, event_name)
+
+        # compare each attribute once, no matter how many listeners are interested in it. Stream images
+        # are compared in their typed form first, as equal typed values need not be deserialized to compare
+        old_typed = old_item.typed_item if isinstance(old_item, LazyImage) else None
+        new_typed = new_item.typed_item if isinstance(new_item, LazyImage) else None
+        typed = old_typed is not None and new_typed is not None
+        matched = None
+        for attr_name, attr_default, positions in conditional:
+            if typed and old_typed.get(attr_name) == new_typed.get(attr_name):
+                continue
+            if old_item.get(attr_name, attr_default) != new_item.get(attr_name, attr_default):
+                if matched is None:
+                    matched = set(unconditional)
+                matched.update(positions)
+        if matched is None:
+            return [handlers[i] for i in unconditional]
+        return [handlers[i] for i in sorted(matched)]
+
+    def skipped(self, pk_prefix, sk_prefix, event_name, matches):
+        "Returns the listener functions registered for the event that are not among the `matches` of a search"
+        handlers = self.get_index(pk_prefix, sk_prefix, event_name)[0]
+        return [handler for handler in handlers if handler not in matches]
+
+    def get_index(self, pk_prefix, sk_prefix, event_name):
+        key = (pk_prefix, sk_prefix, event_name)
+        if key not in self.index:
+            self.index[key] = self.build_index(pk_prefix, sk_prefix, event_name)
+        return self.index[key]
+
+    def build_index(self, pk_prefix, sk_prefix, event_name):
+        """
+        Index the listeners for the given key prefixes and event as a tuple of:
+          - the handlers, in order of registration
+          - the positions of the handlers without attributes, which always match
+          - a list of (attribute name, default, [positions of handlers interested in that attribute & default])
+        """
+        listeners = self.listeners.get(pk_prefix, {}).get(sk_prefix, {}).get(event_name, [])
+        handlers, unconditional, conditional = [], [], []
+        for i, listener in enumerate(listeners):
+            handlers.append(listener['handler'])
             if not listener['attributes']:
-                matches.append(listener['handler'])
+                unconditional.append(i)
                 continue
             for attr_name, attr_default in listener['attributes'].items():
-                old_value = old_item.get(attr_name, attr_default)
-                new_value = new_item.get(attr_name, attr_default)
-                if old_value != new_value:
-                    matches.append(listener['handler'])
-                    break
-        return matches
+                for name, default, positions in conditional:
+                    if name == attr_name and default == attr_default:
+                        positions.append(i)
+                        break
+                else:
+                    conditional.append((attr_name, attr_default, [i]))
+        return handlers, unconditional, conditional
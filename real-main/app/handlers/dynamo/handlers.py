@@ -1,18 +1,27 @@
 import logging
 import os
 
-from boto3.dynamodb.types import TypeDeserializer
-
 from app import clients, models
 from app.handlers import xray
-from app.logging import LogLevelContext, handler_logging
+from app.logging import handler_logging
 from app.models.follower.enums import FollowStatus
 from app.models.user.enums import UserStatus
 
 from .dispatch import DynamoDispatch
+from .ledger import StreamLedger
+from .processor import DynamoStreamProcessor
+from .telemetry import ListenerTelemetry
 
 DYNAMO_FEED_TABLE = os.environ.get('DYNAMO_FEED_TABLE')
+DYNAMO_STREAM_MAX_WORKERS = int(os.environ.get('DYNAMO_STREAM_MAX_WORKERS') or 1)
+# lanes separated by commas, partition key prefixes of a lane by plus signs, ex: `user,post+comment`
+DYNAMO_STREAM_LANES = os.environ.get('DYNAMO_STREAM_LANES')
+DYNAMO_STREAM_MAX_RECORD_ATTEMPTS = int(os.environ.get('DYNAMO_STREAM_MAX_RECORD_ATTEMPTS') or 3)
+DYNAMO_STREAM_REPLAY_PATH = os.environ.get('DYNAMO_STREAM_REPLAY_PATH')
+DYNAMO_STREAM_TELEMETRY = os.environ.get('DYNAMO_STREAM_TELEMETRY')
+DYNAMO_STREAM_LEDGER_TABLE = os.environ.get('DYNAMO_STREAM_LEDGER_TABLE')
 S3_UPLOADS_BUCKET = os.environ.get('S3_UPLOADS_BUCKET')
+SQS_FEED_FAN_OUT_QUEUE_URL = os.environ.get('SQS_FEED_FAN_OUT_QUEUE_URL')
 
 logger = logging.getLogger()
 xray.patch_all()
@@ -22,9 +31,11 @@ clients = {
     'appsync': clients.AppSyncClient(),
     'dynamo': clients.DynamoClient(),
     'dynamo_feed': clients.DynamoClient(table_name=DYNAMO_FEED_TABLE),
+    'dynamo_stream_ledger': clients.DynamoClient(table_name=DYNAMO_STREAM_LEDGER_TABLE),
     'elasticsearch': clients.ElasticSearchClient(),
     'pinpoint': clients.PinpointClient(),
     's3_uploads': clients.S3Client(S3_UPLOADS_BUCKET),
+    'sqs_feed_fan_out': clients.SqsClient(SQS_FEED_FAN_OUT_QUEUE_URL),
 }
 
 managers = {}
@@ -39,13 +50,10 @@ follower_manager = managers.get('follower') or models.FollowerManager(clients, m
 post_manager = managers.get('post') or models.PostManager(clients, managers=managers)
 user_manager = managers.get('user') or models.UserManager(clients, managers=managers)
 
-# https://stackoverflow.com/a/46738251
-deserialize = TypeDeserializer().deserialize
-
 dispatch = DynamoDispatch()
 register = dispatch.register
 
-register('album', '-', ['INSERT'], user_manager.on_album_add_update_album_count)
+register('album', '-', ['INSERT'], user_manager.on_album_add_update_album_count, defer_counts=True)
 register('album', '-', ['INSERT', 'MODIFY'], album_manager.on_album_add_edit_sync_delete_at)
 register(
     'album',
@@ -56,21 +64,21 @@ register(
 )
 register('album', '-', ['REMOVE'], album_manager.on_album_delete_delete_album_art)
 register('album', '-', ['REMOVE'], post_manager.on_album_delete_remove_posts)
-register('album', '-', ['REMOVE'], user_manager.on_album_delete_update_album_count)
+register('album', '-', ['REMOVE'], user_manager.on_album_delete_update_album_count, defer_counts=True)
 # TODO: enable once receipt to auto-verify receipts upon upload
 # register('appStoreReceipt', '-', ['INSERT'], appstore_manager.on_receipt_add_verify)
 register('card', '-', ['INSERT'], card_manager.on_card_add)
-register('card', '-', ['INSERT'], user_manager.on_card_add_increment_count)
+register('card', '-', ['INSERT'], user_manager.on_card_add_increment_count, defer_counts=True)
 register('card', '-', ['MODIFY'], card_manager.on_card_edit)
 register('card', '-', ['REMOVE'], card_manager.on_card_delete)
-register('card', '-', ['REMOVE'], user_manager.on_card_delete_decrement_count)
+register('card', '-', ['REMOVE'], user_manager.on_card_delete_decrement_count, defer_counts=True)
 register('chat', '-', ['REMOVE'], chat_manager.on_chat_delete_delete_memberships)
 register('chat', '-', ['REMOVE'], chat_manager.on_item_delete_delete_flags)
 register('chat', '-', ['REMOVE'], chat_manager.on_item_delete_delete_views)
 register('chat', '-', ['REMOVE'], chat_message_manager.on_chat_delete_delete_messages)
 register('chat', 'flag', ['INSERT'], chat_manager.on_flag_add)
 register('chat', 'flag', ['REMOVE'], chat_manager.on_flag_delete)
-register('chat', 'member', ['INSERT'], user_manager.on_chat_member_add_update_chat_count)
+register('chat', 'member', ['INSERT'], user_manager.on_chat_member_add_update_chat_count, defer_counts=True)
 register(
     'chat',
     'member',
@@ -78,24 +86,25 @@ register(
     user_manager.sync_chats_with_unviewed_messages_count,
     {'messagesUnviewedCount': 0},
 )
-register('chat', 'member', ['REMOVE'], user_manager.on_chat_member_delete_update_chat_count)
+register('chat', 'member', ['REMOVE'], user_manager.on_chat_member_delete_update_chat_count, defer_counts=True)
 register('chat', 'view', ['INSERT', 'MODIFY'], chat_manager.sync_member_messages_unviewed_count, {'viewCount': 0})
+# counts not deferred, as chat views and message deletes write messagesUnviewedCount immediately
 register('chatMessage', '-', ['INSERT'], chat_manager.on_chat_message_add)
-register('chatMessage', '-', ['INSERT'], user_manager.sync_chat_message_creation_count)
+register('chatMessage', '-', ['INSERT'], user_manager.sync_chat_message_creation_count, defer_counts=True)
 register('chatMessage', '-', ['REMOVE'], chat_manager.on_chat_message_delete)
 register('chatMessage', '-', ['REMOVE'], chat_message_manager.on_item_delete_delete_flags)
-register('chatMessage', '-', ['REMOVE'], user_manager.sync_chat_message_deletion_count)
+register('chatMessage', '-', ['REMOVE'], user_manager.sync_chat_message_deletion_count, defer_counts=True)
 register('chatMessage', 'flag', ['INSERT'], chat_message_manager.on_flag_add)
 register('chatMessage', 'flag', ['REMOVE'], chat_message_manager.on_flag_delete)
 register('comment', '-', ['INSERT'], post_manager.on_comment_add)
-register('comment', '-', ['INSERT'], user_manager.on_comment_add)
+register('comment', '-', ['INSERT'], user_manager.on_comment_add, defer_counts=True)
 register(
     'comment', '-', ['INSERT', 'MODIFY'], card_manager.on_comment_text_tags_change_update_card, {'textTags': []},
 )
 register('comment', '-', ['REMOVE'], card_manager.on_comment_delete_delete_cards)
 register('comment', '-', ['REMOVE'], comment_manager.on_item_delete_delete_flags)
 register('comment', '-', ['REMOVE'], post_manager.on_comment_delete)
-register('comment', '-', ['REMOVE'], user_manager.on_comment_delete)
+register('comment', '-', ['REMOVE'], user_manager.on_comment_delete, defer_counts=True)
 register('comment', 'flag', ['INSERT'], comment_manager.on_flag_add)
 register('comment', 'flag', ['REMOVE'], comment_manager.on_flag_delete)
 register(
@@ -104,6 +113,7 @@ register(
     ['INSERT', 'MODIFY'],
     card_manager.on_post_comments_unviewed_count_change_update_card,
     {'commentsUnviewedCount': 0},
+    coalesce=True,
 )
 register(
     'post',
@@ -111,6 +121,7 @@ register(
     ['INSERT', 'MODIFY'],
     card_manager.on_post_likes_count_change_update_card,
     {'anonymousLikeCount': 0, 'onymousLikeCount': 0},
+    coalesce=True,
 )
 register(
     'post',
@@ -128,6 +139,7 @@ register(
     ['INSERT', 'MODIFY'],
     card_manager.on_post_viewed_by_count_change_update_card,
     {'viewedByCount': 0},
+    coalesce=True,
 )
 register(
     'post',
@@ -143,8 +155,22 @@ register(
     post_manager.on_post_verification_hidden_change_update_is_verified,
     {'verificationHidden': False},
 )
-register('post', '-', ['MODIFY'], post_manager.on_post_status_change_fire_gql_notifications, {'postStatus': None})
-register('post', '-', ['MODIFY'], user_manager.on_post_status_change_sync_counts, {'postStatus': None})
+register(
+    'post',
+    '-',
+    ['MODIFY'],
+    post_manager.on_post_status_change_fire_gql_notifications,
+    {'postStatus': None},
+    after=[feed_manager.on_post_status_change_sync_feed],  # clients refresh their feed upon POST_COMPLETED
+)
+register(
+    'post',
+    '-',
+    ['MODIFY'],
+    user_manager.on_post_status_change_sync_counts,
+    {'postStatus': None},
+    defer_counts=True,
+)
 register('post', '-', ['REMOVE'], card_manager.on_post_delete_delete_cards)
 register('post', '-', ['REMOVE'], post_manager.on_item_delete_delete_flags)
 register('post', '-', ['REMOVE'], post_manager.on_item_delete_delete_views)
@@ -157,8 +183,8 @@ register(
 )
 register('post', 'flag', ['INSERT'], post_manager.on_flag_add)
 register('post', 'flag', ['REMOVE'], post_manager.on_flag_delete)
-register('post', 'like', ['INSERT'], post_manager.on_like_add)
-register('post', 'like', ['REMOVE'], post_manager.on_like_delete)
+register('post', 'like', ['INSERT'], post_manager.on_like_add, defer_counts=True)
+register('post', 'like', ['REMOVE'], post_manager.on_like_delete, defer_counts=True)
 register(
     'post', 'view', ['INSERT', 'MODIFY'], card_manager.on_post_view_count_change_update_cards, {'viewCount': 0},
 )
@@ -178,6 +204,7 @@ register(
     ['INSERT', 'MODIFY'],
     card_manager.on_user_chats_with_unviewed_messages_count_change_sync_card,
     {'chatsWithUnviewedMessagesCount': 0},
+    coalesce=True,
 )
 register(
     'user',
@@ -185,6 +212,7 @@ register(
     ['INSERT', 'MODIFY'],
     card_manager.on_user_followers_requested_count_change_sync_card,
     {'followersRequestedCount': 0},
+    coalesce=True,
 )
 register(
     'user',
@@ -213,15 +241,26 @@ register(
     ['INSERT', 'MODIFY'],
     user_manager.fire_gql_subscription_chats_with_unviewed_messages_count,
     {'chatsWithUnviewedMessagesCount': 0},
+    coalesce=True,
+)
+register(
+    'user', 'profile', ['INSERT', 'MODIFY'], user_manager.sync_pinpoint_email, {'email': None}, coalesce=True
+)
+register(
+    'user',
+    'profile',
+    ['INSERT', 'MODIFY'],
+    user_manager.sync_pinpoint_phone,
+    {'phoneNumber': None},
+    coalesce=True,
 )
-register('user', 'profile', ['INSERT', 'MODIFY'], user_manager.sync_pinpoint_email, {'email': None})
-register('user', 'profile', ['INSERT', 'MODIFY'], user_manager.sync_pinpoint_phone, {'phoneNumber': None})
 register(
     'user',
     'profile',
     ['INSERT', 'MODIFY'],
     user_manager.sync_pinpoint_user_status,
     {'userStatus': UserStatus.ACTIVE},
+    coalesce=True,
 )
 register(
     'user',
@@ -229,6 +268,7 @@ register(
     ['INSERT', 'MODIFY'],
     user_manager.sync_elasticsearch,
     {'username': None, 'fullName': None, 'lastManuallyReindexedAt': None},
+    coalesce=True,
 )
 register(
     'user',
@@ -257,34 +297,26 @@ register(
     ['INSERT', 'MODIFY', 'REMOVE'],
     user_manager.sync_follow_counts_due_to_follow_status,
     {'followStatus': FollowStatus.NOT_FOLLOWING},
+    defer_counts=True,
 )
 register('user', 'profile', ['REMOVE'], appstore_manager.on_user_delete_delete_receipts)
 register('user', 'profile', ['REMOVE'], card_manager.on_user_delete_delete_cards)
 register('user', 'profile', ['REMOVE'], user_manager.on_user_delete)
 
 
-@handler_logging
-def process_records(event, context):
-    for record in event['Records']:
-
-        name = record['eventName']
-        pk = deserialize(record['dynamodb']['Keys']['partitionKey'])
-        sk = deserialize(record['dynamodb']['Keys']['sortKey'])
-        old_item = {k: deserialize(v) for k, v in record['dynamodb'].get('OldImage', {}).items()}
-        new_item = {k: deserialize(v) for k, v in record['dynamodb'].get('NewImage', {}).items()}
-
-        with LogLevelContext(logger, logging.INFO):
-            logger.info(f'{name}: `{pk}` / `{sk}` starting processing')
+processor = DynamoStreamProcessor(
+    dispatch,
+    [clients['dynamo'], clients['dynamo_feed']],
+    max_workers=DYNAMO_STREAM_MAX_WORKERS,
+    ledger=StreamLedger(clients['dynamo_stream_ledger']),
+    max_attempts=DYNAMO_STREAM_MAX_RECORD_ATTEMPTS,
+    replay_path=DYNAMO_STREAM_REPLAY_PATH,
+    telemetry=ListenerTelemetry() if DYNAMO_STREAM_TELEMETRY else None,
+    lanes=[lane.split('+') for lane in DYNAMO_STREAM_LANES.split(',')] if DYNAMO_STREAM_LANES else None,
+    appsync_client=clients['appsync'],
+)
 
-        # we still have some pks in an old (& deprecated) format with more than one item_id in the pk
-        pk_prefix, item_id = pk.split('/')[:2]
-        sk_prefix = sk.split('/')[0]
 
-        item_kwargs = {k: v for k, v in {'new_item': new_item, 'old_item': old_item}.items() if v}
-        for func in dispatch.search(pk_prefix, sk_prefix, name, old_item, new_item):
-            with LogLevelContext(logger, logging.INFO):
-                logger.info(f'{name}: `{pk}` / `{sk}` running: {func}')
-            try:
-                func(item_id, **item_kwargs)
-            except Exception as err:
-                logger.exception(str(err))
+@handler_logging
+def process_records(event, context):
+    return processor.process_records(event['Records'])
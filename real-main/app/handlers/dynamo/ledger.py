@@ -0,0 +1,58 @@
+import pendulum
+
+
+class StreamLedger:
+    """
+    Remembers which listeners are done with stream records, so that when records are delivered again, be it
+    after a failure or after the function timed out mid-batch, those listeners are not run again. Also counts
+    failed attempts to process each record.
+
+    Entries are keyed by the record's eventID, which stays the same when a record is retried. They expire
+    once the record can no longer be delivered again, as streams keep records for 24 hours. They belong in a
+    table other than the one whose stream is processed, so that writing them adds nothing to that stream.
+    """
+
+    def __init__(self, dynamo_client, ttl=pendulum.duration(days=2)):
+        self.client = dynamo_client
+        self.ttl = ttl
+
+    def pk(self, event_id):
+        return {'partitionKey': f'streamLedger/{event_id}', 'sortKey': '-'}
+
+    def expires_at_epoch(self):
+        return (pendulum.now('utc') + self.ttl).int_timestamp
+
+    def get_entries(self, event_ids):
+        "Returns a dict of {event_id: {'done': set of listener names, 'failedAttempts': int}}"
+        items = self.client.batch_get_items([self.pk(event_id) for event_id in event_ids])
+        return {
+            event_id: {
+                'done': set(item.get('doneListeners', [])),
+                'failedAttempts': int(item.get('failedAttempts', 0)),
+            }
+            for event_id, item in zip(event_ids, items)
+            if item
+        }
+
+    def mark_done(self, event_id, listener_names):
+        "Add to the listeners done with the record, as they are done rather than once the batch is"
+        self.client.add_to_set(
+            self.pk(event_id), 'doneListeners', listener_names, expiresAtEpoch=self.expires_at_epoch()
+        )
+
+    def put_entries(self, entries):
+        "Put entries of the same form as get_entries() returns, replacing any existing"
+        expires_at_epoch = self.expires_at_epoch()
+        self.client.batch_put_items(
+            {
+                **self.pk(event_id),
+                # dynamo has no empty sets
+                **({'doneListeners': set(entry['done'])} if entry['done'] else {}),
+                'failedAttempts': entry['failedAttempts'],
+                'expiresAtEpoch': expires_at_epoch,
+            }
+            for event_id, entry in entries.items()
+        )
+
+    def delete_entries(self, event_ids):
+        self.client.batch_delete(self.pk(event_id) for event_id in event_ids)
@@ -0,0 +1,315 @@
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import json
+import logging
+import time
+
+from app.logging import LogLevelContext
+
+from .deserialize import LazyImage, deserialize
+from .dispatch import listener_name
+
+logger = logging.getLogger()
+
+
+class DynamoStreamProcessor:
+    """
+    Processes batches of dynamo stream records by running the listeners the dispatch finds for each record.
+    Records the dispatch does not accept, as no listener could match them, are dropped unprocessed.
+
+    With `max_workers` of one, records and their listeners are processed one at a time, in order.
+    Otherwise records are processed concurrently, with two guarantees:
+      - records of the same item (same partitionKey) are processed in the order they appear in the batch,
+        and all of one record's listeners finish before any of the next record's start
+      - a listener registered to run `after` other listeners is not started until those have finished
+
+    With `lanes`, a list of tuples of partition key prefixes, records are instead routed by partition key
+    prefix to lanes, one for each tuple plus one for all other prefixes. The lanes each process their records
+    in order and run concurrently, so a slow record in one lane holds up none of the others. Listeners of a
+    record run concurrently only if `max_workers` is also more than one.
+
+    Changes to counters by listeners registered to `defer_counts` are written once all records are processed.
+    Listeners registered to `coalesce` are not run per record. Instead, once all of an item's records in the
+    batch are processed, they are run for a single record of the net change the batch made to the item.
+
+    Records with a listener that raised an exception are reported as failed, so lambda delivers them again.
+    So that listeners that succeeded are not run again, the `ledger`, if given, marks them done with each
+    record as soon as the record's listeners have run, or for listeners that defer counts, once the counts
+    are written. A record that fails `max_attempts` times is given up on: it is logged, and appended to the
+    file at `replay_path` if set, from where it can be replayed once fixed.
+
+    If `telemetry` is given, per-listener stats are recorded to it and emitted once per batch.
+    """
+
+    def __init__(
+        self,
+        dispatch,
+        dynamo_clients,
+        max_workers=1,
+        ledger=None,
+        max_attempts=3,
+        replay_path=None,
+        telemetry=None,
+        lanes=None,
+        appsync_client=None,
+    ):
+        """
+        Usage of all the `dynamo_clients` is tracked, the first also gets item caches and deferred counts.
+        Notifications fired through `appsync_client`, if set, are batched and sent once the records are processed.
+        """
+        self.dispatch = dispatch
+        self.dynamo_clients = dynamo_clients
+        self.max_workers = max_workers
+        self.ledger = ledger
+        self.max_attempts = max_attempts
+        self.replay_path = replay_path
+        self.telemetry = telemetry
+        self.lanes = {pk_prefix: i for i, pk_prefixes in enumerate(lanes or []) for pk_prefix in pk_prefixes}
+        self.appsync_client = appsync_client
+
+    def process_records(self, records):
+        "Process a batch of records, returning a response for lambda that reports those that failed"
+        event_ids = [record['eventID'] for record in records if 'eventID' in record]
+        entries = self.ledger.get_entries(event_ids) if self.ledger and event_ids else {}
+        # {eventID: {listener name: succeeded}}, for listeners run in this attempt to process the batch
+        outcomes = collections.defaultdict(dict)
+        try:
+            # most records, ex: trending items, have no listeners. Those are dropped before their keys or
+            # images are deserialized, though they are still settled, to clear any ledger entries of them
+            self.run_records([record for record in records if self.dispatch.accepts(record)], entries, outcomes)
+            return {'batchItemFailures': self.settle_records(records, entries, outcomes)}
+        finally:
+            if self.telemetry:
+                self.telemetry.emit()
+
+    def run_records(self, records, entries, outcomes):
+        counter_deltas, notifications = {}, {}
+        with contextlib.ExitStack() as stack:
+            for client in self.dynamo_clients:
+                stack.enter_context(client.usage_tracking())
+            if self.appsync_client:
+                # many records of a batch tend to notify the same users, ex: of changes to their feeds
+                stack.callback(self.flush_notifications, notifications)
+            try:
+                with contextlib.ExitStack() as batch_stack:
+                    batch_stack.enter_context(self.dynamo_clients[0].counter_deltas(counter_deltas))
+                    if self.appsync_client:
+                        batch_stack.enter_context(self.appsync_client.notification_batch(notifications))
+                    if self.lanes or self.max_workers > 1:
+                        self.process_records_concurrently(records, entries, outcomes)
+                    else:
+                        self.process_item_records(records, entries, outcomes)
+            finally:
+                # many records of a batch tend to change the same counters, ex: likes of a popular post
+                self.dynamo_clients[0].flush_counts(counter_deltas)
+
+    def flush_notifications(self, notifications):
+        # the listeners that fired them are already done, so there's nothing to retry
+        try:
+            self.appsync_client.flush_notifications(notifications)
+        except Exception as err:
+            logger.exception(str(err))
+
+    def process_records_concurrently(self, records, entries, outcomes):
+        grouped_records = collections.defaultdict(list)
+        for record in records:
+            grouped_records[self.group_key(record)].append(record)
+        if not grouped_records:
+            return
+
+        with contextlib.ExitStack() as stack:
+            # listeners get their own executor, so records waiting on their listeners can't starve them of workers
+            listener_executor = None
+            if self.max_workers > 1:
+                listener_executor = stack.enter_context(
+                    concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+                )
+            # each lane gets a worker of its own
+            record_executor = stack.enter_context(
+                concurrent.futures.ThreadPoolExecutor(
+                    max_workers=len(grouped_records) if self.lanes else self.max_workers
+                )
+            )
+            futures = [
+                record_executor.submit(
+                    contextvars.copy_context().run,
+                    self.process_item_records,
+                    group_records,
+                    entries,
+                    outcomes,
+                    listener_executor=listener_executor,
+                )
+                for group_records in grouped_records.values()
+            ]
+            for future in futures:
+                future.result()  # raise any error, as would processing serially
+
+    def group_key(self, record):
+        "Records of a group are processed in order, so all those of an item must be in the same group"
+        pk = record['dynamodb']['Keys']['partitionKey']['S']
+        if not self.lanes:
+            return pk
+        return self.lanes.get(pk.split('/', 1)[0], len(self.lanes))
+
+    def process_item_records(self, records, entries, outcomes, listener_executor=None):
+        for record in [*records, *self.coalesced_records(records)]:
+            event_id = record.get('eventID')
+            done = entries[event_id]['done'] if event_id in entries else ()
+            outcome = self.process_record(
+                record, listener_executor=listener_executor, coalesced='coalesced' in record, done=done
+            )
+            outcomes[event_id].update(outcome)
+
+    def coalesced_records(self, records):
+        "Generate a record per item with the first old image and the last new image of the item's `records`"
+        if not self.dispatch.coalesced:
+            return
+        first_records, last_records = {}, {}
+        for record in records:
+            keys = record['dynamodb']['Keys']
+            key = (keys['partitionKey']['S'], keys['sortKey']['S'])
+            first_records.setdefault(key, record)
+            last_records[key] = record
+        for key, first_record in first_records.items():
+            dynamodb = {k: v for k, v in first_record['dynamodb'].items() if k != 'NewImage'}
+            if 'NewImage' in last_records[key]['dynamodb']:
+                dynamodb['NewImage'] = last_records[key]['dynamodb']['NewImage']
+            if 'OldImage' in dynamodb:
+                event_name = 'MODIFY' if 'NewImage' in dynamodb else 'REMOVE'
+            elif 'NewImage' in dynamodb:
+                event_name = 'INSERT'
+            else:
+                continue  # item was added and deleted within the batch
+            # outcomes of coalesced listeners are accounted to the first of the item's records, so should
+            # one fail, lambda delivers again all the records the listener's change was coalesced from
+            yield {**first_record, 'eventName': event_name, 'dynamodb': dynamodb, 'coalesced': True}
+
+    def settle_records(self, records, entries, outcomes):
+        "Update the ledger with the `outcomes` of processing `records` and return those to report as failed"
+        failures, put_entries, delete_event_ids = [], {}, []
+        redelivered = False
+        for record in records:
+            event_id = record.get('eventID')
+            if event_id is None:
+                continue
+            entry = entries.get(event_id, {'done': set(), 'failedAttempts': 0})
+            outcome = outcomes.get(event_id, {})
+            done = entry['done'] | {name for name, succeeded in outcome.items() if succeeded}
+            failed = sorted(name for name, succeeded in outcome.items() if not succeeded)
+            failed_attempts = entry['failedAttempts'] + (1 if failed else 0)
+            given_up = bool(failed) and failed_attempts >= self.max_attempts
+            if given_up:
+                self.give_up_on_record(record, failed)
+                done |= set(failed)  # not to be retried either, should the record be delivered again
+            elif failed:
+                failures.append({'itemIdentifier': record['dynamodb']['SequenceNumber']})
+                # lambda delivers again all the batch's records from the first failed one onwards
+                redelivered = True
+            if not self.ledger:
+                continue
+            if redelivered and (done or failed_attempts):
+                # also marks done the listeners that defer counts, now their counts are written
+                put_entries[event_id] = {'done': done, 'failedAttempts': failed_attempts}
+            elif given_up:
+                # entries are otherwise left to expire, but this one would stop the record being replayed
+                delete_event_ids.append(event_id)
+        if put_entries:
+            self.ledger.put_entries(put_entries)
+        if delete_event_ids:
+            self.ledger.delete_entries(delete_event_ids)
+        return failures
+
+    def give_up_on_record(self, record, failed_listener_names):
+        failed_names = ', '.join(failed_listener_names)
+        logger.error(
+            f'Giving up on stream record `{record["eventID"]}` after {self.max_attempts} failed attempts by: '
+            f'{failed_names}',
+            extra={'stream_record': record},
+        )
+        if self.replay_path:
+            with open(self.replay_path, 'a', encoding='utf-8') as fh:
+                fh.write(json.dumps(record) + '\n')
+
+    def process_record(self, record, listener_executor=None, coalesced=False, done=()):
+        "Run the record's listeners, except those `done` already. Returns a dict of {listener name: succeeded}"
+        name = record['eventName']
+        pk = deserialize(record['dynamodb']['Keys']['partitionKey'])
+        sk = deserialize(record['dynamodb']['Keys']['sortKey'])
+        # images are only deserialized as far as needed to decide which listeners to run, if any
+        old_image = LazyImage(record['dynamodb'].get('OldImage'))
+        new_image = LazyImage(record['dynamodb'].get('NewImage'))
+
+        log_prefix = f'{name}: `{pk}` / `{sk}`' + (' (coalesced)' if coalesced else '')
+        with LogLevelContext(logger, logging.INFO):
+            logger.info(f'{log_prefix} starting processing')
+
+        # we still have some pks in an old (& deprecated) format with more than one item_id in the pk
+        pk_prefix, item_id = pk.split('/')[:2]
+        sk_prefix = sk.split('/')[0]
+
+        funcs = self.dispatch.search(pk_prefix, sk_prefix, name, old_image, new_image)
+        skipped = self.dispatch.skipped(pk_prefix, sk_prefix, name, funcs) if self.telemetry else []
+        if self.dispatch.coalesced:
+            funcs = [func for func in funcs if (func in self.dispatch.coalesced) == coalesced]
+            skipped = [func for func in skipped if (func in self.dispatch.coalesced) == coalesced]
+        if skipped:
+            self.telemetry.record_skips(map(listener_name, skipped))
+        names = {func: listener_name(func) for func in funcs}
+        if done:
+            funcs = [func for func in funcs if names[func] not in done]
+        if not funcs:
+            return {}
+
+        item_kwargs = {k: v.to_dict() for k, v in {'new_item': new_image, 'old_item': old_image}.items() if v}
+        # listeners of the same record tend to read the same items, let them share those reads
+        with self.dynamo_clients[0].item_cache():
+            if listener_executor is None:
+                succeeded = {func: self.run_listener(func, item_id, item_kwargs, log_prefix) for func in funcs}
+            else:
+                # listeners run in copies of this context, and so share the item cache
+                futures = {}
+                for func in funcs:
+                    prerequisites = [
+                        futures[f] for f in self.dispatch.prerequisites.get(func, []) if f in futures
+                    ]
+                    futures[func] = listener_executor.submit(
+                        contextvars.copy_context().run,
+                        self.run_listener,
+                        func,
+                        item_id,
+                        item_kwargs,
+                        log_prefix,
+                        prerequisites=prerequisites,
+                    )
+                succeeded = {func: future.result() for func, future in futures.items()}
+
+        # the counts of those that defer them are not written yet, those are marked done when settling
+        done = [names[func] for func in funcs if succeeded[func] and func not in self.dispatch.deferring_counts]
+        if self.ledger and done and 'eventID' in record:
+            self.ledger.mark_done(record['eventID'], done)
+        return {names[func]: succeeded[func] for func in funcs}
+
+    def run_listener(self, func, item_id, item_kwargs, log_prefix, prerequisites=()):
+        "Returns True if the listener succeeded, False if it raised an exception"
+        # prerequisites were submitted before us, so they are already running or will be started first
+        concurrent.futures.wait(prerequisites)
+        with LogLevelContext(logger, logging.INFO):
+            logger.info(f'{log_prefix} running: {func}')
+        label = listener_name(func)
+        start = time.perf_counter()
+        succeeded = True
+        try:
+            with contextlib.ExitStack() as stack:
+                for client in self.dynamo_clients:
+                    stack.enter_context(client.usage_label(label))
+                if func not in self.dispatch.deferring_counts:
+                    stack.enter_context(self.dynamo_clients[0].counter_deltas(None))
+                func(item_id, **item_kwargs)
+        except Exception as err:
+            logger.exception(str(err))
+            succeeded = False
+        if self.telemetry:
+            self.telemetry.record_invocation(label, time.perf_counter() - start, failed=not succeeded)
+        return succeeded
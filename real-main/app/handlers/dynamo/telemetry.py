@@ -0,0 +1,68 @@
+import collections
+import logging
+import os
+import threading
+
+from app.logging import log_metrics
+
+logger = logging.getLogger()
+
+# upper bounds, in milliseconds, of the buckets of the histogram of listener wall times
+DURATION_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class ListenerTelemetry:
+    """
+    Per-listener counts of invocations, of skips because none of the listener's attributes changed and of
+    exceptions, plus a histogram of wall times. Safe to record from concurrent threads.
+    """
+
+    namespace = 'DynamoStream'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def listener_stats(self, name):
+        # called with the lock held
+        if name not in self.stats:
+            self.stats[name] = {
+                'invocations': 0,
+                'skips': 0,
+                'exceptions': 0,
+                'seconds': 0,
+                'maxSeconds': 0,
+                'histogram': collections.Counter(),
+            }
+        return self.stats[name]
+
+    def record_skips(self, names):
+        with self.lock:
+            for name in names:
+                self.listener_stats(name)['skips'] += 1
+
+    def record_invocation(self, name, seconds, failed=False):
+        bucket = next((ms for ms in DURATION_BUCKETS_MS if seconds * 1000 <= ms), None)
+        with self.lock:
+            stats = self.listener_stats(name)
+            stats['invocations'] += 1
+            stats['exceptions'] += 1 if failed else 0
+            stats['seconds'] += seconds
+            stats['maxSeconds'] = max(stats['maxSeconds'], seconds)
+            stats['histogram'][f'<={bucket}ms' if bucket else f'>{DURATION_BUCKETS_MS[-1]}ms'] += 1
+
+    def emit(self):
+        "Log the stats, one embedded metric format record per listener, and reset them"
+        with self.lock:
+            stats, self.stats = self.stats, {}
+        dimensions = {'FunctionName': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')}
+        for name, listener_stats in sorted(stats.items()):
+            metrics = {
+                'Invocations': (listener_stats['invocations'], 'Count'),
+                'Skips': (listener_stats['skips'], 'Count'),
+                'Exceptions': (listener_stats['exceptions'], 'Count'),
+                'Duration': (round(listener_stats['seconds'] * 1000, 3), 'Milliseconds'),
+                'MaxDuration': (round(listener_stats['maxSeconds'] * 1000, 3), 'Milliseconds'),
+            }
+            properties = {'DurationHistogram': dict(listener_stats['histogram'])}
+            log_metrics(logger, self.namespace, {**dimensions, 'Listener': name}, metrics, properties)
@@ -66,7 +66,9 @@ def image_post_uploaded(event, context):
         return
 
     try:
-        post.process_image_upload()
+        # processing writes the post and then reads it back
+        with clients['dynamo'].item_cache():
+            post.process_image_upload()
     except Exception as err:
         post.error(str(err))
         if not isinstance(err, PostException):
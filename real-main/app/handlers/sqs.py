@@ -0,0 +1,35 @@
+import json
+import logging
+import os
+
+from app import clients, models
+from app.logging import handler_logging
+
+from . import xray
+
+DYNAMO_FEED_TABLE = os.environ.get('DYNAMO_FEED_TABLE')
+SQS_FEED_FAN_OUT_QUEUE_URL = os.environ.get('SQS_FEED_FAN_OUT_QUEUE_URL')
+
+logger = logging.getLogger()
+xray.patch_all()
+
+clients = {
+    'appsync': clients.AppSyncClient(),
+    'dynamo': clients.DynamoClient(),
+    'dynamo_feed': clients.DynamoClient(table_name=DYNAMO_FEED_TABLE),
+    'sqs_feed_fan_out': clients.SqsClient(SQS_FEED_FAN_OUT_QUEUE_URL),
+}
+
+managers = {}
+feed_manager = managers.get('feed') or models.FeedManager(clients, managers=managers)
+
+
+@handler_logging
+def feed_fan_out(event, context):
+    # an exception fails the whole batch, which sqs then delivers again. The function is subscribed to the
+    # queue with a batch size of one, and processing a job more than once is harmless.
+    notifications = {}
+    with clients['appsync'].notification_batch(notifications):
+        for record in event['Records']:
+            feed_manager.process_fan_out_job(json.loads(record['body']))
+    clients['appsync'].flush_notifications(notifications)
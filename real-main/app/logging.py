@@ -1,5 +1,7 @@
 import json
 import logging
+import threading
+import time
 
 
 def handler_logging(func):
@@ -30,25 +32,71 @@ def handler_logging(func):
 
 # https://docs.python.org/3/howto/logging-cookbook.html#using-a-context-manager-for-selective-logging
 class LogLevelContext:
+    """
+    Safe to use from concurrent threads: the logger's original level is restored when the last of any
+    overlapping contexts exits, rather than each restoring whatever level it happened to see on entry.
+    """
+
+    lock = threading.Lock()
+    active = {}  # logger name: [count of active contexts, original level]
+
     def __init__(self, logger, level):
         self.logger = logger
         self.level = level
 
     def __enter__(self):
-        self.old_level = self.logger.level
-        self.logger.setLevel(self.level)
+        with self.lock:
+            active = self.active.setdefault(self.logger.name, [0, self.logger.level])
+            active[0] += 1
+            self.logger.setLevel(self.level)
 
     def __exit__(self, et, ev, tb):
-        self.logger.setLevel(self.old_level)
+        with self.lock:
+            active = self.active[self.logger.name]
+            active[0] -= 1
+            if active[0] == 0:
+                self.logger.setLevel(active[1])
+                del self.active[self.logger.name]
+
+
+def log_metrics(logger, namespace, dimensions, metrics, properties=None):
+    """
+    Log metrics in CloudWatch's embedded metric format, from which CloudWatch extracts them as custom metrics.
+    https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+
+    `dimensions` should be a dict of {name: value}, `metrics` a dict of {name: (value, unit)}, and
+    `properties` a dict of other values to include, which are searchable but not extracted as metrics.
+    """
+    document = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [
+                {
+                    'Namespace': namespace,
+                    'Dimensions': [list(dimensions)],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in metrics.items()],
+                }
+            ],
+        },
+        **dimensions,
+        **{name: value for name, (value, _) in metrics.items()},
+        **(properties or {}),
+    }
+    with LogLevelContext(logger, logging.INFO):
+        logger.info(f'Metrics of {namespace}', extra={'emf': document})
 
 
 # https://github.com/python/cpython/blob/v3.8.3/Lib/logging/__init__.py#L510
 class CloudWatchFormatter(logging.Formatter):
     "Format logging records so they json and readable in CloudWatch"
 
-    extras = ('client', 'event', 'gql', 's3_key')
+    extras = ('client', 'dynamo_usage', 'event', 'gql', 's3_key', 'stream_record')
 
     def format(self, record):
+        # the embedded metric format requires the log record to be nothing but the json document
+        if hasattr(record, 'emf'):
+            return json.dumps(record.emf)
+
         # clear away the lamba path prefix
         prefix = '/var/task/'
         start = len(prefix) if record.pathname.startswith(prefix) else 0
@@ -15,6 +15,9 @@ class TrendingManagerMixin:
     min_count_to_keep = 10 * 1000
     min_score_to_keep = 0.5
 
+    # leave write capacity for interactive traffic while deflating
+    deflate_max_writes_per_second = 100
+
     def __init__(self, clients, managers=None):
         super().__init__(clients, managers=managers)
         if 'dynamo' in clients:
@@ -28,10 +31,11 @@ class TrendingManagerMixin:
         now = now or pendulum.now('utc')
         # iterates from lowest score upward, deflate and count each one
         total_count, deflated_count = 0, 0
-        for item in self.trending_dynamo.generate_items():
-            deflated = self.trending_deflate_item(item, now=now)
-            deflated_count += int(deflated)
-            total_count += 1
+        with self.trending_dynamo.client.write_rate_limit(self.deflate_max_writes_per_second, self.item_type):
+            for item in self.trending_dynamo.generate_items():
+                deflated = self.trending_deflate_item(item, now=now)
+                deflated_count += int(deflated)
+                total_count += 1
         return total_count, deflated_count
 
     def trending_deflate_item(self, trending_item, now=None, retry_count=0):
@@ -120,7 +120,7 @@ class Album:
         if new_art_hash == old_art_hash:
             return self  # no changes
 
-        posts = [self.post_manager.get_post(post_id) for post_id in post_ids]
+        posts = [self.post_manager.init_post(item) for item in self.post_manager.dynamo.get_posts(post_ids)]
         if len(posts) == 0:
             new_native_image = None
         elif len(posts) == 1:
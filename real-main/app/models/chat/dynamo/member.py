@@ -87,7 +87,8 @@ class ChatMemberDynamo:
             ),
             'IndexName': 'GSI-K1',
         }
-        return map(lambda item: item['sortKey'][len('member/') :], self.client.generate_all_query(query_kwargs))
+        gen = self.client.generate_all_query(query_kwargs, keys_only=True)
+        return map(lambda item: item['sortKey'][len('member/') :], gen)
 
     def generate_chat_ids_by_user(self, user_id):
         query_kwargs = {
@@ -96,6 +97,5 @@ class ChatMemberDynamo:
             ),
             'IndexName': 'GSI-K2',
         }
-        return map(
-            lambda item: item['partitionKey'][len('chat/') :], self.client.generate_all_query(query_kwargs)
-        )
+        gen = self.client.generate_all_query(query_kwargs, keys_only=True)
+        return map(lambda item: item['partitionKey'][len('chat/') :], gen)
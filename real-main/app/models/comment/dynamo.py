@@ -54,16 +54,16 @@ class CommentDynamo:
     def decrement_flag_count(self, comment_id):
         return self.client.decrement_count(self.pk(comment_id), 'flagCount')
 
-    def generate_by_post(self, post_id):
+    def generate_by_post(self, post_id, fields=None):
         query_kwargs = {
             'KeyConditionExpression': Key('gsiA1PartitionKey').eq(f'comment/{post_id}'),
             'IndexName': 'GSI-A1',
         }
-        return self.client.generate_all_query(query_kwargs)
+        return self.client.generate_all_query(query_kwargs, fields=fields)
 
-    def generate_by_user(self, user_id):
+    def generate_by_user(self, user_id, fields=None):
         query_kwargs = {
             'KeyConditionExpression': Key('gsiA2PartitionKey').eq(f'comment/{user_id}'),
             'IndexName': 'GSI-A2',
         }
-        return self.client.generate_all_query(query_kwargs)
+        return self.client.generate_all_query(query_kwargs, fields=fields)
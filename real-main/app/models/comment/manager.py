@@ -18,6 +18,8 @@ logger = logging.getLogger()
 class CommentManager(FlagManagerMixin, ManagerBase):
 
     item_type = 'comment'
+    # the attributes a comment needs to be initialized & deleted
+    delete_fields = ['commentId', 'userId', 'postId', 'commentedAt']
 
     def __init__(self, clients, managers=None):
         super().__init__(clients, managers=managers)
@@ -80,11 +82,11 @@ class CommentManager(FlagManagerMixin, ManagerBase):
         return self.init_comment(comment_item)
 
     def delete_all_by_user(self, user_id):
-        for comment_item in self.dynamo.generate_by_user(user_id):
+        for comment_item in self.dynamo.generate_by_user(user_id, fields=self.delete_fields):
             self.init_comment(comment_item).delete()
 
     def delete_all_on_post(self, post_id):
-        for comment_item in self.dynamo.generate_by_post(post_id):
+        for comment_item in self.dynamo.generate_by_post(post_id, fields=self.delete_fields):
             self.init_comment(comment_item).delete()
 
     def on_flag_add(self, comment_id, new_item):
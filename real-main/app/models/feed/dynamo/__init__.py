@@ -0,0 +1,5 @@
+__all__ = ['FeedBackfillGapsDynamo', 'FeedDynamo', 'FeedPulledAuthorsDynamo']
+
+from .backfill_gaps import FeedBackfillGapsDynamo
+from .base import FeedDynamo
+from .pulled_authors import FeedPulledAuthorsDynamo
@@ -0,0 +1,43 @@
+from boto3.dynamodb.conditions import Key
+
+
+class FeedBackfillGapsDynamo:
+    """
+    Where the backfill of a followed user's posts into a feed stopped, their posts posted before then being
+    added to the feed only once it's read that far.
+    """
+
+    def __init__(self, dynamo_client):
+        self.client = dynamo_client
+
+    def pk(self, feed_user_id, posted_by_user_id):
+        return {'partitionKey': f'feed/{feed_user_id}', 'sortKey': f'backfillGap/{posted_by_user_id}'}
+
+    def get_gaps(self, feed_user_id):
+        "Return a dict of {posted_by_user_id: posted_at} of the posts the feed lacks, those posted before posted_at"
+        query_kwargs = {
+            'KeyConditionExpression': (
+                Key('partitionKey').eq(f'feed/{feed_user_id}') & Key('sortKey').begins_with('backfillGap/')
+            ),
+        }
+        items = self.client.generate_all_query(query_kwargs)
+        return {item['postedByUserId']: item['postedAt'] for item in items}
+
+    def set_gap(self, feed_user_id, posted_by_user_id, posted_at):
+        pk = self.pk(feed_user_id, posted_by_user_id)
+        self.client.set_attributes(pk, postedByUserId=posted_by_user_id, postedAt=posted_at)
+
+    def delete_gap(self, feed_user_id, posted_by_user_id):
+        self.client.delete_item(self.pk(feed_user_id, posted_by_user_id))
+
+    def update_gaps(self, feed_user_id, gaps):
+        "Apply a dict of {posted_by_user_id: posted_at} in one batch, setting those gaps, or deleting those set to None"
+        write_requests = []
+        for posted_by_user_id, posted_at in gaps.items():
+            pk = self.pk(feed_user_id, posted_by_user_id)
+            if posted_at:
+                item = {**pk, 'postedByUserId': posted_by_user_id, 'postedAt': posted_at}
+                write_requests.append((pk, {'PutRequest': {'Item': self.client.serialize_item(item)}}))
+            else:
+                write_requests.append((pk, {'DeleteRequest': {'Key': self.client.serialize_item(pk)}}))
+        self.client.batch_write(iter(write_requests))
@@ -0,0 +1,116 @@
+import functools
+import itertools
+import logging
+
+import pendulum
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger()
+
+
+class FeedDynamo:
+    def __init__(self, dynamo_feed_client, ttl=None):
+        self.feed_client = dynamo_feed_client
+        self.ttl = ttl
+
+    def item(self, feed_user_id, post_item):
+        item = {
+            'postId': post_item['postId'],
+            'postedByUserId': post_item['postedByUserId'],
+            'postedAt': post_item['postedAt'],
+            'feedUserId': feed_user_id,
+        }
+        if self.ttl:
+            item['expiresAtEpoch'] = (pendulum.parse(post_item['postedAt']) + self.ttl).int_timestamp
+        return item
+
+    def is_expired(self, post_item):
+        "Whether a feed item of the post would have expired already, ex: that of an old post being backfilled"
+        return bool(self.ttl) and pendulum.parse(post_item['postedAt']) + self.ttl <= pendulum.now('utc')
+
+    def add_posts_to_feed(self, feed_user_id, post_item_generator):
+        "Add the posts to the feed, other than those whose feed items would have expired already"
+        item_generator = (
+            self.item(feed_user_id, post_item)
+            for post_item in post_item_generator
+            if not self.is_expired(post_item)
+        )
+        self.feed_client.batch_put_items(item_generator)
+
+    def add_post_to_feeds(self, feed_user_id_generator, post_item):
+        """
+        Add the post to all the feeds of the generated user_ids, unless its feed items would have expired already.
+        Return a list of those user_ids.
+        """
+        feed_user_ids = list(feed_user_id_generator)
+        if not self.is_expired(post_item):
+            item_generator = (self.item(feed_user_id, post_item) for feed_user_id in feed_user_ids)
+            self.feed_client.batch_put_items(item_generator)
+        return feed_user_ids
+
+    def delete_by_post_owner(self, feed_user_id, post_user_id):
+        "Delete all feed items by `posted_by_user_id` from the feed of `feed_user_id`"
+        key_generator = self.generate_keys_by_posted_by_user(feed_user_id, post_user_id)
+        self.feed_client.batch_delete(key_generator)
+
+    def generate_items(self, feed_user_id):
+        query_kwargs = {
+            'KeyConditionExpression': 'feedUserId = :fuid',
+            'ExpressionAttributeValues': {':fuid': feed_user_id},
+            'IndexName': 'GSI-A1',
+        }
+        return self.feed_client.generate_all_query(query_kwargs)
+
+    def generate_recent_items(self, feed_user_id, before_posted_at=None, before_post_id=None, page_size=None):
+        """
+        Generate the items of the feed, most recently posted first. If `before_posted_at` is set, only those
+        posted before then, or posted at the same time with a post id before `before_post_id`.
+        """
+        key_conditions = [Key('feedUserId').eq(feed_user_id)]
+        if before_posted_at:
+            key_conditions.append(Key('postedAt').lte(before_posted_at))
+        query_kwargs = {
+            'KeyConditionExpression': functools.reduce(lambda a, b: a & b, key_conditions),
+            'IndexName': 'GSI-A1',
+            'ScanIndexForward': False,
+        }
+        if page_size:
+            query_kwargs['Limit'] = page_size
+        items = self.feed_client.generate_all_query(query_kwargs)
+        before = (before_posted_at, before_post_id or '')
+        return (item for item in items if not before_posted_at or (item['postedAt'], item['postId']) < before)
+
+    def trim(self, feed_user_id, max_items):
+        "Delete all but the `max_items` most recently posted items of the feed"
+        query_kwargs = {
+            'KeyConditionExpression': Key('feedUserId').eq(feed_user_id),
+            'IndexName': 'GSI-A1',
+            'ScanIndexForward': False,
+        }
+        keys = self.feed_client.generate_all_query(query_kwargs, keys_only=True)
+        self.feed_client.batch_delete(itertools.islice(keys, max_items, None))
+
+    def generate_keys_by_post(self, post_id):
+        query_kwargs = {
+            'KeyConditionExpression': 'postId = :pid',
+            'ExpressionAttributeValues': {':pid': post_id},
+            'ProjectionExpression': 'postId, feedUserId',
+        }
+        return self.feed_client.generate_all_query(query_kwargs)
+
+    def query_keys_by_post(self, post_id, limit, next_token=None):
+        "Return a page of up to `limit` keys of feed items of `post_id`, and the token for the next page"
+        query_kwargs = {
+            'KeyConditionExpression': Key('postId').eq(post_id),
+            'ProjectionExpression': 'postId, feedUserId',
+        }
+        return self.feed_client.query(query_kwargs, limit=limit, next_token=next_token)
+
+    def generate_keys_by_posted_by_user(self, feed_user_id, posted_by_user_id):
+        query_kwargs = {
+            'KeyConditionExpression': 'feedUserId = :fuid AND postedByUserId = :pbuid',
+            'ExpressionAttributeValues': {':fuid': feed_user_id, ':pbuid': posted_by_user_id},
+            'IndexName': 'GSI-A2',
+            'ProjectionExpression': 'postId, feedUserId',
+        }
+        return self.feed_client.generate_all_query(query_kwargs)
@@ -0,0 +1,15 @@
+class FeedPulledAuthorsDynamo:
+    "The users whose posts are pulled into their followers' feeds as those are read, rather than pushed to them"
+
+    def __init__(self, dynamo_client):
+        self.client = dynamo_client
+
+    def pk(self):
+        return {'partitionKey': 'feed/pulledAuthors', 'sortKey': '-'}
+
+    def get_user_ids(self):
+        item = self.client.get_item(self.pk())
+        return (item or {}).get('userIds', set())
+
+    def add_user_id(self, user_id):
+        self.client.add_to_set(self.pk(), 'userIds', [user_id])
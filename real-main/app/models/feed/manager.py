@@ -1,54 +1,337 @@
+import functools
 import itertools
 import logging
+import os
+import random
+
+import pendulum
 
 from app import models
 from app.models.follower.enums import FollowStatus
 from app.models.post.enums import PostStatus
-from app.utils import GqlNotificationType
+from app.utils import GqlNotificationType, gather
+
+from .dynamo import FeedBackfillGapsDynamo, FeedDynamo, FeedPulledAuthorsDynamo
+
+# users with at least this many followers have their posts pulled into feeds as those are read, rather than
+# pushed to the feed of every follower when posted. Unset disables.
+FEED_PULL_MIN_FOLLOWERS = int(os.environ.get('FEED_PULL_MIN_FOLLOWERS') or 0)
 
-from .dynamo import FeedDynamo
+# how many feeds each fan-out job adds a post to, or deletes a post from
+FEED_FAN_OUT_CHUNK_SIZE = 500
+
+# feeds are trimmed to this many of their most recent items, older posts are read from their authors. Unset disables.
+FEED_MAX_ITEMS = int(os.environ.get('FEED_MAX_ITEMS') or 0)
+# feed items expire this many days after their post was posted, older posts are not added. Unset disables.
+FEED_ITEM_TTL_DAYS = int(os.environ.get('FEED_ITEM_TTL_DAYS') or 0)
+# on follow, at most this many of the followed user's posts, posted within this many days, are added to the
+# follower's feed. The rest are added as the feed is read that far. Unset disables.
+FEED_BACKFILL_MAX_POSTS = int(os.environ.get('FEED_BACKFILL_MAX_POSTS') or 0)
+FEED_BACKFILL_DAYS = int(os.environ.get('FEED_BACKFILL_DAYS') or 0)
+# rather than on every post added, feeds are trimmed at random often enough to exceed the cap by about this much
+FEED_TRIM_OVERSHOOT = 0.1
+# at most this many followed users' backfill gaps are filled in per feed page read, the page stopping short of the rest
+FEED_BACKFILL_MAX_GAPS_PER_READ = 10
+# past the end of a bounded feed, the posts of every user followed are read, in chunks of this many users
+FEED_FALLBACK_AUTHORS_CHUNK_SIZE = 100
+# authors' posts are read this many at once
+FEED_READ_MAX_WORKERS = 10
 
 logger = logging.getLogger()
 
 
+def post_sort_key(post_item):
+    "Feeds are ordered by when their posts were posted, then by post id between posts posted at the same time"
+    return post_item['postedAt'], post_item['postId']
+
+
+def take_posts(post_items, limit):
+    """
+    Take the first `limit` of the post items, which are ordered by postedAt, and any more posted at the same
+    time as the last of them, so that none that may sort before it by post id are missed. Returns those taken,
+    and whether there were more.
+    """
+    taken = []
+    for post_item in post_items:
+        if len(taken) >= limit and post_item['postedAt'] != taken[-1]['postedAt']:
+            return taken, True
+        taken.append(post_item)
+    return taken, False
+
+
+def newest_posts(post_items, limit):
+    "The `limit` most recently posted of the post items, with any duplicates dropped"
+    post_items = {post_item['postId']: post_item for post_item in post_items}.values()
+    return sorted(post_items, key=post_sort_key, reverse=True)[:limit]
+
+
 class FeedManager:
     def __init__(self, clients, managers=None):
         managers = managers or {}
         managers['feed'] = self
         self.follower_manager = managers.get('follower') or models.FollowerManager(clients, managers=managers)
         self.post_manager = managers.get('post') or models.PostManager(clients, managers=managers)
+        self.user_manager = managers.get('user') or models.UserManager(clients, managers=managers)
 
         self.clients = clients
         if 'appsync' in clients:
             self.appsync_client = clients['appsync']
+        if 'dynamo' in clients:
+            self.backfill_gaps_dynamo = FeedBackfillGapsDynamo(clients['dynamo'])
+            self.pulled_authors_dynamo = FeedPulledAuthorsDynamo(clients['dynamo'])
         if 'dynamo_feed' in clients:
-            self.dynamo = FeedDynamo(clients['dynamo_feed'])
+            ttl = pendulum.duration(days=FEED_ITEM_TTL_DAYS) if FEED_ITEM_TTL_DAYS else None
+            self.dynamo = FeedDynamo(clients['dynamo_feed'], ttl=ttl)
+        if 'sqs_feed_fan_out' in clients:
+            self.fan_out_queue = clients['sqs_feed_fan_out']
+        self.pull_min_followers = FEED_PULL_MIN_FOLLOWERS
+        self.fan_out_chunk_size = FEED_FAN_OUT_CHUNK_SIZE
+        self.max_items = FEED_MAX_ITEMS
+        self.fallback_authors_chunk_size = FEED_FALLBACK_AUTHORS_CHUNK_SIZE
+        self.backfill_max_posts = FEED_BACKFILL_MAX_POSTS
+        self.backfill_days = FEED_BACKFILL_DAYS
+        self.backfill_max_gaps_per_read = FEED_BACKFILL_MAX_GAPS_PER_READ
+
+    def is_pulled_author(self, user_id):
+        "Whether the user has enough followers for their posts to be pulled into feeds, rather than pushed"
+        if not self.pull_min_followers:
+            return False
+        user = self.user_manager.get_user(user_id)
+        return bool(user) and user.item.get('followerCount', 0) >= self.pull_min_followers
+
+    def get_feed_page(self, feed_user_id, limit, next_token=None):
+        """
+        Return a page of up to `limit` post ids of the user's feed, most recently posted first, and the token
+        for the next page. Merges the posts pushed to the feed with those of the pulled authors the user follows.
+        Fills in the posts left out of backfills on follow that the page reaches. Past the end of a feed that is
+        trimmed or expires, falls back to reading the posts of every user they follow, a chunk of them at a time.
+        """
+        before = self.decode_feed_page_token(feed_user_id, next_token) if next_token else (None, None)
+        pushed_post_items = self.dynamo.generate_recent_items(feed_user_id, *before, page_size=limit + 1)
+        post_items = take_posts(pushed_post_items, limit)[0]
+        # the page reaches back at least as far as the pushed items do, or all the way if there aren't enough
+        oldest_posted_at = post_items[-1]['postedAt'] if len(post_items) >= limit else ''
+        gap_post_items, gaps_reach = self.fill_backfill_gaps(feed_user_id, oldest_posted_at, limit, before)
+        post_items.extend(gap_post_items)
+        pulled_author_ids = set(self.generate_followed_pulled_author_ids(feed_user_id))
+        author_id_chunks = [list(pulled_author_ids)]
+        if (self.max_items or self.dynamo.ttl) and len(post_items) < limit:
+            # older items may have been trimmed or have expired
+            followed_user_ids = self.follower_manager.generate_followed_user_ids(
+                feed_user_id, follow_status=FollowStatus.FOLLOWING
+            )
+            fallback_author_ids = (
+                author_id
+                for author_id in itertools.chain([feed_user_id], followed_user_ids)
+                if author_id not in pulled_author_ids
+            )
+            chunk_size = self.fallback_authors_chunk_size
+            fallback_author_id_chunks = iter(lambda: list(itertools.islice(fallback_author_ids, chunk_size)), [])
+            author_id_chunks = itertools.chain(author_id_chunks, fallback_author_id_chunks)
+
+        def read_author_post_items(author_id):
+            author_post_items = self.post_manager.dynamo.generate_completed_posts_by_user(
+                author_id, *before, page_size=limit + 1
+            )
+            return take_posts(author_post_items, limit)[0]
+
+        for author_ids in author_id_chunks:
+            author_reads = [functools.partial(read_author_post_items, author_id) for author_id in author_ids]
+            for author_post_items in gather(*author_reads, max_workers=FEED_READ_MAX_WORKERS):
+                post_items.extend(author_post_items)
+            # posts read from their authors may also have been pushed. Only the page's worth are kept between chunks.
+            post_items = newest_posts(post_items, limit)
+
+        next_token = None
+        if gaps_reach:
+            # posts of the users whose gaps are left for later pages may be missing from before then
+            post_items = [post_item for post_item in post_items if post_sort_key(post_item) > gaps_reach]
+            last = post_sort_key(post_items[-1]) if post_items else gaps_reach
+            next_token = self.dynamo.feed_client.encode_pagination_token(list(last))
+        elif len(post_items) == limit:
+            next_token = self.dynamo.feed_client.encode_pagination_token(list(post_sort_key(post_items[-1])))
+        return [post_item['postId'] for post_item in post_items], next_token
+
+    def decode_feed_page_token(self, feed_user_id, next_token):
+        "Return the (postedAt, postId) of the last post of the previous page, or Nones to start from the top"
+        try:
+            before = self.dynamo.feed_client.decode_pagination_token(next_token)
+        except ValueError:
+            before = None
+        # tokens handed out before feeds were paged here hold the feed table's keys
+        if not (isinstance(before, list) and len(before) == 2 and all(isinstance(v, str) for v in before)):
+            logger.warning(f'Restarting feed of user `{feed_user_id}` from the top, unknown token `{next_token}`')
+            return None, None
+        return tuple(before)
+
+    def fill_backfill_gaps(self, feed_user_id, oldest_posted_at, limit, before=(None, None)):
+        """
+        Add to the feed up to `limit` more posts of each followed user whose backfill stopped after
+        `oldest_posted_at`, at most `backfill_max_gaps_per_read` of them, those the page reaches first.
+        Return those posts before `before`, the (postedAt, postId) the page starts after, and the
+        (postedAt, postId) the page can reach no further than as the gaps of other users are left unfilled, or None.
+        """
+
+        def reach(gap_posted_at):
+            # the gap leaves out posts from before gap_posted_at, those from after the start of the page don't matter
+            return min((gap_posted_at, ''), before) if before[0] else (gap_posted_at, '')
+
+        gaps = [
+            (posted_by_user_id, gap_posted_at)
+            for posted_by_user_id, gap_posted_at in self.backfill_gaps_dynamo.get_gaps(feed_user_id).items()
+            if gap_posted_at > oldest_posted_at
+        ]
+        gaps.sort(key=lambda gap: reach(gap[1]), reverse=True)
+        gaps, unfilled_gaps = gaps[: self.backfill_max_gaps_per_read], gaps[self.backfill_max_gaps_per_read :]
+
+        def read_gap_post_items(posted_by_user_id, gap_posted_at):
+            author_post_items = self.post_manager.dynamo.generate_completed_posts_by_user(
+                posted_by_user_id, before_posted_at=gap_posted_at, page_size=limit + 1
+            )
+            return take_posts(author_post_items, limit)
+
+        gap_reads = [functools.partial(read_gap_post_items, *gap) for gap in gaps]
+        post_items, updated_gaps = [], {}
+        for (posted_by_user_id, _), (author_post_items, more) in zip(
+            gaps, gather(*gap_reads, max_workers=FEED_READ_MAX_WORKERS)
+        ):
+            post_items.extend(author_post_items)
+            updated_gaps[posted_by_user_id] = author_post_items[-1]['postedAt'] if more else None
+        # the posts are written before the gaps are moved past them, should we be cut short
+        if post_items:
+            self.dynamo.add_posts_to_feed(feed_user_id, iter(post_items))
+        if updated_gaps:
+            self.backfill_gaps_dynamo.update_gaps(feed_user_id, updated_gaps)
+        post_items = [
+            post_item
+            for post_item in post_items
+            if not before[0] or post_sort_key(post_item) < (before[0], before[1] or '')
+        ]
+        return post_items, reach(unfilled_gaps[0][1]) if unfilled_gaps else None
+
+    def generate_followed_pulled_author_ids(self, feed_user_id):
+        pulled_author_ids = sorted(self.pulled_authors_dynamo.get_user_ids() - {feed_user_id})
+        if not pulled_author_ids:
+            return
+        follow_items = self.follower_manager.dynamo.batch_get_followings(feed_user_id, pulled_author_ids)
+        for follow_item in follow_items:
+            if (follow_item or {}).get('followStatus') == FollowStatus.FOLLOWING:
+                yield follow_item['followedUserId']
+
+    def trim_feeds(self, feed_user_ids, always=False):
+        "Trim the feeds down to the most recent items that fit the cap, each only some of the time unless `always`"
+        if not self.max_items:
+            return
+        for feed_user_id in feed_user_ids:
+            if always or random.random() * self.max_items * FEED_TRIM_OVERSHOOT < 1:
+                self.dynamo.trim(feed_user_id, self.max_items)
 
     def add_users_posts_to_feed(self, feed_user_id, posted_by_user_id):
-        post_item_generator = self.post_manager.dynamo.generate_posts_by_user(posted_by_user_id, completed=True)
-        self.dynamo.add_posts_to_feed(feed_user_id, post_item_generator)
+        """
+        Add the followed user's posts within the backfill window to the feed, recording where it stopped if
+        there are older posts.
+        """
+        # older posts than fit the cap would be trimmed right away
+        max_posts = min(filter(None, [self.backfill_max_posts, self.max_items]), default=None)
+        posted_after = None
+        if self.backfill_days:
+            posted_after = pendulum.now('utc').subtract(days=self.backfill_days).to_iso8601_string()
+        post_item_generator = self.post_manager.dynamo.generate_completed_posts_by_user(
+            posted_by_user_id, page_size=max_posts + 1 if max_posts else None
+        )
+        post_items, gap_posted_at = [], None
+        for post_item in post_item_generator:
+            # posts posted at the same time are all added or all left out, as the gap is only a time
+            is_full = (
+                max_posts and len(post_items) >= max_posts and post_item['postedAt'] != post_items[-1]['postedAt']
+            )
+            if is_full or (posted_after and post_item['postedAt'] < posted_after):
+                gap_posted_at = post_items[-1]['postedAt'] if post_items else posted_after
+                break
+            post_items.append(post_item)
+        self.dynamo.add_posts_to_feed(feed_user_id, iter(post_items))
+        if gap_posted_at:
+            self.backfill_gaps_dynamo.set_gap(feed_user_id, posted_by_user_id, gap_posted_at)
+        else:
+            self.backfill_gaps_dynamo.delete_gap(feed_user_id, posted_by_user_id)
+        self.trim_feeds([feed_user_id], always=True)
 
     def add_post_to_followers_feeds(self, followed_user_id, post_item):
-        user_id_gen = itertools.chain(
-            [followed_user_id], self.follower_manager.generate_follower_user_ids(followed_user_id)
-        )
-        return self.dynamo.add_post_to_feeds(user_id_gen, post_item)
+        "Queue the job of adding the post to the feeds of the user's followers"
+        post_item = {k: post_item[k] for k in ('postId', 'postedByUserId', 'postedAt')}
+        self.fan_out_queue.send_messages([{'action': 'addPost', 'postItem': post_item}])
+
+    def delete_by_post(self, post_id):
+        "Queue the job of deleting the post from all the feeds it is in"
+        self.fan_out_queue.send_messages([{'action': 'deletePost', 'postId': post_id}])
+
+    def process_fan_out_job(self, job):
+        """
+        Add the post to, or delete it from, one chunk of feeds and notify their users. The job of the next chunk,
+        if any, is queued first so that chunks are processed concurrently by separate workers. Chunks may be
+        processed more than once, which is harmless.
+
+        Jobs may run in any order, so a post is only added to feeds while it is still completed. Otherwise, the
+        post's deletePost job may already have run, and would not remove the items added.
+        """
+        if job['action'] == 'addPost':
+            post_item = job['postItem']
+            posted_by_user_id = post_item['postedByUserId']
+            if not self.is_post_completed(post_item['postId']):
+                return
+            page = self.follower_manager.dynamo.query_follower_items(
+                posted_by_user_id, self.fan_out_chunk_size, job.get('nextToken'), fields=['followerUserId']
+            )
+            if page['nextToken']:
+                self.fan_out_queue.send_messages([{**job, 'nextToken': page['nextToken']}])
+            feed_user_ids = [item['followerUserId'] for item in page['items']]
+            self.dynamo.add_post_to_feeds(iter(feed_user_ids), post_item)
+            # the post may have stopped being completed while it was added, after its deletePost job ran
+            if not self.is_post_completed(post_item['postId']):
+                self.dynamo.feed_client.batch_delete(
+                    {'postId': post_item['postId'], 'feedUserId': feed_user_id} for feed_user_id in feed_user_ids
+                )
+                return
+            self.trim_feeds(feed_user_ids)
+        elif job['action'] == 'deletePost':
+            page = self.dynamo.query_keys_by_post(job['postId'], self.fan_out_chunk_size, job.get('nextToken'))
+            if page['nextToken']:
+                self.fan_out_queue.send_messages([{**job, 'nextToken': page['nextToken']}])
+            feed_user_ids = [key['feedUserId'] for key in page['items']]
+            self.dynamo.feed_client.batch_delete(iter(page['items']))
+        else:
+            raise ValueError(f'Unknown feed fan-out action `{job["action"]}`')
+        for user_id in feed_user_ids:
+            self.appsync_client.fire_notification(user_id, GqlNotificationType.USER_FEED_CHANGED)
+
+    def is_post_completed(self, post_id):
+        post_item = self.post_manager.dynamo.get_post(post_id, strongly_consistent=True)
+        return bool(post_item) and post_item['postStatus'] == PostStatus.COMPLETED
 
     def on_user_follow_status_change_sync_feed(self, followed_user_id, new_item=None, old_item=None):
         follower_user_id = (new_item or old_item)['followerUserId']
         new_status = (new_item or {}).get('followStatus', FollowStatus.NOT_FOLLOWING)
         if new_status == FollowStatus.FOLLOWING:
-            self.add_users_posts_to_feed(follower_user_id, followed_user_id)
+            # posts of pulled authors are merged into the feed as it is read
+            if followed_user_id not in self.pulled_authors_dynamo.get_user_ids():
+                self.add_users_posts_to_feed(follower_user_id, followed_user_id)
         else:
             self.dynamo.delete_by_post_owner(follower_user_id, followed_user_id)
+            self.backfill_gaps_dynamo.delete_gap(follower_user_id, followed_user_id)
         self.appsync_client.fire_notification(follower_user_id, GqlNotificationType.USER_FEED_CHANGED)
 
     def on_post_status_change_sync_feed(self, post_id, new_item=None, old_item=None):
         posted_by_user_id = (new_item or old_item)['postedByUserId']
         new_status = (new_item or {}).get('postStatus')
         if new_status == PostStatus.COMPLETED:
-            feed_user_ids = self.add_post_to_followers_feeds(posted_by_user_id, new_item)
-        else:
-            feed_user_ids = self.dynamo.delete_by_post(post_id)
-        for user_id in feed_user_ids:
-            self.appsync_client.fire_notification(user_id, GqlNotificationType.USER_FEED_CHANGED)
+            # the author's own feed is written here, so it has the post by the time they're told it completed
+            self.dynamo.add_post_to_feeds(iter([posted_by_user_id]), new_item)
+            self.trim_feeds([posted_by_user_id])
+            self.appsync_client.fire_notification(posted_by_user_id, GqlNotificationType.USER_FEED_CHANGED)
+            if self.is_pulled_author(posted_by_user_id):
+                # followers see the post as they next read their feeds
+                self.pulled_authors_dynamo.add_user_id(posted_by_user_id)
+            else:
+                self.add_post_to_followers_feeds(posted_by_user_id, new_item)
+        elif (old_item or {}).get('postStatus') == PostStatus.COMPLETED:
+            self.delete_by_post(post_id)
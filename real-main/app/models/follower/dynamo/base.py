@@ -21,6 +21,10 @@ class FollowerDynamo:
         pk = self.pk(follower_user_id, followed_user_id)
         return self.client.get_item(pk, ConsistentRead=strongly_consistent)
 
+    def batch_get_followings(self, follower_user_id, followed_user_ids):
+        "Return a list of the items of the user's followings of each of the followed users, None where there's none"
+        return self.client.batch_get_items([self.pk(follower_user_id, uid) for uid in followed_user_ids])
+
     def add_following(self, follower_user_id, followed_user_id, follow_status):
         followed_at_str = pendulum.now('utc').to_iso8601_string()
         query_kwargs = {
@@ -55,7 +59,7 @@ class FollowerDynamo:
         key = {k: follow_item[k] for k in ('partitionKey', 'sortKey')}
         return self.client.delete_item(key)
 
-    def generate_followed_items(self, user_id, follow_status=None, limit=None, next_token=None):
+    def generate_followed_items(self, user_id, follow_status=None, limit=None, next_token=None, fields=None):
         "Generate items that represent a followed of the given user (that the given user is the follower)"
         key_conditions = [Key('gsiA1PartitionKey').eq(f'follower/{user_id}')]
         if follow_status is not None:
@@ -64,9 +68,9 @@ class FollowerDynamo:
             'KeyConditionExpression': functools.reduce(lambda a, b: a & b, key_conditions),
             'IndexName': 'GSI-A1',
         }
-        return self.client.generate_all_query(query_kwargs)
+        return self.client.generate_all_query(query_kwargs, fields=fields)
 
-    def generate_follower_items(self, user_id, follow_status=None, limit=None, next_token=None):
+    def generate_follower_items(self, user_id, follow_status=None, limit=None, next_token=None, fields=None):
         "Generate items that represent a follower of the given user (that the given user is the followed)"
         key_conditions = [Key('gsiA2PartitionKey').eq(f'followed/{user_id}')]
         if follow_status is not None:
@@ -75,4 +79,12 @@ class FollowerDynamo:
             'KeyConditionExpression': functools.reduce(lambda a, b: a & b, key_conditions),
             'IndexName': 'GSI-A2',
         }
-        return self.client.generate_all_query(query_kwargs)
+        return self.client.generate_all_query(query_kwargs, fields=fields)
+
+    def query_follower_items(self, user_id, limit, next_token=None, fields=None):
+        "Return a page of up to `limit` items of followers of the given user, and the token for the next page"
+        query_kwargs = {
+            'KeyConditionExpression': Key('gsiA2PartitionKey').eq(f'followed/{user_id}'),
+            'IndexName': 'GSI-A2',
+        }
+        return self.client.query(query_kwargs, limit=limit, next_token=next_token, fields=fields)
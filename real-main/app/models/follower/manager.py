@@ -55,13 +55,17 @@ class FollowerManager:
 
     def generate_follower_user_ids(self, followed_user_id, follow_status=None):
         "Return a generator that produces user ids of users that follow the given user"
-        gen = self.dynamo.generate_follower_items(followed_user_id, follow_status=follow_status)
+        gen = self.dynamo.generate_follower_items(
+            followed_user_id, follow_status=follow_status, fields=['followerUserId']
+        )
         gen = map(lambda item: item['followerUserId'], gen)
         return gen
 
     def generate_followed_user_ids(self, follower_user_id, follow_status=None):
         "Return a generator that produces user ids of users given user follows"
-        gen = self.dynamo.generate_followed_items(follower_user_id, follow_status=follow_status)
+        gen = self.dynamo.generate_followed_items(
+            follower_user_id, follow_status=follow_status, fields=['followedUserId']
+        )
         gen = map(lambda item: item['followedUserId'], gen)
         return gen
 
@@ -98,7 +102,8 @@ class FollowerManager:
             self.init_follow(item).accept()
 
     def delete_all_denied_follow_requests(self, followed_user_id):
-        for item in self.dynamo.generate_follower_items(followed_user_id, FollowStatus.DENIED):
+        key_fields = ['partitionKey', 'sortKey']
+        for item in self.dynamo.generate_follower_items(followed_user_id, FollowStatus.DENIED, fields=key_fields):
             # TODO: do as batch write
             self.dynamo.delete_following(item)
 
@@ -64,12 +64,12 @@ class LikeDynamo:
         except self.client.exceptions.ConditionalCheckFailedException as err:
             raise NotLikedWithStatus(liked_by_user_id, post_id, like_status) from err
 
-    def generate_of_post(self, post_id):
+    def generate_of_post(self, post_id, fields=None):
         query_kwargs = {
             'KeyConditionExpression': Key('gsiA2PartitionKey').eq(f'like/{post_id}'),
             'IndexName': 'GSI-A2',
         }
-        return self.client.generate_all_query(query_kwargs)
+        return self.client.generate_all_query(query_kwargs, fields=fields)
 
     def generate_by_liked_by(self, liked_by_user_id):
         query_kwargs = {
@@ -4,6 +4,7 @@ from app import models
 from app.models.follower.enums import FollowStatus
 from app.models.post.enums import PostStatus
 from app.models.user.enums import UserPrivacyStatus
+from app.utils import gather
 
 from .dynamo import LikeDynamo
 from .enums import LikeStatus
@@ -34,16 +35,22 @@ class LikeManager:
         return Like(like_item, self.dynamo, post_manager=self.post_manager)
 
     def like_post(self, user, post, like_status, now=None):
+        # these reads are independent, so make them concurrently
+        blocked, blocking, posted_by_user = gather(
+            lambda: self.block_manager.is_blocked(post.user_id, user.id),
+            lambda: self.block_manager.is_blocked(user.id, post.user_id),
+            lambda: self.user_manager.get_user(post.user_id),
+        )
+
         # can't like a post of a user that has blocked us
-        if self.block_manager.is_blocked(post.user_id, user.id):
+        if blocked:
             raise LikeException(f'User has been blocked by owner of post `{post.id}`')
 
         # can't like a post of a user we have blocked
-        if self.block_manager.is_blocked(user.id, post.user_id):
+        if blocking:
             raise LikeException(f'User has blocked owner of post `{post.id}`')
 
         # if the post is from a private user (other than ourselves) then we must be a follower to like the post
-        posted_by_user = self.user_manager.get_user(post.user_id)
         if user.id != posted_by_user.id:
             if posted_by_user.item['privacyStatus'] != UserPrivacyStatus.PUBLIC:
                 follow = self.follower_manager.get_follow(user.id, posted_by_user.id)
@@ -69,7 +76,8 @@ class LikeManager:
 
     def dislike_all_of_post(self, post_id):
         "Dislike all likes of a post"
-        for like_item in self.dynamo.generate_of_post(post_id):
+        fields = ['likedByUserId', 'postId', 'likeStatus']
+        for like_item in self.dynamo.generate_of_post(post_id, fields=fields):
             self.init_like(like_item).dislike()
 
     def dislike_all_by_user(self, liked_by_user_id):
@@ -13,6 +13,9 @@ logger = logging.getLogger()
 
 
 class PostDynamo:
+
+    expired_posts_scan_checkpoint_pk = {'partitionKey': 'scanCheckpoint/expiredPosts', 'sortKey': '-'}
+
     def __init__(self, dynamo_client):
         self.client = dynamo_client
 
@@ -25,6 +28,10 @@ class PostDynamo:
     def get_post(self, post_id, strongly_consistent=False):
         return self.client.get_item(self.pk(post_id), ConsistentRead=strongly_consistent)
 
+    def get_posts(self, post_ids):
+        "Get many posts at once. Returns a list in the same order as `post_ids`, with None for posts that DNE"
+        return self.client.batch_get_items([self.pk(post_id) for post_id in post_ids])
+
     def delete_post(self, post_id):
         return self.client.delete_item(self.pk(post_id))
 
@@ -51,6 +58,33 @@ class PostDynamo:
             query_kwargs['FilterExpression'] = filter_exp(PostStatus.COMPLETED)
         return self.client.generate_all_query(query_kwargs)
 
+    def generate_completed_posts_by_user(
+        self, user_id, before_posted_at=None, before_post_id=None, page_size=None
+    ):
+        """
+        Generate the user's completed posts, most recently posted first. If `before_posted_at` is set, only those
+        posted before then, or posted at the same time with a post id before `before_post_id`.
+        """
+        sort_key_prefix = f'{PostStatus.COMPLETED}/'
+        sort_key_condition = (
+            Key('gsiA2SortKey').between(sort_key_prefix, sort_key_prefix + before_posted_at)
+            if before_posted_at
+            else Key('gsiA2SortKey').begins_with(sort_key_prefix)
+        )
+        query_kwargs = {
+            'KeyConditionExpression': Key('gsiA2PartitionKey').eq(f'post/{user_id}') & sort_key_condition,
+            'IndexName': 'GSI-A2',
+            'ScanIndexForward': False,
+        }
+        if page_size:
+            query_kwargs['Limit'] = page_size
+        post_items = self.client.generate_all_query(query_kwargs)
+        # between is inclusive of its upper bound
+        before = (before_posted_at, before_post_id or '')
+        return (
+            item for item in post_items if not before_posted_at or (item['postedAt'], item['postId']) < before
+        )
+
     def generate_expired_post_pks_by_day(self, date, cut_off_time=None):
         key_conditions = [Key('gsiK1PartitionKey').eq(f'post/{date}')]
         if cut_off_time:
@@ -62,15 +96,35 @@ class PostDynamo:
         }
         return self.client.generate_all_query(query_kwargs)
 
-    def generate_expired_post_pks_with_scan(self, cut_off_date):
-        "Do a table **scan** to generate pks of expired posts. Does *not* include cut_off_date."
+    def generate_expired_post_pks_with_scan(
+        self, cut_off_date, total_segments=None, checkpoint=None, by_page=False
+    ):
+        """
+        Do a table **scan** to generate pks of expired posts. Does *not* include cut_off_date.
+        If `by_page` is set, a list of pks is generated for each page of the scan, including empty ones.
+        See DynamoClient.generate_all_scan_pages() for `total_segments` and `checkpoint`.
+        """
         query_kwargs = {
             'FilterExpression': (
                 Attr('partitionKey').begins_with('post/') & Attr('expiresAt').lt(str(cut_off_date))
             ),
             'ProjectionExpression': 'partitionKey, sortKey',
         }
-        return self.client.generate_all_scan(query_kwargs)
+        generate = self.client.generate_all_scan_pages if by_page else self.client.generate_all_scan
+        return generate(query_kwargs, total_segments=total_segments, checkpoint=checkpoint)
+
+    def get_expired_posts_scan_checkpoint(self):
+        "Get the checkpoint of an unfinished scan for expired posts, if there is one"
+        item = self.client.get_item(self.expired_posts_scan_checkpoint_pk)
+        return item['scanSegments'] if item else None
+
+    def set_expired_posts_scan_checkpoint(self, checkpoint):
+        "Save the checkpoint of an unfinished scan for expired posts, or clear it if `checkpoint` is None"
+        if checkpoint is None:
+            return self.client.delete_item(self.expired_posts_scan_checkpoint_pk)
+        return self.client.set_attributes(
+            self.expired_posts_scan_checkpoint_pk, schemaVersion=0, scanSegments=checkpoint
+        )
 
     def add_pending_post(
         self,
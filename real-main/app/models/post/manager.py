@@ -20,6 +20,8 @@ from .model import Post
 
 logger = logging.getLogger()
 
+EXPIRED_POSTS_SCAN_SEGMENTS = 8
+
 
 class PostManager(FlagManagerMixin, TrendingManagerMixin, ViewManagerMixin, ManagerBase):
 
@@ -199,8 +201,9 @@ class PostManager(FlagManagerMixin, TrendingManagerMixin, ViewManagerMixin, Mana
             return
 
         results = []
-        for post_id, view_count in grouped_post_ids.items():
-            post = self.get_post(post_id)
+        post_items = self.dynamo.get_posts(list(grouped_post_ids.keys()))
+        for (post_id, view_count), post_item in zip(grouped_post_ids.items(), post_items):
+            post = self.init_post(post_item)
             if not post:
                 logger.warning(f'Cannot record view(s) by user `{user_id}` on DNE post `{post_id}`')
                 continue
@@ -235,16 +238,41 @@ class PostManager(FlagManagerMixin, TrendingManagerMixin, ViewManagerMixin, Mana
             )
             self.init_post(post_item).delete()
 
-    def delete_older_expired_posts(self, now=None):
-        "Delete posts that expired yesterday or earlier, via full table scan"
+    def delete_older_expired_posts(self, now=None, should_stop=None):
+        """
+        Delete posts that expired yesterday or earlier, via full table scan.
+        Progress through the scan is saved as it goes, and if `should_stop` is provided and returns True
+        the scan stops early. Either way, the next call resumes from the last saved progress.
+        """
         now = now or pendulum.now('utc')
         today = now.date()
 
-        # scan for expired posts
-        for post_pk in self.dynamo.generate_expired_post_pks_with_scan(today):  # excludes today
-            logger.warning(f'Deleting expired post with pk ({post_pk["partitionKey"]}, {post_pk["sortKey"]})')
-            post_item = self.dynamo.client.get_item(post_pk)
-            self.init_post(post_item).delete()
+        # scan for expired posts, picking up where any previous unfinished scan left off
+        checkpoint = self.dynamo.get_expired_posts_scan_checkpoint() or {}
+        saved_checkpoint = dict(checkpoint)
+        post_pk_pages = self.dynamo.generate_expired_post_pks_with_scan(
+            today, total_segments=EXPIRED_POSTS_SCAN_SEGMENTS, checkpoint=checkpoint, by_page=True
+        )  # excludes today
+        stopped = False
+        for post_pks in post_pk_pages:
+            # the checkpoint now covers every page before this one, save it in case we get cut short
+            if checkpoint != saved_checkpoint:
+                self.dynamo.set_expired_posts_scan_checkpoint(checkpoint)
+                saved_checkpoint = dict(checkpoint)
+            for post_pk in post_pks:
+                if should_stop and should_stop():
+                    stopped = True
+                    break
+                logger.warning(f'Deleting expired post with pk ({post_pk["partitionKey"]}, {post_pk["sortKey"]})')
+                post_item = self.dynamo.client.get_item(post_pk)
+                if post_item:  # may have already been deleted by an earlier run that was cut short
+                    self.init_post(post_item).delete()
+            # sparse stretches of the table can go many pages without matching anything
+            if stopped or (should_stop and should_stop()):
+                stopped = True
+                break
+        post_pk_pages.close()
+        self.dynamo.set_expired_posts_scan_checkpoint(checkpoint if stopped else None)
 
     def delete_all_by_user(self, user_id):
         for post_item in self.dynamo.generate_posts_by_user(user_id):
@@ -337,7 +337,8 @@ class Post(FlagModelMixin, TrendingModelMixin, ViewModelMixin):
         # Determine the original_post_id, if this post isn't original
         original_post_id = None
         if self.type == PostType.IMAGE:
-            # need strongly consistent because checksum may have been just set
+            # need strongly consistent because checksum may have been just set, in which case
+            # the dynamo client's item cache can serve it without another read
             checksum = self.refresh_item(strongly_consistent=True).item['checksum']
             post_id = self.dynamo.get_first_with_checksum(checksum)
             if post_id and post_id != self.id:
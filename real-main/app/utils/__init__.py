@@ -1,4 +1,8 @@
 __all__ = [
+    'gather',
     'GqlNotificationType',
+    'TokenBucket',
 ]
+from .gather import gather
 from .gql_notification_type import GqlNotificationType
+from .token_bucket import TokenBucket
@@ -0,0 +1,19 @@
+import concurrent.futures
+import contextvars
+
+
+def gather(*funcs, max_workers=None):
+    """
+    Call the given argument-less callables concurrently, each on its own thread unless `max_workers` caps
+    the threads, and return their results in the same order. Intended for independent blocking reads, ex:
+    dynamo or s3 round trips, that would otherwise be made one after another. If any of the calls raise, the
+    exception of the first of them (in argument order) is re-raised.
+    """
+    if len(funcs) < 2 or max_workers == 1:
+        return [func() for func in funcs]
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(len(funcs), max_workers or len(funcs))
+    ) as executor:
+        # each call runs in a copy of the caller's context, so sees the same context variables
+        futures = [executor.submit(contextvars.copy_context().run, func) for func in funcs]
+        return [future.result() for future in futures]
@@ -0,0 +1,30 @@
+import threading
+import time
+
+
+class TokenBucket:
+    "A thread-safe token bucket, to limit some operation to `rate` per second on average"
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        assert rate > 0, 'Rate must be positive'
+        self.rate = rate
+        # by default allow bursts of up to one second's worth
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        "Take `tokens` from the bucket, blocking until they're available. Returns the seconds spent waiting."
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            # reserve the tokens now, even if that puts us in debt, so waiters are served in order
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            self.sleep(wait)
+        return wait
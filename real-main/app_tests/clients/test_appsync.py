@@ -0,0 +1,127 @@
+from unittest.mock import call, patch
+
+import pytest
+
+from app.clients import AppSyncClient
+
+# the requests_mock parameter is auto-supplied by the requests-mock library
+
+graphql_url = 'https://appsync.real.app/graphql'
+
+
+@pytest.fixture
+def appsync_client():
+    appsync_client = AppSyncClient(appsync_graphql_url=graphql_url)
+    with patch.object(appsync_client, 'auth', return_value=None):
+        yield appsync_client
+
+
+def test_notification_batch_collects_distinct_notifications(appsync_client):
+    batch = {}
+    with patch.object(appsync_client, 'send') as send_mock:
+        with appsync_client.notification_batch(batch):
+            appsync_client.fire_notification('uid1', 'USER_FEED_CHANGED')
+            appsync_client.fire_notification('uid2', 'USER_FEED_CHANGED')
+            appsync_client.fire_notification('uid1', 'USER_FEED_CHANGED')
+            appsync_client.fire_notification('uid1', 'POST_COMPLETED', postId='pid')
+        assert send_mock.call_count == 0
+        assert list(batch) == [
+            ('uid1', 'USER_FEED_CHANGED', ()),
+            ('uid2', 'USER_FEED_CHANGED', ()),
+            ('uid1', 'POST_COMPLETED', (('postId', 'pid'),)),
+        ]
+
+        # outside the context, sent immediately
+        appsync_client.fire_notification('uid1', 'USER_FEED_CHANGED')
+        assert send_mock.call_count == 1
+
+
+def test_flush_notifications(appsync_client, requests_mock):
+    requests_mock.post(graphql_url, json={'data': {}})
+    appsync_client.flush_notifications({})
+    assert requests_mock.call_count == 0
+
+    batch = {(f'uid{i}', 'USER_FEED_CHANGED', ()): None for i in range(30)}
+    batch[('uid0', 'POST_COMPLETED', (('postId', 'pid'),))] = None
+    appsync_client.flush_notifications(batch)
+    assert batch == {}
+
+    # many notifications to a request, as aliased mutations
+    bodies = sorted((r.json() for r in requests_mock.request_history), key=lambda body: -len(body['variables']))
+    assert [len(body['variables']) for body in bodies] == [25, 6]
+    assert 'n0: triggerNotification (input: $input0) { userId type }' in bodies[0]['query']
+    assert bodies[0]['variables']['input0'] == {'userId': 'uid0', 'type': 'USER_FEED_CHANGED'}
+    assert 'n5: triggerNotification (input: $input5) { userId type postId }' in bodies[1]['query']
+    assert bodies[1]['variables']['input5'] == {'userId': 'uid0', 'type': 'POST_COMPLETED', 'postId': 'pid'}
+
+
+def test_flush_notifications_errors(appsync_client, requests_mock):
+    requests_mock.post(graphql_url, json={'errors': [{'message': 'nope'}]})
+    batch = {(f'uid{i}', 'USER_FEED_CHANGED', ()): None for i in range(30)}
+    with pytest.raises(Exception, match='Failed to send 2 of 2 batches of notifications'):
+        appsync_client.flush_notifications(batch)
+    assert requests_mock.call_count == 2
+
+
+class Clock:
+    "Stands in for time.monotonic() and time.sleep(), with time passing only when slept"
+
+    def __init__(self, now):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    clock = Clock(100)
+    with patch('app.clients.appsync.time', clock):
+        yield clock
+
+
+def test_flush_notifications_debounced(appsync_client, clock):
+    appsync_client.debounce_seconds = 10
+    feed_changed = ('uid1', 'USER_FEED_CHANGED', ())
+    post_completed = ('uid1', 'POST_COMPLETED', (('postId', 'pid'),))
+    with patch.object(appsync_client, 'send_notifications') as send_mock:
+        appsync_client.flush_notifications({feed_changed: None, post_completed: None})
+        assert send_mock.call_args_list == [call([feed_changed, post_completed])]
+
+        # within the window, only notifications with extra fields are sent straight away. The last of the
+        # burst is sent once the window has passed, which starts a new window
+        send_mock.reset_mock()
+        clock.now = 105
+        appsync_client.flush_notifications({feed_changed: None, post_completed: None})
+        assert send_mock.call_args_list == [call([post_completed]), call([feed_changed])]
+        assert clock.now == 110
+
+        send_mock.reset_mock()
+        clock.now = 119
+        appsync_client.flush_notifications({feed_changed: None})
+        assert send_mock.call_args_list == [call([feed_changed])]
+        assert clock.now == 120
+
+        send_mock.reset_mock()
+        clock.now = 131
+        appsync_client.flush_notifications({feed_changed: None})
+        assert send_mock.call_args_list == [call([feed_changed])]
+        assert clock.now == 131
+
+
+def test_flush_notifications_debounced_only_once_sent(appsync_client, clock):
+    appsync_client.debounce_seconds = 10
+    feed_changed = ('uid1', 'USER_FEED_CHANGED', ())
+    with patch.object(appsync_client, 'send_notifications', side_effect=Exception('nope')) as send_mock:
+        with pytest.raises(Exception, match='Failed to send 1 of 1 batches of notifications'):
+            appsync_client.flush_notifications({feed_changed: None})
+
+    # a notification that failed to send doesn't hold back the next
+    with patch.object(appsync_client, 'send_notifications') as send_mock:
+        clock.now = 101
+        appsync_client.flush_notifications({feed_changed: None})
+        assert send_mock.call_args_list == [call([feed_changed])]
+        assert clock.now == 101
@@ -0,0 +1,511 @@
+import uuid
+from decimal import Decimal
+from unittest.mock import Mock, patch
+
+import pytest
+
+
+@pytest.fixture
+def key():
+    yield {'partitionKey': f'thing/{uuid.uuid4()}', 'sortKey': '-'}
+
+
+@pytest.fixture
+def item(dynamo_client, key):
+    yield dynamo_client.add_item({'Item': {**key, 'count': 1}})
+
+
+def test_item_cache_off_by_default(dynamo_client, item, key):
+    dynamo_client.table = Mock(wraps=dynamo_client.table)
+    assert dynamo_client.get_item(key) == item
+    assert dynamo_client.get_item(key) == item
+    assert dynamo_client.table.get_item.call_count == 2
+
+
+def test_item_cache_serves_repeat_reads(dynamo_client, item, key):
+    dynamo_client.table = Mock(wraps=dynamo_client.table)
+    with dynamo_client.item_cache():
+        assert dynamo_client.get_item(key) == item
+        assert dynamo_client.get_item(key) == item
+        assert dynamo_client.table.get_item.call_count == 1
+
+        # strongly consistent reads and projected reads always go to dynamo
+        assert dynamo_client.get_item(key, ConsistentRead=True) == item
+        assert dynamo_client.get_item(key, ProjectionExpression='sortKey') == {'sortKey': '-'}
+        assert dynamo_client.table.get_item.call_count == 3
+
+        # items that do not exist are remembered as well
+        other_key = {'partitionKey': f'thing/{uuid.uuid4()}', 'sortKey': '-'}
+        assert dynamo_client.get_item(other_key) is None
+        assert dynamo_client.get_item(other_key) is None
+        assert dynamo_client.table.get_item.call_count == 4
+
+    # cache is dropped when the context exits
+    assert dynamo_client.get_item(key) == item
+    assert dynamo_client.table.get_item.call_count == 5
+
+
+def test_item_cache_returns_copies(dynamo_client, item, key):
+    with dynamo_client.item_cache():
+        dynamo_client.get_item(key)['count'] = 42
+        assert dynamo_client.get_item(key)['count'] == 1
+
+
+def test_item_cache_populated_and_invalidated_by_writes(dynamo_client, item, key):
+    dynamo_client.table = Mock(wraps=dynamo_client.table)
+    with dynamo_client.item_cache():
+        assert dynamo_client.get_item(key)['count'] == 1
+
+        # update populates the cache with the new item
+        new_item = dynamo_client.increment_count(key, 'count')
+        assert new_item['count'] == 2
+        assert dynamo_client.get_item(key) == new_item
+        assert dynamo_client.table.get_item.call_count == 1
+
+        # as does delete
+        dynamo_client.delete_item(key)
+        assert dynamo_client.get_item(key) is None
+        assert dynamo_client.table.get_item.call_count == 1
+
+        # and add, with the types a read would return
+        dynamo_client.add_item({'Item': {**key, 'count': 3, 'tags': {'a'}}})
+        assert dynamo_client.get_item(key) == {**key, 'count': Decimal(3), 'tags': {'a'}}
+        assert dynamo_client.table.get_item.call_count == 1
+
+        # transaction updates invalidate the cache
+        transact = {
+            'Update': {
+                'Key': {'partitionKey': {'S': key['partitionKey']}, 'sortKey': {'S': '-'}},
+                'UpdateExpression': 'SET #c = :c',
+                'ExpressionAttributeNames': {'#c': 'count'},
+                'ExpressionAttributeValues': {':c': {'N': '4'}},
+            }
+        }
+        dynamo_client.transact_write_items([transact])
+        assert dynamo_client.get_item(key)['count'] == 4
+        assert dynamo_client.table.get_item.call_count == 2
+
+        # as do batch deletes
+        dynamo_client.batch_delete_items([key])
+        assert dynamo_client.get_item(key) is None
+        assert dynamo_client.table.get_item.call_count == 3
+
+
+def test_item_cache_serves_strongly_consistent_reads_of_written_items(dynamo_client, item, key):
+    dynamo_client.table = Mock(wraps=dynamo_client.table)
+    other_key = {'partitionKey': f'thing/{uuid.uuid4()}', 'sortKey': '-'}
+    with dynamo_client.item_cache():
+        # an eventually consistent read does not satisfy a strongly consistent one
+        assert dynamo_client.get_item(key) == item
+        assert dynamo_client.get_item(key, ConsistentRead=True) == item
+        assert dynamo_client.table.get_item.call_count == 2
+
+        # but a strongly consistent read does
+        assert dynamo_client.get_item(key, ConsistentRead=True) == item
+        assert dynamo_client.table.get_item.call_count == 2
+
+        # as do writes
+        new_item = dynamo_client.set_attributes(key, num=5)
+        assert dynamo_client.get_item(key, ConsistentRead=True) == new_item
+        dynamo_client.delete_item(key)
+        assert dynamo_client.get_item(key, ConsistentRead=True) is None
+        assert dynamo_client.table.get_item.call_count == 2
+
+        # as does the post-transaction state of puts and deletes
+        transacts = [
+            {
+                'Put': {
+                    'Item': {
+                        'partitionKey': {'S': key['partitionKey']},
+                        'sortKey': {'S': '-'},
+                        'count': {'N': '6'},
+                    }
+                }
+            },
+            {'Delete': {'Key': {'partitionKey': {'S': other_key['partitionKey']}, 'sortKey': {'S': '-'}}}},
+        ]
+        dynamo_client.transact_write_items(transacts)
+        assert dynamo_client.get_item(key, ConsistentRead=True) == {**key, 'count': 6}
+        assert dynamo_client.get_item(other_key, ConsistentRead=True) is None
+        assert dynamo_client.table.get_item.call_count == 2
+
+        # a failed write forgets the item
+        with pytest.raises(dynamo_client.exceptions.ConditionalCheckFailedException):
+            dynamo_client.add_item({'Item': {**key}})
+        assert dynamo_client.get_item(key, ConsistentRead=True) == {**key, 'count': 6}
+        assert dynamo_client.table.get_item.call_count == 3
+
+
+def test_batch_get_items(dynamo_client):
+    keys = [{'partitionKey': f'thing/{i}', 'sortKey': '-'} for i in range(250)]
+    items = [{**key, 'num': i} for i, key in enumerate(keys)]
+    dynamo_client.batch_put_items(items[::2])  # only the evens exist
+
+    assert dynamo_client.batch_get_items([]) == []
+
+    # more keys than fit in one request, with duplicates, order maintained
+    resp = dynamo_client.batch_get_items(list(reversed(keys)) + keys[:3])
+    assert resp == [item if i % 2 == 0 else None for i, item in reversed(list(enumerate(items)))] + [
+        items[0],
+        None,
+        items[2],
+    ]
+
+    # as a dict
+    resp = dynamo_client.batch_get_items(keys, as_dict=True)
+    assert resp == {(item['partitionKey'], item['sortKey']): item for item in items[::2]}
+
+    # as a dict, with keys the item cache knows are missing
+    with dynamo_client.item_cache():
+        assert dynamo_client.batch_get_items(keys[:2]) == [items[0], None]
+        resp = dynamo_client.batch_get_items(keys[:2], as_dict=True)
+        assert resp == {('thing/0', '-'): items[0]}
+
+    # with a projection expression
+    resp = dynamo_client.batch_get_items(keys[:3], projection_expression='num')
+    assert resp == [items[0], None, items[2]]
+
+    # typed
+    typed_key = {'partitionKey': {'S': 'thing/0'}, 'sortKey': {'S': '-'}}
+    resp = dynamo_client.batch_get_items([typed_key], typed=True)
+    assert resp == [{**typed_key, 'num': {'N': '0'}}]
+
+
+def test_batch_get_items_retries_unprocessed_keys(dynamo_client):
+    keys = [{'partitionKey': f'thing/{i}', 'sortKey': '-'} for i in range(3)]
+    items = [{**key, 'num': i} for i, key in enumerate(keys)]
+    dynamo_client.batch_put_items(items)
+
+    # dynamo throttles us the first time through and leaves a key unprocessed
+    typed_keys = [dynamo_client.serialize_item(key) for key in keys]
+    typed_items = [dynamo_client.serialize_item(item) for item in items]
+    dynamo_client.boto3_client = Mock(
+        **{
+            'batch_get_item.side_effect': [
+                {
+                    'Responses': {'main-table': typed_items[:2]},
+                    'UnprocessedKeys': {'main-table': {'Keys': typed_keys[2:]}},
+                },
+                {'Responses': {'main-table': typed_items[2:]}},
+            ]
+        }
+    )
+    assert dynamo_client.batch_get_items(keys) == items
+    assert dynamo_client.boto3_client.batch_get_item.call_count == 2
+    assert dynamo_client.boto3_client.batch_get_item.call_args.kwargs == {
+        'RequestItems': {'main-table': {'Keys': typed_keys[2:]}}
+    }
+
+    # if it never gets processed, we error out rather than silently drop the item
+    dynamo_client.boto3_client.batch_get_item.side_effect = None
+    dynamo_client.boto3_client.batch_get_item.return_value = {
+        'Responses': {},
+        'UnprocessedKeys': {'main-table': {'Keys': typed_keys}},
+    }
+    with patch('app.clients.dynamo.time.sleep'):
+        with pytest.raises(Exception, match='unprocessed'):
+            dynamo_client.batch_get_items(keys)
+
+
+def test_batch_put_items_and_batch_delete(dynamo_client, caplog):
+    keys = [{'partitionKey': f'thing/{i}', 'sortKey': '-'} for i in range(1010)]
+    items = [{**key, 'num': i} for i, key in enumerate(keys)]
+    dynamo_client.boto3_client = Mock(wraps=dynamo_client.boto3_client)
+
+    # many chunks are written, and throughput of large writes is logged
+    assert dynamo_client.batch_put_items(item for item in items) == 1010
+    assert dynamo_client.boto3_client.batch_write_item.call_count == 41
+    assert dynamo_client.batch_get_items(keys) == items
+    assert len(caplog.records) == 1
+    assert 'batch wrote 1010 items' in caplog.records[0].msg
+
+    assert dynamo_client.batch_delete(key for key in keys[:20]) == 20
+    assert dynamo_client.boto3_client.batch_write_item.call_count == 42
+    assert dynamo_client.batch_get_items(keys[:21]) == [None] * 20 + [items[20]]
+    assert dynamo_client.batch_put_items([]) == 0
+    assert dynamo_client.boto3_client.batch_write_item.call_count == 42
+    assert len(caplog.records) == 1
+
+
+def test_batch_write_retries_unprocessed_items(dynamo_client):
+    keys = [{'partitionKey': f'thing/{i}', 'sortKey': '-'} for i in range(3)]
+    typed_requests = [{'DeleteRequest': {'Key': dynamo_client.serialize_item(key)}} for key in keys]
+
+    # dynamo throttles us the first time through and leaves an item unprocessed
+    dynamo_client.boto3_client = Mock(
+        **{
+            'batch_write_item.side_effect': [
+                {'UnprocessedItems': {'main-table': typed_requests[2:]}},
+                {'UnprocessedItems': {}},
+            ]
+        }
+    )
+    assert dynamo_client.batch_delete(keys) == 3
+    assert dynamo_client.boto3_client.batch_write_item.call_count == 2
+    assert dynamo_client.boto3_client.batch_write_item.call_args.kwargs == {
+        'RequestItems': {'main-table': typed_requests[2:]}
+    }
+
+    # if it never gets processed, we error out rather than silently drop the write
+    dynamo_client.boto3_client.batch_write_item.side_effect = None
+    dynamo_client.boto3_client.batch_write_item.return_value = {
+        'UnprocessedItems': {'main-table': typed_requests}
+    }
+    with patch('app.clients.dynamo.time.sleep'):
+        with pytest.raises(Exception, match='unprocessed'):
+            dynamo_client.batch_delete(keys)
+
+
+def test_query_fields_and_keys_only(dynamo_client):
+    items = [{'partitionKey': 'thing/1', 'sortKey': f'sub/{i}', 'name': f'n{i}', 'count': i} for i in range(3)]
+    dynamo_client.batch_put_items(items)
+    query_kwargs = {
+        'KeyConditionExpression': '#pk = :pk',
+        'ExpressionAttributeNames': {'#pk': 'partitionKey'},
+        'ExpressionAttributeValues': {':pk': 'thing/1'},
+    }
+    assert list(dynamo_client.generate_all_query(query_kwargs)) == items
+
+    # fields may be reserved words
+    resp = list(dynamo_client.generate_all_query(query_kwargs, fields=['name', 'count']))
+    assert resp == [{'name': item['name'], 'count': item['count']} for item in items]
+    resp = dynamo_client.query(query_kwargs, limit=2, fields=['name'])
+    assert resp['items'] == [{'name': 'n0'}, {'name': 'n1'}]
+    assert resp['nextToken']
+
+    keys = [{'partitionKey': item['partitionKey'], 'sortKey': item['sortKey']} for item in items]
+    assert list(dynamo_client.generate_all_query(query_kwargs, keys_only=True)) == keys
+    assert dynamo_client.key_names == ['partitionKey', 'sortKey']
+
+    with pytest.raises(AssertionError):
+        list(dynamo_client.generate_all_query(query_kwargs, fields=['name'], keys_only=True))
+    with pytest.raises(AssertionError):
+        list(
+            dynamo_client.generate_all_query({**query_kwargs, 'ProjectionExpression': 'sortKey'}, fields=['name'])
+        )
+
+
+def test_counter_deltas(dynamo_client, item, key, caplog):
+    other_key = {'partitionKey': f'thing/{uuid.uuid4()}', 'sortKey': '-'}
+    dynamo_client.add_item({'Item': {**other_key, 'num': 3}})
+    dynamo_client.table = Mock(wraps=dynamo_client.table)
+
+    # changes are summed per counter and not written until flushed
+    deltas = {}
+    with dynamo_client.counter_deltas(deltas):
+        for _ in range(100):
+            assert dynamo_client.increment_count(key, 'count') is None
+        assert dynamo_client.decrement_count(key, 'count') is None
+        assert dynamo_client.decrement_count(other_key, 'num') is None
+        assert dynamo_client.increment_count(other_key, 'num') is None
+        with dynamo_client.counter_deltas(None):
+            assert dynamo_client.increment_count(other_key, 'other')['other'] == 1
+    assert dynamo_client.table.update_item.call_count == 1
+    assert deltas == {(key['partitionKey'], '-', 'count'): 99, (other_key['partitionKey'], '-', 'num'): 0}
+    assert dynamo_client.get_item(key)['count'] == 1
+
+    dynamo_client.flush_counts(deltas)
+    assert deltas == {}
+    assert dynamo_client.table.update_item.call_count == 2
+    assert dynamo_client.get_item(key)['count'] == 100
+    assert dynamo_client.get_item(other_key)['num'] == 3
+
+    # decrements are applied in full if they can be, else they stop at zero as they would have one by one
+    dynamo_client.flush_counts({(key['partitionKey'], '-', 'count'): -98})
+    assert dynamo_client.get_item(key)['count'] == 2
+    assert dynamo_client.table.update_item.call_count == 3
+    dynamo_client.flush_counts({(key['partitionKey'], '-', 'count'): -5})
+    assert dynamo_client.get_item(key)['count'] == 0
+    assert dynamo_client.table.update_item.call_count == 5
+    assert len(caplog.records) == 0
+
+    # a counter that isn't there is not decremented, and takes one write to find out
+    dynamo_client.flush_counts({(key['partitionKey'], '-', 'missing'): -5})
+    assert 'missing' not in dynamo_client.get_item(key)
+    assert dynamo_client.table.update_item.call_count == 7
+    assert len(caplog.records) == 1
+    assert 'Failed to decrement missing' in caplog.records[0].msg
+
+    # an error writing one counter does not stop the others from being written
+    caplog.clear()
+    deltas = {(key['partitionKey'], '-', 'count'): 2, (other_key['partitionKey'], '-', 'num'): 2}
+    with patch.object(dynamo_client, 'add_to_count', side_effect=[Exception('broken'), None]) as add_to_count:
+        dynamo_client.flush_counts(deltas)
+    assert deltas == {}
+    assert add_to_count.call_count == 2
+    assert len(caplog.records) == 1
+    assert caplog.records[0].levelname == 'ERROR'
+    assert 'Failed to add 2 to count' in caplog.records[0].msg
+
+
+@pytest.mark.parametrize('total_segments', [None, 1, 3])
+def test_generate_all_scan(dynamo_client, total_segments):
+    items = [{'partitionKey': f'thing/{i}', 'sortKey': '-', 'num': i} for i in range(20)]
+    dynamo_client.batch_put_items(items)
+    scan_kwargs = {'Limit': 3}  # force pagination
+
+    checkpoint = {}
+    resp = list(
+        dynamo_client.generate_all_scan(scan_kwargs, total_segments=total_segments, checkpoint=checkpoint)
+    )
+    assert sorted(resp, key=lambda item: item['num']) == items
+    assert checkpoint == {str(segment): None for segment in range(total_segments or 1)}
+
+    # a finished scan has nothing left to resume
+    assert list(dynamo_client.generate_all_scan(scan_kwargs, total_segments, checkpoint)) == []
+
+
+@pytest.mark.parametrize('total_segments', [None, 3])
+def test_generate_all_scan_resume_from_checkpoint(dynamo_client, total_segments):
+    items = [{'partitionKey': f'thing/{i}', 'sortKey': '-', 'num': i} for i in range(20)]
+    dynamo_client.batch_put_items(items)
+    scan_kwargs = {'Limit': 3}  # force pagination
+
+    # stop part way through the scan
+    checkpoint = {}
+    generator = dynamo_client.generate_all_scan(scan_kwargs, total_segments=total_segments, checkpoint=checkpoint)
+    first_items = [next(generator) for _ in range(10)]
+    generator.close()
+    assert checkpoint
+
+    # resume, everything not covered by the checkpoint gets picked up
+    rest_items = list(dynamo_client.generate_all_scan(scan_kwargs, total_segments, checkpoint))
+    nums = [item['num'] for item in first_items + rest_items]
+    assert sorted(set(nums)) == list(range(20))
+    # items from pages that were only partially consumed may be repeated, but never more than a page's worth
+    assert len(nums) - 20 < 3 * (total_segments or 1)
+
+
+@pytest.mark.parametrize('total_segments', [None, 3])
+def test_generate_all_scan_pages(dynamo_client, total_segments):
+    items = [{'partitionKey': f'thing/{i}', 'sortKey': '-', 'num': i} for i in range(20)]
+    dynamo_client.batch_put_items(items)
+    scan_kwargs = {'Limit': 3}  # force pagination
+
+    checkpoint = {}
+    pages = list(
+        dynamo_client.generate_all_scan_pages(scan_kwargs, total_segments=total_segments, checkpoint=checkpoint)
+    )
+    assert len(pages) >= 7
+    assert all(len(page) <= 3 for page in pages)
+    assert sorted((item for page in pages for item in page), key=lambda item: item['num']) == items
+    assert checkpoint == {str(segment): None for segment in range(total_segments or 1)}
+
+
+def test_generate_all_scan_raises_segment_errors(dynamo_client):
+    dynamo_client.table = Mock(**{'scan.side_effect': Exception('nope')})
+    with pytest.raises(Exception, match='nope'):
+        list(dynamo_client.generate_all_scan({}, total_segments=2))
+
+
+def test_usage_tracking_disabled_by_default(dynamo_client, item, key, caplog):
+    dynamo_client.table = Mock(wraps=dynamo_client.table)
+    with dynamo_client.usage_tracking(label='Type.field'):
+        dynamo_client.get_item(key)
+    assert 'ReturnConsumedCapacity' not in dynamo_client.table.get_item.call_args.kwargs
+    assert len(caplog.records) == 0
+
+
+def test_usage_tracking(dynamo_client, item, key, caplog):
+    dynamo_client.track_usage = True
+    dynamo_client.table = Mock(wraps=dynamo_client.table)
+
+    # not tracking outside of the context
+    dynamo_client.get_item(key)
+    assert 'ReturnConsumedCapacity' not in dynamo_client.table.get_item.call_args.kwargs
+
+    consumed_capacity = {
+        'TableName': 'main-table',
+        'CapacityUnits': 3.0,
+        'Table': {'CapacityUnits': 1.0},
+        'GlobalSecondaryIndexes': {'GSI-A1': {'CapacityUnits': 2.0}},
+    }
+    with dynamo_client.usage_tracking(label='Type.field'):
+        dynamo_client.get_item(key)
+        assert dynamo_client.table.get_item.call_args.kwargs['ReturnConsumedCapacity'] == 'INDEXES'
+
+        dynamo_client.table.update_item = Mock(return_value={'ConsumedCapacity': consumed_capacity})
+        dynamo_client.increment_count(key, 'count')
+        dynamo_client.increment_count(key, 'count')
+
+        with dynamo_client.usage_label('listener'):
+            dynamo_client.batch_get_items([key])
+        assert len(caplog.records) == 0
+
+    assert len(caplog.records) == 1
+    assert caplog.records[0].levelname == 'INFO'
+    assert 'main-table' in caplog.records[0].msg
+    usage = caplog.records[0].dynamo_usage
+    assert [(u['label'], u['operation'], u['calls']) for u in usage] == [
+        ('Type.field', 'get_item', 1),
+        ('Type.field', 'update_item', 2),
+        ('listener', 'batch_get_item', 1),
+    ]
+    assert usage[1]['capacityUnits'] == {'table': 2.0, 'GSI-A1': 4.0}
+    assert all(u['seconds'] >= 0 for u in usage)
+
+
+def test_throttled_calls_retried_and_counted(dynamo_client, item, key, caplog):
+    throttle_error = dynamo_client.exceptions.ProvisionedThroughputExceededException(
+        {'Error': {'Code': 'ProvisionedThroughputExceededException'}, 'ResponseMetadata': {'RetryAttempts': 2}},
+        'GetItem',
+    )
+    get_item = dynamo_client.table.get_item
+    dynamo_client.table = Mock(wraps=dynamo_client.table)
+    dynamo_client.table.get_item.side_effect = [throttle_error, get_item(Key=key)]
+    with patch('app.clients.dynamo.time.sleep') as sleep_mock:
+        assert dynamo_client.get_item(key) == item
+    assert dynamo_client.table.get_item.call_count == 2
+    assert sleep_mock.call_count == 1
+    assert dynamo_client.throttle_counts == {'get_item': 3}
+    assert len(caplog.records) == 1
+    assert 'throttled' in caplog.records[0].msg
+
+    # gives up eventually
+    dynamo_client.table.get_item.side_effect = throttle_error
+    with patch('app.clients.dynamo.time.sleep'):
+        with pytest.raises(dynamo_client.exceptions.ProvisionedThroughputExceededException):
+            dynamo_client.get_item(key)
+    assert dynamo_client.table.get_item.call_count == 2 + dynamo_client.throttle_max_attempts
+
+    # other errors are not retried
+    dynamo_client.table.update_item = Mock(
+        side_effect=dynamo_client.exceptions.ConditionalCheckFailedException({}, 'UpdateItem')
+    )
+    with pytest.raises(dynamo_client.exceptions.ConditionalCheckFailedException):
+        dynamo_client.update_item(
+            {'Key': key, 'UpdateExpression': 'SET a = :a', 'ExpressionAttributeValues': {':a': 1}}
+        )
+    assert dynamo_client.table.update_item.call_count == 1
+
+
+def test_write_rate_limit(dynamo_client, key):
+    with patch('app.clients.dynamo.TokenBucket') as bucket_cls_mock:
+        with dynamo_client.write_rate_limit(10, 'thing'):
+            bucket_cls_mock.assert_called_once_with(10)
+            dynamo_client.add_item({'Item': key})
+            dynamo_client.set_attributes(key, a=1)
+            dynamo_client.batch_put_items([{'partitionKey': 'thing/2', 'sortKey': '-'}])
+            assert bucket_cls_mock.return_value.acquire.call_count == 3
+
+            # other partition key prefixes are not limited, nor are reads
+            dynamo_client.add_item({'Item': {'partitionKey': 'other/1', 'sortKey': '-'}})
+            dynamo_client.get_item(key)
+            assert bucket_cls_mock.return_value.acquire.call_count == 3
+
+    # limit goes away with the context
+    assert dynamo_client.write_rate_limits == {}
+    dynamo_client.delete_item(key)
+    assert bucket_cls_mock.return_value.acquire.call_count == 3
+
+
+def test_add_to_set(dynamo_client, key):
+    # creates the item if need be
+    dynamo_client.add_to_set(key, 'labels', ['a'], num=1)
+    assert dynamo_client.get_item(key) == {**key, 'labels': {'a'}, 'num': 1}
+
+    # values already in the set change nothing, and the item cache is kept coherent
+    with dynamo_client.item_cache():
+        dynamo_client.get_item(key)
+        dynamo_client.add_to_set(key, 'labels', ['a', 'b'])
+        assert dynamo_client.get_item(key) == {**key, 'labels': {'a', 'b'}, 'num': 1}
@@ -0,0 +1,61 @@
+import json
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+from app.clients import LocalQueueClient, SqsClient
+
+
+@pytest.fixture
+def sqs_client():
+    sqs_client = SqsClient('https://sqs.us-east-1.amazonaws.com/123456789012/test-queue')
+    sqs_client.boto_client = Mock(sqs_client.boto_client, **{'send_message_batch.return_value': {}})
+    yield sqs_client
+
+
+def test_send_messages(sqs_client):
+    sqs_client.send_messages([])
+    assert sqs_client.boto_client.send_message_batch.mock_calls == []
+
+    # more than fit in one batch
+    bodies = [{'job': i, 'nextToken': None} for i in range(25)]
+    sqs_client.send_messages(bodies)
+    calls = sqs_client.boto_client.send_message_batch.call_args_list
+    assert [len(c[1]['Entries']) for c in calls] == [10, 10, 5]
+    assert all(c[1]['QueueUrl'] == sqs_client.queue_url for c in calls)
+    entries = [entry for c in calls for entry in c[1]['Entries']]
+    assert len({entry['Id'] for entry in entries}) == 25
+    assert [json.loads(entry['MessageBody']) for entry in entries] == bodies
+
+
+def test_send_messages_failed(sqs_client):
+    sqs_client.boto_client.send_message_batch.return_value = {'Failed': [{'Id': '0'}]}
+    with pytest.raises(Exception, match='Failed to send 1 messages'):
+        sqs_client.send_messages([{'job': 0}])
+
+
+def test_local_queue_drain():
+    queue_client = LocalQueueClient()
+    assert queue_client.drain(lambda body: None) == 0
+
+    # callbacks may queue more messages, which are drained too
+    seen, lock = [], threading.Lock()
+
+    def callback(body):
+        with lock:
+            seen.append(body['count'])
+        if body['count']:
+            queue_client.send_messages([{'count': body['count'] - 1}] * 2)
+
+    queue_client.send_messages([{'count': 2}])
+    assert queue_client.drain(callback, max_workers=3) == 7
+    assert sorted(seen) == [0, 0, 0, 0, 1, 1, 2]
+    assert len(queue_client.messages) == 0
+
+
+def test_local_queue_drain_raises():
+    queue_client = LocalQueueClient()
+    queue_client.send_messages([{'a': 1}])
+    with pytest.raises(ZeroDivisionError):
+        queue_client.drain(lambda body: 1 / 0)
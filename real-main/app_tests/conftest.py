@@ -1,5 +1,6 @@
 import base64
 import uuid
+import zlib
 from os import path
 from unittest import mock
 
@@ -9,7 +10,7 @@ import pytest
 from app import clients, models
 from app.models.card.templates import CardTemplate
 
-from .dynamodb.table_schema import feed_table_schema, main_table_schema
+from .dynamodb.table_schema import feed_table_schema, main_table_schema, stream_ledger_table_schema
 
 heic_path = path.join(path.dirname(__file__), 'fixtures', 'IMG_0265.HEIC')
 grant_path = path.join(path.dirname(__file__), 'fixtures', 'grant.jpg')
@@ -104,13 +105,31 @@ def cognito_client():
         yield cognito_client
 
 
+def segmented_scan(scan):
+    "moto ignores Segment and TotalSegments, so emulate them by hashing partition keys"
+
+    def wrapper(Segment=None, TotalSegments=None, **kwargs):
+        resp = scan(**kwargs)
+        if TotalSegments:
+            resp['Items'] = [
+                item
+                for item in resp['Items']
+                if zlib.crc32(item['partitionKey'].encode('utf-8')) % TotalSegments == Segment
+            ]
+        return resp
+
+    return wrapper
+
+
 @pytest.fixture
 def dynamo_clients():
     with moto.mock_dynamodb2():
-        yield (
+        dynamo_clients = (
             clients.DynamoClient(table_name='main-table', create_table_schema=main_table_schema),
             clients.DynamoClient(table_name='feed-table', create_table_schema=feed_table_schema),
         )
+        dynamo_clients[0].table.scan = segmented_scan(dynamo_clients[0].table.scan)
+        yield dynamo_clients
 
 
 @pytest.fixture
@@ -123,6 +142,11 @@ def dynamo_feed_client(dynamo_clients):
     yield dynamo_clients[1]
 
 
+@pytest.fixture
+def dynamo_stream_ledger_client(dynamo_clients):
+    yield clients.DynamoClient(table_name='stream-ledger-table', create_table_schema=stream_ledger_table_schema)
+
+
 @pytest.fixture
 def elasticsearch_client():
     yield mock.Mock(clients.ElasticSearchClient(domain='my-es-domain.com'))
@@ -225,7 +249,12 @@ def comment_manager(dynamo_client, user_manager, appsync_client):
 @pytest.fixture
 def feed_manager(appsync_client, dynamo_client, dynamo_feed_client):
     yield models.FeedManager(
-        {'appsync': appsync_client, 'dynamo': dynamo_client, 'dynamo_feed': dynamo_feed_client}
+        {
+            'appsync': appsync_client,
+            'dynamo': dynamo_client,
+            'dynamo_feed': dynamo_feed_client,
+            'sqs_feed_fan_out': clients.LocalQueueClient(),
+        }
     )
 
 
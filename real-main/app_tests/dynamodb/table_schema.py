@@ -116,3 +116,15 @@ feed_table_schema = {
         {'AttributeName': 'feedUserId', 'AttributeType': 'S'},
     ],
 }
+
+
+stream_ledger_table_schema = {
+    'KeySchema': [
+        {'AttributeName': 'partitionKey', 'KeyType': 'HASH'},
+        {'AttributeName': 'sortKey', 'KeyType': 'RANGE'},
+    ],
+    'AttributeDefinitions': [
+        {'AttributeName': 'partitionKey', 'AttributeType': 'S'},
+        {'AttributeName': 'sortKey', 'AttributeType': 'S'},
+    ],
+}
@@ -1,3 +1,5 @@
+import contextlib
+
 import pytest
 
 from app.handlers.appsync import routes
@@ -36,3 +38,25 @@ def test_discover():
         'Type.field1': mock_handlers.handler_1,
         'Type.field2': mock_handlers.handler_2,
     }
+
+
+def test_invocation_context():
+    entered = []
+
+    @contextlib.contextmanager
+    def my_context(field):
+        entered.append(f'in {field}')
+        yield
+        entered.append(f'out {field}')
+
+    with routes.invocation_context('Type.field'):
+        pass
+    assert entered == []
+
+    routes.register_invocation_context(my_context)
+    with routes.invocation_context('Type.field'):
+        assert entered == ['in Type.field']
+    assert entered == ['in Type.field', 'out Type.field']
+
+    routes.clear()
+    assert routes.invocation_contexts == []
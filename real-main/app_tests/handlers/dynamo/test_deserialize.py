@@ -0,0 +1,76 @@
+import base64
+import json
+from os import path
+from unittest.mock import patch
+
+import pytest
+from boto3.dynamodb.types import Binary, TypeDeserializer
+
+from app.handlers.dynamo.deserialize import LazyImage, deserialize
+
+records_path = path.join(path.dirname(__file__), '..', '..', 'fixtures', 'dynamo-stream-records.jsonl')
+
+
+@pytest.fixture
+def records():
+    with open(records_path, encoding='utf-8') as fh:
+        yield [json.loads(line) for line in fh]
+
+
+def test_deserialize_matches_type_deserializer(records):
+    type_deserialize = TypeDeserializer().deserialize
+    typed_values = [
+        typed_value
+        for record in records
+        for image_name in ('Keys', 'OldImage', 'NewImage')
+        for typed_value in record['dynamodb'].get(image_name, {}).values()
+    ]
+    typed_values += [
+        {'SS': ['a', 'b']},
+        {'NS': ['1', '2.5']},
+        {'NULL': True},
+        {'L': [{'N': '1'}, {'S': 'a'}, {'M': {'b': {'BOOL': True}}}]},
+        {'B': b'abc'},
+        {'BS': [b'x', b'y']},
+    ]
+    for typed_value in typed_values:
+        value = deserialize(typed_value)
+        expected = type_deserialize(typed_value)
+        assert value == expected
+        assert type(value) is type(expected)
+
+
+def test_deserialize_base64_encoded_binary():
+    # lambda delivers binary values base64 encoded, which TypeDeserializer does not handle
+    assert deserialize({'B': base64.b64encode(b'abc').decode()}) == Binary(b'abc')
+    assert deserialize({'BS': [base64.b64encode(b'x').decode()]}) == {Binary(b'x')}
+
+
+def test_deserialize_rejects_bad_values():
+    with pytest.raises(TypeError, match='not supported'):
+        deserialize({'X': 'y'})
+    with pytest.raises(TypeError):
+        deserialize({})
+
+
+def test_lazy_image(records):
+    typed_item = records[0]['dynamodb']['NewImage']
+    image = LazyImage(typed_item)
+    assert len(image) == len(typed_item)
+    assert list(image) == list(typed_item)
+    assert bool(image) is True
+    assert bool(LazyImage()) is False
+    assert bool(LazyImage(None)) is False
+
+    with patch('app.handlers.dynamo.deserialize.deserialize', wraps=deserialize) as deserialize_mock:
+        # attributes are deserialized only when read, and only once
+        assert image.get('followerCount') == 58
+        assert image['followerCount'] == 58
+        assert image.get('notThere', 'default') == 'default'
+        assert 'followerCount' in image
+        assert 'notThere' not in image
+        assert deserialize_mock.call_count == 1
+
+        item = image.to_dict()
+        assert item == {k: TypeDeserializer().deserialize(v) for k, v in typed_item.items()}
+        assert image.deserialized == item
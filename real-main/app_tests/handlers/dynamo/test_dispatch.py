@@ -0,0 +1,210 @@
+import functools
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from app.handlers.dynamo.deserialize import LazyImage
+from app.handlers.dynamo.dispatch import DynamoDispatch, listener_name
+
+
+def test_dynamo_dispatch_pk_sk_prefixes():
+    dispatch = DynamoDispatch()
+
+    f1 = Mock()
+    dispatch.register('pkpre1', 'skpre1', ['INSERT'], f1)
+    assert dispatch.search('pkpre2', 'skpre1', 'INSERT', {}, {}) == []
+    assert dispatch.search('pkpre1', 'skpre2', 'INSERT', {}, {}) == []
+    assert dispatch.search('pkpre1', 'skpre1', 'INSERT', {}, {}) == [f1]
+
+    f2 = Mock()
+    dispatch.register('pkpre1', 'skpre2', ['INSERT'], f2)
+    assert dispatch.search('pkpre2', 'skpre1', 'INSERT', {}, {}) == []
+    assert dispatch.search('pkpre1', 'skpre2', 'INSERT', {}, {}) == [f2]
+    assert dispatch.search('pkpre1', 'skpre1', 'INSERT', {}, {}) == [f1]
+
+    f3 = Mock()
+    dispatch.register('pkpre1', 'skpre2', ['INSERT'], f3)
+    assert dispatch.search('pkpre2', 'skpre1', 'INSERT', {}, {}) == []
+    assert dispatch.search('pkpre1', 'skpre2', 'INSERT', {}, {}) == [f2, f3]
+    assert dispatch.search('pkpre1', 'skpre1', 'INSERT', {}, {}) == [f1]
+
+    f4 = Mock()
+    dispatch.register('pkpre4', 'skpre2', ['INSERT'], f4)
+    assert dispatch.search('pkpre2', 'skpre1', 'INSERT', {}, {}) == []
+    assert dispatch.search('pkpre1', 'skpre2', 'INSERT', {}, {}) == [f2, f3]
+    assert dispatch.search('pkpre1', 'skpre1', 'INSERT', {}, {}) == [f1]
+
+
+def test_dynamo_dispatch_event_names():
+    dispatch = DynamoDispatch()
+
+    f1 = Mock()
+    dispatch.register('pkpre', 'skpre', ['INSERT'], f1)
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == [f1]
+    assert dispatch.search('pkpre', 'skpre', 'MODIFY', {}, {}) == []
+    assert dispatch.search('pkpre', 'skpre', 'REMOVE', {}, {}) == []
+
+    f2 = Mock()
+    dispatch.register('pkpre', 'skpre', ['INSERT', 'MODIFY'], f2)
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == [f1, f2]
+    assert dispatch.search('pkpre', 'skpre', 'MODIFY', {}, {}) == [f2]
+    assert dispatch.search('pkpre', 'skpre', 'REMOVE', {}, {}) == []
+
+    f3 = Mock()
+    dispatch.register('pkpre', 'skpre', ['INSERT', 'MODIFY', 'REMOVE'], f3)
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == [f1, f2, f3]
+    assert dispatch.search('pkpre', 'skpre', 'MODIFY', {}, {}) == [f2, f3]
+    assert dispatch.search('pkpre', 'skpre', 'REMOVE', {}, {}) == [f3]
+
+    f4 = Mock()
+    dispatch.register('pkpre', 'skpre', ['MODIFY', 'REMOVE'], f4)
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == [f1, f2, f3]
+    assert dispatch.search('pkpre', 'skpre', 'MODIFY', {}, {}) == [f2, f3, f4]
+    assert dispatch.search('pkpre', 'skpre', 'REMOVE', {}, {}) == [f3, f4]
+
+    f5 = Mock()
+    dispatch.register('pkpre', 'skpre', ['REMOVE'], f5)
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == [f1, f2, f3]
+    assert dispatch.search('pkpre', 'skpre', 'MODIFY', {}, {}) == [f2, f3, f4]
+    assert dispatch.search('pkpre', 'skpre', 'REMOVE', {}, {}) == [f3, f4, f5]
+
+
+def test_dynamo_dispatch_attributes():
+    dispatch = DynamoDispatch()
+
+    f1 = Mock()
+    dispatch.register('pkpre', 'skpre', ['INSERT'], f1, {'k1': 0})
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == []
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {'k1': 0}) == []
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k1': 0}, {}) == []
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k1': 0}, {'k1': 0}) == []
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k1': 0}, {'k1': 2}) == [f1]
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k1': 4}, {}) == [f1]
+
+    f2 = Mock()
+    dispatch.register('pkpre', 'skpre', ['INSERT'], f2, {'k1': 0, 'k2': None})
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == []
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {'k2': None}) == []
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k2': 'yup'}, {}) == [f2]
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k1': 0}, {'k1': 0}) == []
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k1': 0}, {'k1': 2}) == [f1, f2]
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k1': 4}, {}) == [f1, f2]
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k1': 4}, {'k2': 'arg'}) == [f1, f2]
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k1': 4}, {'k2': 0}) == [f1, f2]
+
+    f3 = Mock()
+    dispatch.register('pkpre', 'skpre', ['INSERT'], f3, {'k3': 'd'})
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == []
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {'k3': 'd'}) == []
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k3': ''}, {}) == [f3]
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {'k3': 42}, {}) == [f3]
+
+
+def test_dynamo_dispatch_attributes_of_stream_images():
+    dispatch = DynamoDispatch()
+    f1, f2, f3 = Mock(), Mock(), Mock()
+    dispatch.register('pkpre', 'skpre', ['MODIFY'], f1, {'k1': 0})
+    dispatch.register('pkpre', 'skpre', ['MODIFY'], f2, {'k1': 0, 'k2': None})
+    dispatch.register('pkpre', 'skpre', ['MODIFY'], f3)
+
+    def search(old_item, new_item):
+        old_image = LazyImage({k: {'N': str(v)} for k, v in old_item.items()})
+        new_image = LazyImage({k: {'N': str(v)} for k, v in new_item.items()})
+        return dispatch.search('pkpre', 'skpre', 'MODIFY', old_image, new_image)
+
+    assert search({}, {}) == [f3]
+    assert search({'k1': 1, 'k2': 2}, {'k1': 1, 'k2': 2}) == [f3]
+    assert search({}, {'k1': 0}) == [f3]  # same as the default
+    assert search({'k1': 0}, {'k1': 1}) == [f1, f2, f3]
+    assert search({'k1': 1}, {'k1': 1.0}) == [f3]  # different typed values, same values
+    assert search({'k2': 1}, {'k2': 2}) == [f2, f3]
+
+
+def test_listener_name():
+    class Manager:
+        def on_thing(self, a, b=None):
+            pass
+
+        on_other_thing = functools.partialmethod(on_thing, 'attr', b=1)
+
+    manager = Manager()
+    assert listener_name(manager.on_thing) == 'test_listener_name.<locals>.Manager.on_thing'
+    assert listener_name(manager.on_other_thing) == "test_listener_name.<locals>.Manager.on_thing('attr', b=1)"
+    assert listener_name(Mock(__qualname__='mocked')) == 'mocked'
+
+
+def test_dynamo_dispatch_after():
+    dispatch = DynamoDispatch()
+
+    f1, f2, f3 = Mock(), Mock(), Mock()
+    dispatch.register('pkpre', 'skpre', ['INSERT'], f1)
+    dispatch.register('pkpre', 'skpre', ['INSERT'], f2, after=[f1])
+    assert dispatch.prerequisites == {f2: [f1]}
+    assert dispatch.coalesced == set()
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == [f1, f2]
+
+    # prerequisites must already be registered, which rules out cycles
+    with pytest.raises(AssertionError, match='is not registered'):
+        dispatch.register('pkpre', 'skpre', ['INSERT'], f3, after=[Mock(__qualname__='unregistered')])
+
+
+def test_dynamo_dispatch_coalesce_and_defer_counts():
+    dispatch = DynamoDispatch()
+
+    f1, f2 = Mock(), Mock()
+    dispatch.register('pkpre', 'skpre', ['INSERT'], f1)
+    dispatch.register('pkpre', 'skpre', ['INSERT'], f2, coalesce=True, defer_counts=True)
+    assert dispatch.coalesced == {f2}
+    assert dispatch.deferring_counts == {f2}
+    assert dispatch.search('pkpre', 'skpre', 'INSERT', {}, {}) == [f1, f2]
+
+
+def test_dynamo_dispatch_accepts_and_filter_criteria():
+    dispatch = DynamoDispatch()
+    assert dispatch.filter_criteria() == {'Filters': []}
+
+    def record(event_name, pk, sk):
+        return {'eventName': event_name, 'dynamodb': {'Keys': {'partitionKey': {'S': pk}, 'sortKey': {'S': sk}}}}
+
+    f1, f2, f3 = Mock(), Mock(), Mock()
+    dispatch.register('post', '-', ['INSERT'], f1)
+    dispatch.register('post', 'flag', ['INSERT', 'REMOVE'], f2)
+    assert dispatch.accepts(record('INSERT', 'post/pid', '-'))
+    assert dispatch.accepts(record('REMOVE', 'post/pid', 'flag/uid'))
+    assert not dispatch.accepts(record('MODIFY', 'post/pid', '-'))
+    assert not dispatch.accepts(record('INSERT', 'post/pid', 'trending'))
+    assert not dispatch.accepts(record('INSERT', 'user/pid', '-'))
+
+    # coalescing needs all of an item's records, whatever their event
+    dispatch.register('user', 'profile', ['MODIFY'], f3, coalesce=True)
+    assert dispatch.accepts(record('INSERT', 'user/uid', 'profile'))
+    assert dispatch.accepts(record('REMOVE', 'user/uid', 'profile'))
+
+    patterns = [json.loads(f['Pattern']) for f in dispatch.filter_criteria()['Filters']]
+    assert patterns == [
+        {
+            'eventName': ['INSERT'],
+            'dynamodb': {
+                'Keys': {'partitionKey': {'S': [{'prefix': 'post/'}]}, 'sortKey': {'S': ['-', {'prefix': '-/'}]}}
+            },
+        },
+        {
+            'eventName': ['INSERT', 'REMOVE'],
+            'dynamodb': {
+                'Keys': {
+                    'partitionKey': {'S': [{'prefix': 'post/'}]},
+                    'sortKey': {'S': ['flag', {'prefix': 'flag/'}]},
+                }
+            },
+        },
+        {
+            'eventName': ['INSERT', 'MODIFY', 'REMOVE'],
+            'dynamodb': {
+                'Keys': {
+                    'partitionKey': {'S': [{'prefix': 'user/'}]},
+                    'sortKey': {'S': ['profile', {'prefix': 'profile/'}]},
+                }
+            },
+        },
+    ]
@@ -0,0 +1,42 @@
+import pendulum
+import pytest
+
+from app.handlers.dynamo.ledger import StreamLedger
+
+
+@pytest.fixture
+def ledger(dynamo_stream_ledger_client):
+    yield StreamLedger(dynamo_stream_ledger_client)
+
+
+def test_put_get_delete_entries(ledger):
+    assert ledger.get_entries(['e1', 'e2']) == {}
+
+    ledger.put_entries(
+        {'e1': {'done': {'f1', 'f2'}, 'failedAttempts': 1}, 'e2': {'done': set(), 'failedAttempts': 2}}
+    )
+    assert ledger.get_entries(['e1', 'e2', 'e3']) == {
+        'e1': {'done': {'f1', 'f2'}, 'failedAttempts': 1},
+        'e2': {'done': set(), 'failedAttempts': 2},
+    }
+
+    ledger.put_entries({'e1': {'done': {'f1'}, 'failedAttempts': 2}})
+    assert ledger.get_entries(['e1']) == {'e1': {'done': {'f1'}, 'failedAttempts': 2}}
+
+    ledger.delete_entries(['e1', 'e3'])
+    assert ledger.get_entries(['e1', 'e2']) == {'e2': {'done': set(), 'failedAttempts': 2}}
+
+
+def test_mark_done(ledger):
+    before = pendulum.now('utc').int_timestamp
+    ledger.mark_done('e1', ['f1'])
+    ledger.mark_done('e1', ['f1', 'f2'])
+    assert ledger.get_entries(['e1']) == {'e1': {'done': {'f1', 'f2'}, 'failedAttempts': 0}}
+
+    # entries expire once the record can no longer be delivered again
+    item = ledger.client.get_item(ledger.pk('e1'))
+    assert before + 2 * 24 * 3600 <= item['expiresAtEpoch'] <= pendulum.now('utc').int_timestamp + 2 * 24 * 3600
+
+    ledger.put_entries({'e1': {'done': {'f1'}, 'failedAttempts': 1}})
+    ledger.mark_done('e1', ['f3'])
+    assert ledger.get_entries(['e1']) == {'e1': {'done': {'f1', 'f3'}, 'failedAttempts': 1}}
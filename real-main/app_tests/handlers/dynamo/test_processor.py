@@ -0,0 +1,384 @@
+import itertools
+import json
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.clients import AppSyncClient
+from app.handlers.dynamo.dispatch import DynamoDispatch
+from app.handlers.dynamo.ledger import StreamLedger
+from app.handlers.dynamo.processor import DynamoStreamProcessor
+from app.handlers.dynamo.telemetry import ListenerTelemetry
+
+sequence_numbers = itertools.count(1000)
+
+
+def build_record(event_name, pk, sk, old_item=None, new_item=None):
+    sequence_number = str(next(sequence_numbers))
+    dynamodb = {'Keys': {'partitionKey': {'S': pk}, 'sortKey': {'S': sk}}, 'SequenceNumber': sequence_number}
+    if old_item:
+        dynamodb['OldImage'] = {k: {'S': v} for k, v in old_item.items()}
+    if new_item:
+        dynamodb['NewImage'] = {k: {'S': v} for k, v in new_item.items()}
+    return {'eventID': f'event-{sequence_number}', 'eventName': event_name, 'dynamodb': dynamodb}
+
+
+@pytest.fixture
+def dispatch():
+    yield DynamoDispatch()
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_process_records_runs_listeners(dispatch, dynamo_client, max_workers, caplog):
+    f1, f2 = Mock(__qualname__='f1'), Mock(__qualname__='f2', side_effect=Exception('f2 failed'))
+    f3 = Mock(__qualname__='f3')
+    dispatch.register('post', '-', ['INSERT', 'MODIFY'], f1)
+    dispatch.register('post', '-', ['MODIFY'], f2)
+    dispatch.register('post', '-', ['MODIFY'], f3, {'status': None})
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], max_workers=max_workers)
+
+    records = [
+        build_record('INSERT', 'post/pid1', '-', new_item={'status': 'a'}),
+        build_record('MODIFY', 'post/pid2', '-', old_item={'status': 'a'}, new_item={'status': 'a'}),
+        build_record('REMOVE', 'post/pid1', '-', old_item={'status': 'a'}),
+        build_record('INSERT', 'user/uid', 'profile', new_item={'status': 'a'}),
+    ]
+    resp = processor.process_records(records)
+    assert resp == {'batchItemFailures': [{'itemIdentifier': records[1]['dynamodb']['SequenceNumber']}]}
+    assert f1.call_count == 2
+    f1.assert_any_call('pid1', new_item={'status': 'a'})
+    f1.assert_any_call('pid2', old_item={'status': 'a'}, new_item={'status': 'a'})
+    f2.assert_called_once_with('pid2', old_item={'status': 'a'}, new_item={'status': 'a'})
+    assert f3.call_count == 0
+
+    # an error in one listener is logged and does not stop the others
+    errors = [rec for rec in caplog.records if rec.levelname == 'ERROR']
+    assert len(errors) == 1
+    assert errors[0].msg == 'f2 failed'
+
+
+def test_process_records_concurrently_keeps_order_of_item_records(dispatch, dynamo_client):
+    calls, active, max_active = [], set(), []
+    lock = threading.Lock()
+
+    def listener(item_id, new_item):
+        with lock:
+            active.add(item_id)
+            max_active.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.discard(item_id)
+            calls.append((item_id, new_item['v']))
+
+    dispatch.register('post', '-', ['INSERT'], listener)
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], max_workers=4)
+    records = [build_record('INSERT', f'post/pid{i % 3}', '-', new_item={'v': str(i)}) for i in range(9)]
+    processor.process_records(records)
+
+    # records of different items were processed concurrently, those of the same item in order
+    assert max(max_active) > 1
+    assert len(calls) == 9
+    for item_id in ('pid0', 'pid1', 'pid2'):
+        values = [int(value) for iid, value in calls if iid == item_id]
+        assert values == sorted(values)
+
+
+def test_process_records_in_lanes(dispatch, dynamo_client):
+    calls, user_processed = [], threading.Event()
+
+    def slow_chat_listener(item_id, new_item):
+        # holds up its lane until a record of another lane has been processed
+        assert user_processed.wait(timeout=5)
+        calls.append(('chatMessage', new_item['v']))
+
+    def listener(item_id, new_item):
+        calls.append((item_id, new_item['v']))
+
+    dispatch.register('chatMessage', '-', ['INSERT'], slow_chat_listener)
+    dispatch.register('chat', '-', ['INSERT'], listener)
+    dispatch.register('user', 'profile', ['INSERT'], listener)
+    dispatch.register('user', 'profile', ['INSERT'], lambda item_id, new_item: user_processed.set())
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], lanes=[('chat', 'chatMessage')])
+    records = [
+        build_record('INSERT', 'chatMessage/mid', '-', new_item={'v': '1'}),
+        build_record('INSERT', 'chat/cid', '-', new_item={'v': '2'}),
+        build_record('INSERT', 'user/uid', 'profile', new_item={'v': '3'}),
+    ]
+    assert processor.process_records(records) == {'batchItemFailures': []}
+
+    # the user record was not held up behind the chat lane, whose records were processed in order
+    assert calls == [('uid', '3'), ('chatMessage', '1'), ('cid', '2')]
+
+
+def test_process_records_concurrently_runs_listeners_after_prerequisites(dispatch, dynamo_client):
+    finished = []
+
+    def slow(item_id, new_item):
+        time.sleep(0.05)
+        finished.append('slow')
+
+    def fast(item_id, new_item):
+        finished.append('fast')
+
+    def dependent(item_id, new_item):
+        finished.append('dependent')
+
+    dispatch.register('post', '-', ['INSERT'], slow)
+    dispatch.register('post', '-', ['INSERT'], fast)
+    dispatch.register('post', '-', ['INSERT'], dependent, after=[slow])
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], max_workers=4)
+    processor.process_records([build_record('INSERT', 'post/pid', '-', new_item={'v': 'a'})])
+    assert finished == ['fast', 'slow', 'dependent']
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_process_records_listeners_share_item_cache(dispatch, dynamo_client, max_workers):
+    dynamo_client.add_item({'Item': {'partitionKey': 'post/pid', 'sortKey': '-', 'v': 'a'}})
+    key = {'partitionKey': 'post/pid', 'sortKey': '-'}
+    caches = []
+
+    def listener(item_id, new_item):
+        caches.append(dynamo_client._item_cache)
+        assert dynamo_client.get_item(key)['v'] == 'a'
+
+    def other_listener(item_id, new_item):
+        listener(item_id, new_item)
+
+    dispatch.register('post', '-', ['INSERT'], listener)
+    dispatch.register('post', '-', ['INSERT'], other_listener)
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], max_workers=max_workers)
+    processor.process_records([build_record('INSERT', 'post/pid', '-', new_item={'v': 'a'})])
+    assert len(caches) == 2
+    assert caches[0] is caches[1]
+    assert caches[0] is not None
+    assert dynamo_client._item_cache is None
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_process_records_coalesces_records_of_an_item(dispatch, dynamo_client, max_workers):
+    per_record, coalesced = Mock(__qualname__='per_record'), Mock(__qualname__='coalesced')
+    dispatch.register('post', '-', ['INSERT', 'MODIFY', 'REMOVE'], per_record, {'cnt': '0'})
+    dispatch.register('post', '-', ['INSERT', 'MODIFY', 'REMOVE'], coalesced, {'cnt': '0'}, coalesce=True)
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], max_workers=max_workers)
+
+    records = [
+        build_record('MODIFY', 'post/pid1', '-', old_item={'cnt': '3'}, new_item={'cnt': '4'}),
+        build_record('INSERT', 'post/pid2', '-', new_item={'cnt': '1'}),
+        build_record('MODIFY', 'post/pid1', '-', old_item={'cnt': '4'}, new_item={'cnt': '5'}),
+        build_record('MODIFY', 'post/pid1', '-', old_item={'cnt': '5'}, new_item={'cnt': '6'}),
+        build_record('MODIFY', 'post/pid2', '-', old_item={'cnt': '1'}, new_item={'cnt': '2'}),
+        build_record('REMOVE', 'post/pid2', '-', old_item={'cnt': '2'}),
+        build_record('MODIFY', 'post/pid3', '-', old_item={'cnt': '1'}, new_item={'cnt': '2'}),
+        build_record('MODIFY', 'post/pid3', '-', old_item={'cnt': '2'}, new_item={'cnt': '1'}),
+    ]
+    processor.process_records(records)
+    assert per_record.call_count == 8
+
+    # one call per item, with the net change. Post 2 was added and removed, post 3's count is unchanged
+    coalesced.assert_called_once_with('pid1', old_item={'cnt': '3'}, new_item={'cnt': '6'})
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_process_records_retries_failed_coalesced_listener_from_first_record(
+    dispatch, dynamo_client, dynamo_stream_ledger_client, max_workers
+):
+    per_record = Mock(__qualname__='per_record')
+    coalesced = Mock(__qualname__='coalesced')
+    dispatch.register('post', '-', ['MODIFY'], per_record, {'cnt': '0'})
+    dispatch.register('post', '-', ['MODIFY'], coalesced, {'cnt': '0'}, coalesce=True)
+    ledger = StreamLedger(dynamo_stream_ledger_client)
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], max_workers=max_workers, ledger=ledger)
+
+    records = [
+        build_record('MODIFY', 'post/pid1', '-', old_item={'cnt': '1'}, new_item={'cnt': '2'}),
+        build_record('MODIFY', 'post/pid2', '-', old_item={'cnt': '1'}, new_item={'cnt': '2'}),
+        build_record('MODIFY', 'post/pid1', '-', old_item={'cnt': '2'}, new_item={'cnt': '3'}),
+    ]
+    coalesced.side_effect = lambda post_id, old_item, new_item: 1 / (post_id != 'pid1')
+    resp = processor.process_records(records)
+    assert resp == {'batchItemFailures': [{'itemIdentifier': records[0]['dynamodb']['SequenceNumber']}]}
+    assert per_record.call_count == 3
+    assert coalesced.call_count == 2
+    coalesced.assert_any_call('pid1', old_item={'cnt': '1'}, new_item={'cnt': '3'})
+
+    # lambda delivers again from the first record the failed change was coalesced from, so none of it is lost
+    coalesced.side_effect = None
+    assert processor.process_records(records) == {'batchItemFailures': []}
+    assert per_record.call_count == 3
+    assert coalesced.call_count == 3
+    coalesced.assert_called_with('pid1', old_item={'cnt': '1'}, new_item={'cnt': '3'})
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_process_records_defers_counts(dispatch, dynamo_client, max_workers):
+    key = {'partitionKey': 'user/uid', 'sortKey': 'profile'}
+    dynamo_client.add_item({'Item': key})
+
+    def deferring(item_id, new_item):
+        dynamo_client.increment_count(key, 'likeCount')
+
+    def not_deferring(item_id, new_item):
+        dynamo_client.increment_count(key, 'viewCount')
+
+    dispatch.register('post', 'like', ['INSERT'], deferring, defer_counts=True)
+    dispatch.register('post', 'view', ['INSERT'], not_deferring)
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], max_workers=max_workers)
+    records = [build_record('INSERT', f'post/pid{i % 3}', 'like/uid', new_item={'v': 'a'}) for i in range(10)]
+    records += [build_record('INSERT', f'post/pid{i}', 'view/uid', new_item={'v': 'a'}) for i in range(2)]
+
+    dynamo_client.table = Mock(wraps=dynamo_client.table)
+    processor.process_records(records)
+    assert dynamo_client.table.update_item.call_count == 3
+    assert dynamo_client.get_item(key) == {**key, 'likeCount': 10, 'viewCount': 2}
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_process_records_retries_failed_listeners_then_gives_up(
+    dispatch, dynamo_client, dynamo_stream_ledger_client, max_workers, tmp_path, caplog
+):
+    f1, f2 = Mock(__qualname__='f1'), Mock(__qualname__='f2')
+    dispatch.register('post', '-', ['INSERT'], f1)
+    dispatch.register('post', '-', ['INSERT'], f2)
+    replay_path = tmp_path / 'replay.jsonl'
+    processor = DynamoStreamProcessor(
+        dispatch,
+        [dynamo_client],
+        max_workers=max_workers,
+        ledger=StreamLedger(dynamo_stream_ledger_client),
+        max_attempts=3,
+        replay_path=replay_path,
+    )
+    records = [build_record('INSERT', f'post/pid{i}', '-', new_item={'v': 'a'}) for i in range(3)]
+    event_ids = [record['eventID'] for record in records]
+    f2.side_effect = lambda post_id, new_item: 1 / (post_id != 'pid1')
+
+    # the failed record is reported, the ledger remembers the listeners done with each record
+    resp = processor.process_records(records)
+    assert resp == {'batchItemFailures': [{'itemIdentifier': records[1]['dynamodb']['SequenceNumber']}]}
+    assert processor.ledger.get_entries(event_ids) == {
+        event_ids[0]: {'done': {'f1', 'f2'}, 'failedAttempts': 0},
+        event_ids[1]: {'done': {'f1'}, 'failedAttempts': 1},
+        event_ids[2]: {'done': {'f1', 'f2'}, 'failedAttempts': 0},
+    }
+    assert f1.call_count == 3
+    assert f2.call_count == 3
+
+    # lambda delivers the records again from the failed one, only the failed listener runs
+    resp = processor.process_records(records[1:])
+    assert resp == {'batchItemFailures': [{'itemIdentifier': records[1]['dynamodb']['SequenceNumber']}]}
+    assert processor.ledger.get_entries(event_ids)[event_ids[1]] == {'done': {'f1'}, 'failedAttempts': 2}
+    assert f1.call_count == 3
+    assert f2.call_count == 4
+
+    # after the last attempt the record is given up on and saved for replay
+    caplog.clear()
+    resp = processor.process_records(records[1:])
+    assert resp == {'batchItemFailures': []}
+    assert event_ids[1] not in processor.ledger.get_entries(event_ids)
+    assert f2.call_count == 5
+    errors = [rec for rec in caplog.records if rec.levelname == 'ERROR']
+    assert len(errors) == 2
+    assert errors[1].msg == f'Giving up on stream record `{event_ids[1]}` after 3 failed attempts by: f2'
+    assert errors[1].stream_record == records[1]
+    assert [json.loads(line) for line in replay_path.read_text().splitlines()] == [records[1]]
+
+    # once fixed, the record can be replayed
+    f2.side_effect = None
+    assert processor.process_records([records[1]]) == {'batchItemFailures': []}
+    f2.assert_called_with('pid1', new_item={'v': 'a'})
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_process_records_skips_listeners_done_before_a_timeout(
+    dispatch, dynamo_client, dynamo_stream_ledger_client, max_workers
+):
+    key = {'partitionKey': 'user/uid', 'sortKey': 'profile'}
+    dynamo_client.add_item({'Item': key})
+    f1 = Mock(__qualname__='f1', side_effect=lambda post_id, new_item: dynamo_client.increment_count(key, 'c1'))
+    f2 = Mock(__qualname__='f2', side_effect=lambda post_id, new_item: dynamo_client.increment_count(key, 'c2'))
+    dispatch.register('post', '-', ['INSERT'], f1)
+    dispatch.register('post', '-', ['INSERT'], f2, defer_counts=True)
+    ledger = StreamLedger(dynamo_stream_ledger_client)
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], max_workers=max_workers, ledger=ledger)
+    records = [build_record('INSERT', f'post/pid{i}', '-', new_item={'v': 'a'}) for i in range(2)]
+
+    # the function times out before the deferred counts are written and the batch is settled
+    with patch.object(dynamo_client, 'flush_counts', side_effect=TimeoutError):
+        with pytest.raises(TimeoutError):
+            processor.process_records(records)
+    assert dynamo_client.get_item(key) == {**key, 'c1': 2}
+
+    # lambda delivers the batch again, only the listeners whose counts were lost are run again
+    assert processor.process_records(records) == {'batchItemFailures': []}
+    assert f1.call_count == 2
+    assert f2.call_count == 4
+    assert dynamo_client.get_item(key) == {**key, 'c1': 2, 'c2': 2}
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_process_records_telemetry(dispatch, dynamo_client, max_workers):
+    f1, f2 = Mock(__qualname__='f1'), Mock(__qualname__='f2', side_effect=Exception('f2 failed'))
+    f3 = Mock(__qualname__='f3')
+    dispatch.register('post', '-', ['MODIFY'], f1)
+    dispatch.register('post', '-', ['MODIFY'], f2, {'status': None})
+    dispatch.register('post', '-', ['MODIFY'], f3, {'status': None}, coalesce=True)
+    telemetry = Mock(ListenerTelemetry())
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client], max_workers=max_workers, telemetry=telemetry)
+
+    records = [
+        build_record('MODIFY', 'post/pid1', '-', old_item={'status': 'a'}, new_item={'status': 'b'}),
+        build_record('MODIFY', 'post/pid1', '-', old_item={'status': 'b'}, new_item={'status': 'b'}),
+    ]
+    processor.process_records(records)
+    invocations = sorted(call.args[0] for call in telemetry.record_invocation.call_args_list)
+    assert invocations == ['f1', 'f1', 'f2', 'f3']
+    failed = {call.args[0]: call.kwargs['failed'] for call in telemetry.record_invocation.call_args_list}
+    assert failed == {'f1': False, 'f2': True, 'f3': False}
+    assert [list(call.args[0]) for call in telemetry.record_skips.call_args_list] == [['f2']]
+    telemetry.emit.assert_called_once_with()
+
+
+def test_process_records_drops_records_without_listeners(dispatch, dynamo_client, caplog):
+    f1 = Mock(__qualname__='f1')
+    dispatch.register('post', '-', ['INSERT'], f1)
+    processor = DynamoStreamProcessor(dispatch, [dynamo_client])
+
+    records = [
+        build_record('MODIFY', 'post/pid1', 'trending', old_item={'v': 'a'}, new_item={'v': 'b'}),
+        build_record('INSERT', 'post/pid1', '-', new_item={'v': 'a'}),
+        build_record('MODIFY', 'post/pid1', '-', old_item={'v': 'a'}, new_item={'v': 'b'}),
+    ]
+    assert processor.process_records(records) == {'batchItemFailures': []}
+    f1.assert_called_once_with('pid1', new_item={'v': 'a'})
+    assert [rec.msg for rec in caplog.records if 'starting processing' in rec.msg] == [
+        'INSERT: `post/pid1` / `-` starting processing'
+    ]
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_process_records_batches_notifications(dispatch, dynamo_client, max_workers, caplog):
+    appsync_client = AppSyncClient(appsync_graphql_url='my-graphql-url')
+
+    def notifying(item_id, new_item):
+        appsync_client.fire_notification(new_item['v'], 'USER_FEED_CHANGED')
+
+    dispatch.register('post', '-', ['INSERT'], notifying)
+    processor = DynamoStreamProcessor(
+        dispatch, [dynamo_client], max_workers=max_workers, appsync_client=appsync_client
+    )
+    records = [build_record('INSERT', f'post/pid{i}', '-', new_item={'v': f'uid{i % 2}'}) for i in range(5)]
+    with patch.object(appsync_client, 'send_notifications') as send_mock:
+        processor.process_records(records)
+    assert send_mock.call_count == 1
+    assert sorted(send_mock.call_args[0][0]) == [
+        ('uid0', 'USER_FEED_CHANGED', ()),
+        ('uid1', 'USER_FEED_CHANGED', ()),
+    ]
+
+    # failing to send is logged, the records having been processed
+    with patch.object(appsync_client, 'send_notifications', side_effect=Exception('appsync down')):
+        resp = processor.process_records(records[:1])
+    assert resp == {'batchItemFailures': []}
+    assert 'appsync down' in [rec for rec in caplog.records if rec.levelname == 'ERROR'][0].msg
@@ -0,0 +1,52 @@
+import json
+import logging
+
+from app.handlers.dynamo.telemetry import ListenerTelemetry
+from app.logging import CloudWatchFormatter
+
+
+def test_record_and_emit(caplog):
+    telemetry = ListenerTelemetry()
+    telemetry.record_invocation('Manager.on_b', 0.0005)
+    telemetry.record_invocation('Manager.on_b', 0.003, failed=True)
+    telemetry.record_invocation('Manager.on_b', 30)
+    telemetry.record_skips(['Manager.on_a', 'Manager.on_b'])
+    telemetry.record_skips(['Manager.on_a'])
+
+    with caplog.at_level(logging.INFO):
+        telemetry.emit()
+    assert len(caplog.records) == 2
+    assert [rec.emf['Listener'] for rec in caplog.records] == ['Manager.on_a', 'Manager.on_b']
+
+    doc = caplog.records[1].emf
+    assert doc['_aws']['CloudWatchMetrics'] == [
+        {
+            'Namespace': 'DynamoStream',
+            'Dimensions': [['FunctionName', 'Listener']],
+            'Metrics': [
+                {'Name': 'Invocations', 'Unit': 'Count'},
+                {'Name': 'Skips', 'Unit': 'Count'},
+                {'Name': 'Exceptions', 'Unit': 'Count'},
+                {'Name': 'Duration', 'Unit': 'Milliseconds'},
+                {'Name': 'MaxDuration', 'Unit': 'Milliseconds'},
+            ],
+        }
+    ]
+    assert doc['FunctionName'] == 'local'
+    assert doc['Invocations'] == 3
+    assert doc['Skips'] == 1
+    assert doc['Exceptions'] == 1
+    assert doc['Duration'] == 30003.5
+    assert doc['MaxDuration'] == 30000
+    assert doc['DurationHistogram'] == {'<=1ms': 1, '<=5ms': 1, '>10000ms': 1}
+
+    doc = caplog.records[0].emf
+    assert (doc['Invocations'], doc['Skips'], doc['Duration'], doc['DurationHistogram']) == (0, 2, 0, {})
+
+    # the log record is nothing but the metrics document, as the embedded metric format requires
+    assert json.loads(CloudWatchFormatter().format(caplog.records[0])) == doc
+
+    # stats were reset
+    caplog.clear()
+    telemetry.emit()
+    assert caplog.records == []
@@ -141,50 +141,6 @@ def test_add_post_to_feeds(feed_dynamo):
     assert sorted([i['postId'] for i in feed_dynamo.generate_items(feed_uids[1])]) == sorted([post_id, post_id_2])
 
 
-def test_delete_by_post(feed_dynamo):
-    feed_uids = [str(uuid4()), str(uuid4())]
-
-    # delete post from feeds where it doesn't exist - verify no error
-    assert feed_dynamo.delete_by_post(str(uuid4())) == []
-
-    # add a post to two feeds
-    posted_at = pendulum.now('utc').to_iso8601_string()
-    post_id = str(uuid4())
-    post_item = {
-        'postId': post_id,
-        'postedByUserId': str(uuid4()),
-        'postedAt': posted_at,
-    }
-    assert feed_dynamo.add_post_to_feeds(iter(feed_uids), post_item) == feed_uids
-
-    # add another post to one of the feeds
-    post_id_2 = str(uuid4())
-    post_item = {
-        'postId': post_id_2,
-        'postedByUserId': str(uuid4()),
-        'postedAt': posted_at,
-    }
-    assert feed_dynamo.add_post_to_feeds(iter(feed_uids[:1]), post_item) == feed_uids[:1]
-
-    # verify the two feeds look as expected
-    assert sorted([i['postId'] for i in feed_dynamo.generate_items(feed_uids[0])]) == sorted([post_id, post_id_2])
-    assert [i['postId'] for i in feed_dynamo.generate_items(feed_uids[1])] == [post_id]
-
-    # delete a post from the feeds
-    assert sorted(feed_dynamo.delete_by_post(post_id)) == sorted(feed_uids)
-
-    # verify the two feeds look as expected
-    assert [i['postId'] for i in feed_dynamo.generate_items(feed_uids[0])] == [post_id_2]
-    assert [i['postId'] for i in feed_dynamo.generate_items(feed_uids[1])] == []
-
-    # delete the other post from the feeds
-    assert feed_dynamo.delete_by_post(post_id_2) == feed_uids[:1]
-
-    # verify the two feeds look as expected
-    assert [i['postId'] for i in feed_dynamo.generate_items(feed_uids[0])] == []
-    assert [i['postId'] for i in feed_dynamo.generate_items(feed_uids[1])] == []
-
-
 def test_generate_keys_by_post(feed_dynamo):
     feed_user_id_1, feed_user_id_2 = str(uuid4()), str(uuid4())
     post_id_1, post_id_2 = str(uuid4()), str(uuid4())
@@ -239,3 +195,95 @@ def test_generate_keys_by_posted_by_user(feed_dynamo):
         {'postId': pid2, 'feedUserId': feed_user_id}
     ]
     assert list(feed_dynamo.generate_keys_by_posted_by_user(feed_user_id, str(uuid4()))) == []
+
+
+def test_generate_recent_items(feed_dynamo):
+    feed_user_id = str(uuid4())
+    assert list(feed_dynamo.generate_recent_items(feed_user_id)) == []
+
+    now = pendulum.now('utc')
+    post_items = [
+        {'postId': f'pid{i}', 'postedByUserId': 'pbuid', 'postedAt': now.add(seconds=i).to_iso8601_string()}
+        for i in range(3)
+    ]
+    feed_dynamo.add_posts_to_feed(feed_user_id, iter(post_items))
+    feed_dynamo.add_posts_to_feed(str(uuid4()), iter(post_items))
+
+    # most recently posted first
+    assert [i['postId'] for i in feed_dynamo.generate_recent_items(feed_user_id)] == ['pid2', 'pid1', 'pid0']
+    items = feed_dynamo.generate_recent_items(feed_user_id, page_size=1)
+    assert [i['postId'] for i in items] == ['pid2', 'pid1', 'pid0']
+    items = feed_dynamo.generate_recent_items(feed_user_id, before_posted_at=post_items[2]['postedAt'])
+    assert [i['postId'] for i in items] == ['pid1', 'pid0']
+
+    # posts posted at the same time are told apart by post id
+    feed_dynamo.add_posts_to_feed(feed_user_id, iter([{**post_items[1], 'postId': 'pid1b'}]))
+    items = feed_dynamo.generate_recent_items(feed_user_id, post_items[1]['postedAt'], 'pid1b')
+    assert [i['postId'] for i in items] == ['pid1', 'pid0']
+
+
+def test_query_keys_by_post(feed_dynamo):
+    assert feed_dynamo.query_keys_by_post('pid', 10) == {'items': [], 'nextToken': None}
+
+    post_item = {'postId': 'pid', 'postedByUserId': 'pbuid', 'postedAt': pendulum.now('utc').to_iso8601_string()}
+    feed_dynamo.add_post_to_feeds(iter(['uid1', 'uid2', 'uid3']), post_item)
+
+    page = feed_dynamo.query_keys_by_post('pid', 2)
+    assert page['items'] == [{'postId': 'pid', 'feedUserId': 'uid1'}, {'postId': 'pid', 'feedUserId': 'uid2'}]
+    page = feed_dynamo.query_keys_by_post('pid', 2, page['nextToken'])
+    assert page == {'items': [{'postId': 'pid', 'feedUserId': 'uid3'}], 'nextToken': None}
+
+
+def test_item_ttl(feed_dynamo):
+    posted_at = pendulum.now('utc')
+    post_item = {'postId': 'pid', 'postedByUserId': 'pbuid', 'postedAt': posted_at.to_iso8601_string()}
+    assert 'expiresAtEpoch' not in feed_dynamo.item('fuid', post_item)
+
+    feed_dynamo.ttl = pendulum.duration(days=30)
+    item = feed_dynamo.item('fuid', post_item)
+    assert item['expiresAtEpoch'] == posted_at.add(days=30).int_timestamp
+
+
+def test_expired_posts_not_added(feed_dynamo):
+    now = pendulum.now('utc')
+    post_items = [
+        {
+            'postId': f'pid{days}',
+            'postedByUserId': 'pbuid',
+            'postedAt': now.subtract(days=days).to_iso8601_string(),
+        }
+        for days in (1, 40)
+    ]
+    assert feed_dynamo.is_expired(post_items[1]) is False
+
+    # posts whose items would expire right away, ex: old ones being backfilled, are left out
+    feed_dynamo.ttl = pendulum.duration(days=30)
+    assert feed_dynamo.is_expired(post_items[0]) is False
+    assert feed_dynamo.is_expired(post_items[1]) is True
+    feed_dynamo.add_posts_to_feed('fuid1', iter(post_items))
+    assert [i['postId'] for i in feed_dynamo.generate_items('fuid1')] == ['pid1']
+    assert feed_dynamo.add_post_to_feeds(iter(['fuid2']), post_items[1]) == ['fuid2']
+    assert list(feed_dynamo.generate_items('fuid2')) == []
+
+
+def test_trim(feed_dynamo):
+    feed_user_id = str(uuid4())
+    feed_dynamo.trim(feed_user_id, 2)
+
+    now = pendulum.now('utc')
+    post_items = [
+        {'postId': f'pid{i}', 'postedByUserId': 'pbuid', 'postedAt': now.add(seconds=i).to_iso8601_string()}
+        for i in range(4)
+    ]
+    feed_dynamo.add_posts_to_feed(feed_user_id, iter(post_items))
+    feed_dynamo.add_posts_to_feed('other-fuid', iter(post_items))
+
+    # the most recently posted are kept
+    feed_dynamo.trim(feed_user_id, 2)
+    assert sorted(i['postId'] for i in feed_dynamo.generate_items(feed_user_id)) == ['pid2', 'pid3']
+    assert len(list(feed_dynamo.generate_items('other-fuid'))) == 4
+
+    feed_dynamo.trim(feed_user_id, 2)
+    assert sorted(i['postId'] for i in feed_dynamo.generate_items(feed_user_id)) == ['pid2', 'pid3']
+    feed_dynamo.trim(feed_user_id, 0)
+    assert list(feed_dynamo.generate_items(feed_user_id)) == []
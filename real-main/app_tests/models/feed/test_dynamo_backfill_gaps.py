@@ -0,0 +1,42 @@
+import pytest
+
+from app.models.feed.dynamo import FeedBackfillGapsDynamo
+
+
+@pytest.fixture
+def backfill_gaps_dynamo(dynamo_client):
+    yield FeedBackfillGapsDynamo(dynamo_client)
+
+
+def test_set_get_delete_gaps(backfill_gaps_dynamo):
+    assert backfill_gaps_dynamo.get_gaps('fuid') == {}
+    backfill_gaps_dynamo.delete_gap('fuid', 'pbuid1')
+
+    backfill_gaps_dynamo.set_gap('fuid', 'pbuid1', '2020-01-01T00:00:00Z')
+    backfill_gaps_dynamo.set_gap('fuid', 'pbuid2', '2020-02-01T00:00:00Z')
+    backfill_gaps_dynamo.set_gap('other-fuid', 'pbuid1', '2020-03-01T00:00:00Z')
+    assert backfill_gaps_dynamo.get_gaps('fuid') == {
+        'pbuid1': '2020-01-01T00:00:00Z',
+        'pbuid2': '2020-02-01T00:00:00Z',
+    }
+
+    # overwrite, delete
+    backfill_gaps_dynamo.set_gap('fuid', 'pbuid1', '2019-01-01T00:00:00Z')
+    backfill_gaps_dynamo.delete_gap('fuid', 'pbuid2')
+    assert backfill_gaps_dynamo.get_gaps('fuid') == {'pbuid1': '2019-01-01T00:00:00Z'}
+    assert backfill_gaps_dynamo.get_gaps('other-fuid') == {'pbuid1': '2020-03-01T00:00:00Z'}
+
+
+def test_update_gaps(backfill_gaps_dynamo):
+    backfill_gaps_dynamo.set_gap('fuid', 'pbuid1', '2020-01-01T00:00:00Z')
+    backfill_gaps_dynamo.set_gap('fuid', 'pbuid2', '2020-02-01T00:00:00Z')
+    backfill_gaps_dynamo.update_gaps('fuid', {})
+
+    # set, add and delete in one go
+    backfill_gaps_dynamo.update_gaps(
+        'fuid', {'pbuid1': '2019-01-01T00:00:00Z', 'pbuid2': None, 'pbuid3': '2020-03-01T00:00:00Z'}
+    )
+    assert backfill_gaps_dynamo.get_gaps('fuid') == {
+        'pbuid1': '2019-01-01T00:00:00Z',
+        'pbuid3': '2020-03-01T00:00:00Z',
+    }
@@ -0,0 +1,19 @@
+import pytest
+
+from app.models.feed.dynamo import FeedPulledAuthorsDynamo
+
+
+@pytest.fixture
+def pulled_authors_dynamo(dynamo_client):
+    yield FeedPulledAuthorsDynamo(dynamo_client)
+
+
+def test_add_and_get_user_ids(pulled_authors_dynamo):
+    assert pulled_authors_dynamo.get_user_ids() == set()
+
+    pulled_authors_dynamo.add_user_id('uid1')
+    assert pulled_authors_dynamo.get_user_ids() == {'uid1'}
+
+    pulled_authors_dynamo.add_user_id('uid2')
+    pulled_authors_dynamo.add_user_id('uid1')
+    assert pulled_authors_dynamo.get_user_ids() == {'uid1', 'uid2'}
@@ -1,9 +1,12 @@
+from unittest.mock import call, patch
 from uuid import uuid4
 
 import pendulum
 import pytest
 
+from app.models.follower.enums import FollowStatus
 from app.models.post.enums import PostType
+from app.utils import GqlNotificationType
 
 
 @pytest.fixture
@@ -13,6 +16,10 @@ def user(user_manager, cognito_client):
     yield user_manager.create_cognito_only_user(user_id, username)
 
 
+user2 = user
+user3 = user
+
+
 def test_add_users_posts_to_feed(feed_manager, post_manager, user, cognito_client):
     feed_user_id = str(uuid4())
 
@@ -33,47 +40,363 @@ def test_add_users_posts_to_feed(feed_manager, post_manager, user, cognito_clien
     )
 
 
-def test_add_post_to_followers_feeds(feed_manager, user_manager):
-    our_user = user_manager.init_user({'userId': 'ouid', 'privacyStatus': 'PUBLIC'})
-    their_user = user_manager.init_user({'userId': 'tuid', 'privacyStatus': 'PUBLIC'})
-    another_user = user_manager.init_user({'userId': 'auid', 'privacyStatus': 'PUBLIC'})
+def test_add_post_to_followers_feeds(feed_manager, post_manager, user, user2, user3):
+    our_user, their_user, another_user = user, user2, user3
 
     # check feeds are empty
     assert list(feed_manager.dynamo.generate_items(our_user.id)) == []
     assert list(feed_manager.dynamo.generate_items(their_user.id)) == []
     assert list(feed_manager.dynamo.generate_items(another_user.id)) == []
 
-    # add a post to all our followers (none) and us
-    posted_at = pendulum.now('utc').to_iso8601_string()
-    post_id_1 = str(uuid4())
-    post_item = {
-        'postId': post_id_1,
-        'postedByUserId': our_user.id,
-        'postedAt': posted_at,
-    }
-    assert feed_manager.add_post_to_followers_feeds(our_user.id, post_item) == ['ouid']
+    # add a post to all our followers, none
+    post_1 = post_manager.add_post(our_user, str(uuid4()), PostType.TEXT_ONLY, text='t')
+    feed_manager.add_post_to_followers_feeds(our_user.id, post_1.item)
+    assert feed_manager.fan_out_queue.drain(feed_manager.process_fan_out_job) == 1
 
-    # check feeds
-    assert [i['postId'] for i in feed_manager.dynamo.generate_items(our_user.id)] == [post_id_1]
+    # check feeds, our own is written when the post completes rather than by the job
+    assert list(feed_manager.dynamo.generate_items(our_user.id)) == []
     assert list(feed_manager.dynamo.generate_items(their_user.id)) == []
     assert list(feed_manager.dynamo.generate_items(another_user.id)) == []
 
     # they follow us
     feed_manager.follower_manager.dynamo.add_following(their_user.id, our_user.id, 'FOLLOWING')
 
-    # add a post to all our followers and us
-    posted_at = pendulum.now('utc').to_iso8601_string()
-    post_id_2 = str(uuid4())
-    post_item = {
-        'postId': post_id_2,
-        'postedByUserId': our_user.id,
-        'postedAt': posted_at,
-    }
-    assert feed_manager.add_post_to_followers_feeds(our_user.id, post_item) == ['ouid', 'tuid']
+    # add a post to all our followers
+    post_2 = post_manager.add_post(our_user, str(uuid4()), PostType.TEXT_ONLY, text='t')
+    feed_manager.add_post_to_followers_feeds(our_user.id, post_2.item)
+    assert feed_manager.fan_out_queue.drain(feed_manager.process_fan_out_job) == 1
 
     # check feeds
-    assert sorted([i['postId'] for i in feed_manager.dynamo.generate_items(our_user.id)]) == sorted(
-        [post_id_1, post_id_2]
-    )
-    assert [i['postId'] for i in feed_manager.dynamo.generate_items(their_user.id)] == [post_id_2]
+    assert list(feed_manager.dynamo.generate_items(our_user.id)) == []
+    assert [i['postId'] for i in feed_manager.dynamo.generate_items(their_user.id)] == [post_2.id]
     assert list(feed_manager.dynamo.generate_items(another_user.id)) == []
+
+
+def test_fan_out_post_in_chunks(feed_manager, follower_manager, post_manager, user):
+    author = user
+    follower_user_ids = ['fuid1', 'fuid2', 'fuid3']
+    for follower_user_id in follower_user_ids:
+        follower_manager.dynamo.add_following(follower_user_id, author.id, 'FOLLOWING')
+    feed_manager.fan_out_chunk_size = 2
+    post_item = post_manager.add_post(author, 'pid', PostType.TEXT_ONLY, text='t').item
+
+    # the job of the first chunk queues that of the second chunk, which is the last
+    feed_manager.add_post_to_followers_feeds(author.id, post_item)
+    post_item = {k: post_item[k] for k in ('postId', 'postedByUserId', 'postedAt')}
+    assert list(feed_manager.fan_out_queue.messages) == [{'action': 'addPost', 'postItem': post_item}]
+    assert feed_manager.fan_out_queue.drain(feed_manager.process_fan_out_job, max_workers=2) == 2
+    for user_id in follower_user_ids:
+        assert [i['postId'] for i in feed_manager.dynamo.generate_items(user_id)] == ['pid']
+    assert list(feed_manager.dynamo.generate_items(author.id)) == []
+    fire_notification_mock = feed_manager.appsync_client.fire_notification
+    assert sorted(fire_notification_mock.call_args_list) == [
+        call(user_id, GqlNotificationType.USER_FEED_CHANGED) for user_id in follower_user_ids
+    ]
+
+    # processing a chunk again is harmless
+    feed_manager.process_fan_out_job({'action': 'addPost', 'postItem': post_item})
+    assert feed_manager.fan_out_queue.drain(feed_manager.process_fan_out_job) == 1
+    for user_id in follower_user_ids:
+        assert [i['postId'] for i in feed_manager.dynamo.generate_items(user_id)] == ['pid']
+
+    # delete the post from all feeds, in chunks too
+    feed_manager.appsync_client.reset_mock()
+    feed_manager.delete_by_post('pid')
+    assert feed_manager.fan_out_queue.drain(feed_manager.process_fan_out_job) == 2
+    for user_id in follower_user_ids:
+        assert list(feed_manager.dynamo.generate_items(user_id)) == []
+    assert len(feed_manager.appsync_client.fire_notification.mock_calls) == 3
+
+
+def test_fan_out_post_no_longer_completed(feed_manager, follower_manager, post_manager, user):
+    follower_manager.dynamo.add_following('fuid1', user.id, 'FOLLOWING')
+    post = post_manager.add_post(user, 'pid', PostType.TEXT_ONLY, text='t')
+    job = {'action': 'addPost', 'postItem': {k: post.item[k] for k in ('postId', 'postedByUserId', 'postedAt')}}
+
+    # the post was archived before the job ran, its deletePost job may have run already
+    post.archive()
+    feed_manager.process_fan_out_job(job)
+    assert list(feed_manager.fan_out_queue.messages) == []
+    assert list(feed_manager.dynamo.generate_items('fuid1')) == []
+
+    # the post was archived while it was being added to feeds
+    post.restore()
+    add_post_to_feeds = feed_manager.dynamo.add_post_to_feeds
+
+    def add_post_to_feeds_then_archive(*args):
+        add_post_to_feeds(*args)
+        post.archive()
+
+    with patch.object(feed_manager.dynamo, 'add_post_to_feeds', side_effect=add_post_to_feeds_then_archive):
+        with patch.object(feed_manager, 'trim_feeds') as trim_feeds_mock:
+            feed_manager.process_fan_out_job(job)
+    assert list(feed_manager.dynamo.generate_items('fuid1')) == []
+    assert trim_feeds_mock.mock_calls == []
+    assert feed_manager.appsync_client.fire_notification.mock_calls == []
+
+
+def test_process_fan_out_job_unknown_action(feed_manager):
+    with pytest.raises(ValueError, match='Unknown feed fan-out action'):
+        feed_manager.process_fan_out_job({'action': 'nope'})
+
+
+def test_is_pulled_author(feed_manager, user):
+    # disabled by default
+    assert feed_manager.pull_min_followers == 0
+    assert feed_manager.is_pulled_author(user.id) is False
+
+    feed_manager.pull_min_followers = 2
+    assert feed_manager.is_pulled_author(user.id) is False
+    assert feed_manager.is_pulled_author(str(uuid4())) is False
+    feed_manager.user_manager.dynamo.increment_follower_count(user.id)
+    assert feed_manager.is_pulled_author(user.id) is False
+    feed_manager.user_manager.dynamo.increment_follower_count(user.id)
+    assert feed_manager.is_pulled_author(user.id) is True
+
+
+def test_get_feed_page(feed_manager, post_manager, follower_manager, user, user2, user3):
+    # user's feed has posts pushed by user2, user3 is a pulled author
+    assert feed_manager.get_feed_page(user.id, 10) == ([], None)
+    pushed_posts = [post_manager.add_post(user2, str(uuid4()), PostType.TEXT_ONLY, text='t') for _ in range(2)]
+    feed_manager.dynamo.add_posts_to_feed(user.id, iter(p.item for p in pushed_posts))
+    pulled_posts = [post_manager.add_post(user3, str(uuid4()), PostType.TEXT_ONLY, text='t') for _ in range(2)]
+    feed_manager.pulled_authors_dynamo.add_user_id(user3.id)
+
+    # user3's posts are only merged in once user follows them
+    assert feed_manager.get_feed_page(user.id, 10) == ([p.id for p in reversed(pushed_posts)], None)
+    follower_manager.dynamo.add_following(user.id, user3.id, FollowStatus.FOLLOWING)
+    post_ids = [p.id for p in reversed(pushed_posts + pulled_posts)]
+    assert feed_manager.get_feed_page(user.id, 10) == (post_ids, None)
+
+    # a post pushed from before user3 became a pulled author shows up once
+    feed_manager.dynamo.add_posts_to_feed(user.id, iter([pulled_posts[0].item]))
+    assert feed_manager.get_feed_page(user.id, 10) == (post_ids, None)
+
+    # paginate
+    page, next_token = feed_manager.get_feed_page(user.id, 3)
+    assert page == post_ids[:3]
+    assert next_token
+    page, next_token = feed_manager.get_feed_page(user.id, 3, next_token=next_token)
+    assert page == post_ids[3:]
+    assert next_token is None
+
+    # user3's own feed does not pull in their own posts
+    assert feed_manager.get_feed_page(user3.id, 10) == ([], None)
+
+
+def test_get_feed_page_posted_at_the_same_time(feed_manager, post_manager, user, user2):
+    now = pendulum.now('utc')
+    posts = [post_manager.add_post(user2, str(uuid4()), PostType.TEXT_ONLY, text='t', now=now) for _ in range(3)]
+    posts.append(post_manager.add_post(user2, str(uuid4()), PostType.TEXT_ONLY, text='t', now=now.add(seconds=1)))
+    feed_manager.dynamo.add_posts_to_feed(user.id, iter(p.item for p in posts))
+    post_ids = [posts[3].id, *sorted((p.id for p in posts[:3]), reverse=True)]
+
+    # pages split between posts posted at the same time, by post id
+    page, next_token = feed_manager.get_feed_page(user.id, 2)
+    assert page == post_ids[:2]
+    page, next_token = feed_manager.get_feed_page(user.id, 1, next_token=next_token)
+    assert page == post_ids[2:3]
+    assert feed_manager.get_feed_page(user.id, 2, next_token=next_token) == (post_ids[3:], None)
+
+
+def test_get_feed_page_unknown_token(feed_manager, post_manager, user, user2, caplog):
+    posts = [post_manager.add_post(user2, str(uuid4()), PostType.TEXT_ONLY, text='t') for _ in range(2)]
+    feed_manager.dynamo.add_posts_to_feed(user.id, iter(p.item for p in posts))
+
+    # tokens that aren't ours, ex: handed out when the feed was read straight from the table, start from the top
+    feed_item = next(feed_manager.dynamo.generate_items(user.id))
+    for next_token in ('not-base64!', feed_manager.dynamo.feed_client.encode_pagination_token(feed_item)):
+        caplog.clear()
+        assert feed_manager.get_feed_page(user.id, 10, next_token=next_token) == (
+            [posts[1].id, posts[0].id],
+            None,
+        )
+        assert len(caplog.records) == 1
+        assert 'Restarting feed' in caplog.records[0].msg
+
+
+def test_add_users_posts_to_feed_bounded(feed_manager, post_manager, user):
+    feed_user_id = str(uuid4())
+    posts = [post_manager.add_post(user, str(uuid4()), PostType.TEXT_ONLY, text='t') for _ in range(3)]
+    feed_manager.dynamo.add_posts_to_feed(feed_user_id, iter([posts[0].item]))
+    feed_manager.max_items = 2
+
+    # only the most recent posts make it to the feed, which is trimmed
+    feed_manager.add_users_posts_to_feed(feed_user_id, user.id)
+    assert sorted(i['postId'] for i in feed_manager.dynamo.generate_items(feed_user_id)) == sorted(
+        [posts[1].id, posts[2].id]
+    )
+
+
+def test_trim_feeds(feed_manager):
+    with patch.object(feed_manager, 'dynamo') as dynamo_mock:
+        feed_manager.trim_feeds(['uid1'], always=True)
+        assert dynamo_mock.mock_calls == []
+
+        feed_manager.max_items = 100
+        feed_manager.trim_feeds(['uid1', 'uid2'], always=True)
+        assert dynamo_mock.mock_calls == [call.trim('uid1', 100), call.trim('uid2', 100)]
+
+        # without `always`, one time in max_items / 10 on average
+        dynamo_mock.reset_mock()
+        with patch('app.models.feed.manager.random.random', side_effect=[0.05, 0.15]):
+            feed_manager.trim_feeds(['uid1', 'uid2'])
+        assert dynamo_mock.mock_calls == [call.trim('uid1', 100)]
+
+
+def test_get_feed_page_falls_back_past_bounded_feed(
+    feed_manager, post_manager, follower_manager, user, user2, user3
+):
+    # user follows user2, but not user3. The feed was trimmed to its two most recent posts.
+    posts = [post_manager.add_post(user2, str(uuid4()), PostType.TEXT_ONLY, text='t') for _ in range(2)]
+    own_post = post_manager.add_post(user, str(uuid4()), PostType.TEXT_ONLY, text='t')
+    post_manager.add_post(user3, str(uuid4()), PostType.TEXT_ONLY, text='t')
+    follower_manager.dynamo.add_following(user.id, user2.id, FollowStatus.FOLLOWING)
+    feed_manager.dynamo.add_posts_to_feed(user.id, iter([posts[1].item, own_post.item]))
+
+    # unbounded feeds are read as they are
+    assert feed_manager.get_feed_page(user.id, 10) == ([own_post.id, posts[1].id], None)
+
+    # past the end of a bounded feed, posts are read from the users followed and the user themselves
+    feed_manager.max_items = 2
+    assert feed_manager.get_feed_page(user.id, 10) == ([own_post.id, posts[1].id, posts[0].id], None)
+    page, next_token = feed_manager.get_feed_page(user.id, 2)
+    assert page == [own_post.id, posts[1].id]
+    assert feed_manager.get_feed_page(user.id, 2, next_token=next_token) == ([posts[0].id], None)
+
+    # so are those of feeds that are not trimmed, but whose items expire
+    feed_manager.max_items = 0
+    feed_manager.dynamo.ttl = pendulum.duration(days=1)
+    assert feed_manager.get_feed_page(user.id, 10) == ([own_post.id, posts[1].id, posts[0].id], None)
+
+
+def test_get_feed_page_falls_back_to_every_user_followed(feed_manager, post_manager, user, user2, user3):
+    # user follows more users than are read in one chunk, user2 last of them. user3 is a pulled author.
+    user2_post = post_manager.add_post(user2, str(uuid4()), PostType.TEXT_ONLY, text='t')
+    user3_post = post_manager.add_post(user3, str(uuid4()), PostType.TEXT_ONLY, text='t')
+    followed_user_ids = [*(str(uuid4()) for _ in range(150)), user3.id, user2.id]
+    feed_manager.max_items = 2
+
+    read_user_ids = []
+    generate_completed_posts_by_user = feed_manager.post_manager.dynamo.generate_completed_posts_by_user
+
+    def read_posts(user_id, *args, **kwargs):
+        read_user_ids.append(user_id)
+        return generate_completed_posts_by_user(user_id, *args, **kwargs)
+
+    with patch.object(
+        feed_manager.follower_manager, 'generate_followed_user_ids', return_value=iter(followed_user_ids)
+    ), patch.object(
+        feed_manager, 'generate_followed_pulled_author_ids', return_value=iter([user3.id])
+    ), patch.object(
+        feed_manager.post_manager.dynamo, 'generate_completed_posts_by_user', side_effect=read_posts
+    ):
+        assert feed_manager.get_feed_page(user.id, 10) == ([user3_post.id, user2_post.id], None)
+
+    # every user followed is read from, the pulled author just the once
+    assert sorted(read_user_ids) == sorted([user.id, *followed_user_ids])
+
+
+def test_add_users_posts_to_feed_windowed(feed_manager, post_manager, user):
+    now = pendulum.now('utc')
+    posts = [
+        post_manager.add_post(user, str(uuid4()), PostType.TEXT_ONLY, text='t', now=now.subtract(days=days))
+        for days in (9, 5, 3, 1)
+    ]
+
+    # at most two posts
+    feed_manager.backfill_max_posts = 2
+    feed_manager.add_users_posts_to_feed('fuid1', user.id)
+    assert sorted(i['postId'] for i in feed_manager.dynamo.generate_items('fuid1')) == sorted(
+        [posts[2].id, posts[3].id]
+    )
+    assert feed_manager.backfill_gaps_dynamo.get_gaps('fuid1') == {user.id: posts[2].item['postedAt']}
+
+    # posted within the last four days, which the limit on posts doesn't reach
+    feed_manager.backfill_days = 4
+    feed_manager.backfill_max_posts = 3
+    feed_manager.add_users_posts_to_feed('fuid2', user.id)
+    assert sorted(i['postId'] for i in feed_manager.dynamo.generate_items('fuid2')) == sorted(
+        [posts[2].id, posts[3].id]
+    )
+    assert feed_manager.backfill_gaps_dynamo.get_gaps('fuid2') == {user.id: posts[2].item['postedAt']}
+
+    # none within the window
+    feed_manager.backfill_days = 0.5
+    with patch('app.models.feed.manager.pendulum.now', return_value=now):
+        feed_manager.add_users_posts_to_feed('fuid3', user.id)
+    assert list(feed_manager.dynamo.generate_items('fuid3')) == []
+    assert feed_manager.backfill_gaps_dynamo.get_gaps('fuid3') == {
+        user.id: now.subtract(days=0.5).to_iso8601_string()
+    }
+
+    # the whole history fits, any earlier gap is forgotten
+    feed_manager.backfill_days = 10
+    feed_manager.backfill_max_posts = 4
+    feed_manager.add_users_posts_to_feed('fuid1', user.id)
+    assert len(list(feed_manager.dynamo.generate_items('fuid1'))) == 4
+    assert feed_manager.backfill_gaps_dynamo.get_gaps('fuid1') == {}
+
+
+def test_get_feed_page_fills_backfill_gaps(feed_manager, post_manager, follower_manager, user, user2, user3):
+    # user follows user2 and user3. Only the latest of user3's posts, which predate user2's, was backfilled.
+    user3_posts = [post_manager.add_post(user3, str(uuid4()), PostType.TEXT_ONLY, text='t') for _ in range(4)]
+    user2_posts = [post_manager.add_post(user2, str(uuid4()), PostType.TEXT_ONLY, text='t') for _ in range(2)]
+    for followed_user in (user2, user3):
+        follower_manager.dynamo.add_following(user.id, followed_user.id, FollowStatus.FOLLOWING)
+    feed_manager.add_users_posts_to_feed(user.id, user2.id)
+    feed_manager.backfill_max_posts = 1
+    feed_manager.add_users_posts_to_feed(user.id, user3.id)
+    post_ids = [p.id for p in reversed(user3_posts + user2_posts)]
+    assert sorted(i['postId'] for i in feed_manager.dynamo.generate_items(user.id)) == sorted(post_ids[:3])
+
+    # the first two pages don't reach past the gap
+    page, next_token = feed_manager.get_feed_page(user.id, 1)
+    assert page == post_ids[:1]
+    page, next_token = feed_manager.get_feed_page(user.id, 2, next_token=next_token)
+    assert page == post_ids[1:3]
+    assert len(list(feed_manager.dynamo.generate_items(user.id))) == 3
+
+    # the next does, and two more posts are filled in
+    page, next_token = feed_manager.get_feed_page(user.id, 2, next_token=next_token)
+    assert page == post_ids[3:5]
+    assert len(list(feed_manager.dynamo.generate_items(user.id))) == 5
+    assert feed_manager.backfill_gaps_dynamo.get_gaps(user.id) == {user3.id: user3_posts[1].item['postedAt']}
+
+    # the last gets the last post
+    page, next_token = feed_manager.get_feed_page(user.id, 2, next_token=next_token)
+    assert page == post_ids[5:]
+    assert next_token is None
+    assert sorted(i['postId'] for i in feed_manager.dynamo.generate_items(user.id)) == sorted(post_ids)
+    assert feed_manager.backfill_gaps_dynamo.get_gaps(user.id) == {}
+
+    # unfollowing forgets any gap
+    feed_manager.backfill_gaps_dynamo.set_gap(user.id, user3.id, user3_posts[1].item['postedAt'])
+    follow_item = follower_manager.dynamo.get_following(user.id, user3.id)
+    feed_manager.on_user_follow_status_change_sync_feed(user3.id, old_item=follow_item)
+    assert feed_manager.backfill_gaps_dynamo.get_gaps(user.id) == {}
+
+
+def test_get_feed_page_fills_a_capped_number_of_backfill_gaps(
+    feed_manager, post_manager, follower_manager, user, user2, user3
+):
+    # user follows user2 and user3, only the latest of each of their posts was backfilled
+    user2_posts = [post_manager.add_post(user2, str(uuid4()), PostType.TEXT_ONLY, text='t') for _ in range(2)]
+    user3_posts = [post_manager.add_post(user3, str(uuid4()), PostType.TEXT_ONLY, text='t') for _ in range(2)]
+    feed_manager.backfill_max_posts = 1
+    for followed_user in (user2, user3):
+        follower_manager.dynamo.add_following(user.id, followed_user.id, FollowStatus.FOLLOWING)
+        feed_manager.add_users_posts_to_feed(user.id, followed_user.id)
+    post_ids = [p.id for p in reversed(user2_posts + user3_posts)]
+    feed_manager.backfill_max_gaps_per_read = 1
+
+    # the page fills in the gap it reaches first, and stops short of the other
+    page, next_token = feed_manager.get_feed_page(user.id, 10)
+    assert page == post_ids[:3]
+    assert next_token
+    assert feed_manager.backfill_gaps_dynamo.get_gaps(user.id) == {user2.id: user2_posts[1].item['postedAt']}
+
+    # which the next page fills in
+    assert feed_manager.get_feed_page(user.id, 10, next_token=next_token) == (post_ids[3:], None)
+    assert feed_manager.backfill_gaps_dynamo.get_gaps(user.id) == {}
+    assert sorted(i['postId'] for i in feed_manager.dynamo.generate_items(user.id)) == sorted(post_ids)
@@ -57,17 +57,17 @@ def test_on_user_follow_status_change_sync_feed_stops_following(feed_manager, fo
 
 def test_on_post_status_change_sync_feed_post_completed(feed_manager, post):
     assert post.item['postStatus'] == PostStatus.COMPLETED
-    user_ids = [str(uuid4()), str(uuid4())]
-    with patch.object(feed_manager, 'add_post_to_followers_feeds', return_value=user_ids) as add_post_mock:
-        with patch.object(feed_manager, 'dynamo') as dynamo_mock:
+    with patch.object(feed_manager, 'add_post_to_followers_feeds') as add_post_mock:
+        with patch.object(feed_manager, 'delete_by_post') as delete_by_post_mock:
             with patch.object(feed_manager, 'appsync_client') as appsync_client_mock:
                 feed_manager.on_post_status_change_sync_feed(post.id, new_item=post.item)
     assert add_post_mock.mock_calls == [call(post.user_id, post.item)]
-    assert dynamo_mock.mock_calls == []
+    assert delete_by_post_mock.mock_calls == []
+    # the author's own feed is written right away, the fan-out job notifies the followers
     assert appsync_client_mock.mock_calls == [
-        call.fire_notification(user_ids[0], GqlNotificationType.USER_FEED_CHANGED),
-        call.fire_notification(user_ids[1], GqlNotificationType.USER_FEED_CHANGED),
+        call.fire_notification(post.user_id, GqlNotificationType.USER_FEED_CHANGED),
     ]
+    assert [i['postId'] for i in feed_manager.dynamo.generate_items(post.user_id)] == [post.id]
 
 
 @pytest.mark.parametrize(
@@ -77,14 +77,56 @@ def test_on_post_status_change_sync_feed_post_completed(feed_manager, post):
 def test_on_post_status_change_sync_feed_post_uncompleted(feed_manager, post, status):
     old_item = {**post.item, 'postStatus': 'COMPLETED'}
     new_item = {**post.item, 'postStatus': status}
-    user_ids = [str(uuid4()), str(uuid4())]
     with patch.object(feed_manager, 'add_post_to_followers_feeds') as add_post_mock:
-        with patch.object(feed_manager, 'dynamo', **{'delete_by_post.return_value': user_ids}) as dynamo_mock:
+        with patch.object(feed_manager, 'delete_by_post') as delete_by_post_mock:
             with patch.object(feed_manager, 'appsync_client') as appsync_client_mock:
                 feed_manager.on_post_status_change_sync_feed(post.id, new_item=new_item, old_item=old_item)
     assert add_post_mock.mock_calls == []
-    assert dynamo_mock.mock_calls == [call.delete_by_post(post.id)]
+    assert delete_by_post_mock.mock_calls == [call(post.id)]
+    assert appsync_client_mock.mock_calls == []
+
+
+@pytest.mark.parametrize(
+    'old_status, new_status',
+    [
+        (None, PostStatus.PENDING),
+        (PostStatus.PENDING, PostStatus.PROCESSING),
+        (PostStatus.PROCESSING, PostStatus.ERROR),
+        (PostStatus.ARCHIVED, PostStatus.DELETING),
+    ],
+)
+def test_on_post_status_change_sync_feed_post_never_completed(feed_manager, post, old_status, new_status):
+    old_item = {**post.item, 'postStatus': old_status} if old_status else None
+    new_item = {**post.item, 'postStatus': new_status}
+    with patch.object(feed_manager, 'add_post_to_followers_feeds') as add_post_mock:
+        with patch.object(feed_manager, 'delete_by_post') as delete_by_post_mock:
+            feed_manager.on_post_status_change_sync_feed(post.id, new_item=new_item, old_item=old_item)
+    assert add_post_mock.mock_calls == []
+    assert delete_by_post_mock.mock_calls == []
+
+
+def test_on_user_follow_status_change_sync_feed_starts_following_pulled_author(
+    feed_manager, follower, user1, user2
+):
+    feed_manager.pulled_authors_dynamo.add_user_id(user2.id)
+    with patch.object(feed_manager, 'add_users_posts_to_feed') as add_users_posts_to_feed_mock:
+        with patch.object(feed_manager, 'appsync_client') as appsync_client_mock:
+            feed_manager.on_user_follow_status_change_sync_feed(user2.id, new_item=follower.item)
+    assert add_users_posts_to_feed_mock.mock_calls == []
+    assert appsync_client_mock.mock_calls == [
+        call.fire_notification(user1.id, GqlNotificationType.USER_FEED_CHANGED),
+    ]
+
+
+def test_on_post_status_change_sync_feed_post_completed_by_pulled_author(feed_manager, post, user1):
+    feed_manager.pull_min_followers = 1
+    feed_manager.user_manager.dynamo.increment_follower_count(user1.id)
+    with patch.object(feed_manager, 'add_post_to_followers_feeds') as add_post_mock:
+        with patch.object(feed_manager, 'appsync_client') as appsync_client_mock:
+            feed_manager.on_post_status_change_sync_feed(post.id, new_item=post.item)
+    assert add_post_mock.mock_calls == []
     assert appsync_client_mock.mock_calls == [
-        call.fire_notification(user_ids[0], GqlNotificationType.USER_FEED_CHANGED),
-        call.fire_notification(user_ids[1], GqlNotificationType.USER_FEED_CHANGED),
+        call.fire_notification(user1.id, GqlNotificationType.USER_FEED_CHANGED),
     ]
+    assert feed_manager.pulled_authors_dynamo.get_user_ids() == {user1.id}
+    assert [i['postId'] for i in feed_manager.dynamo.generate_items(user1.id)] == [post.id]
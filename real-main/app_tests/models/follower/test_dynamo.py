@@ -50,6 +50,18 @@ def test_add_following(follower_dynamo, user1, user2):
     }
 
 
+def test_batch_get_followings(follower_dynamo, user1, user2):
+    assert follower_dynamo.batch_get_followings(user1.id, []) == []
+    assert follower_dynamo.batch_get_followings(user1.id, [user2.id]) == [None]
+
+    follower_dynamo.add_following(user1.id, user2.id, FollowStatus.FOLLOWING)
+    follow_items = follower_dynamo.batch_get_followings(user1.id, ['uid-nope', user2.id])
+    assert follow_items[0] is None
+    assert follow_items[1]['followedUserId'] == user2.id
+    assert follow_items[1]['followStatus'] == FollowStatus.FOLLOWING
+    assert follower_dynamo.batch_get_followings(user2.id, [user1.id]) == [None]
+
+
 def test_add_following_timestamp(follower_dynamo, user1, user2):
     # timestamp is set when the query is compiled, not executed
     before = pendulum.now('utc')
@@ -170,3 +182,19 @@ def test_generate_followeds(follower_dynamo, user1, user2, user3):
     assert resp[0]['followedUserId'] == other1_user.id
     assert resp[1]['followerUserId'] == our_user.id
     assert resp[1]['followedUserId'] == other2_user.id
+
+
+def test_query_follower_items(follower_dynamo, user1, user2, user3):
+    assert follower_dynamo.query_follower_items(user1.id, 10) == {'items': [], 'nextToken': None}
+
+    follower_dynamo.add_following(user2.id, user1.id, FollowStatus.FOLLOWING)
+    follower_dynamo.add_following(user3.id, user1.id, FollowStatus.FOLLOWING)
+    follower_dynamo.add_following(user1.id, user2.id, FollowStatus.FOLLOWING)
+
+    page = follower_dynamo.query_follower_items(user1.id, 1, fields=['followerUserId'])
+    assert len(page['items']) == 1
+    assert page['nextToken']
+    follower_user_ids = [page['items'][0]['followerUserId']]
+    page = follower_dynamo.query_follower_items(user1.id, 1, page['nextToken'], fields=['followerUserId'])
+    follower_user_ids.extend(item['followerUserId'] for item in page['items'])
+    assert sorted(follower_user_ids) == sorted([user2.id, user3.id])
@@ -36,6 +36,15 @@ def test_post_add_and_delete(post_dynamo):
     assert post_dynamo.get_post(post_id) is None
 
 
+def test_get_posts(post_dynamo):
+    assert post_dynamo.get_posts([]) == []
+    assert post_dynamo.get_posts(['pid1', 'pid2']) == [None, None]
+
+    post1 = post_dynamo.add_pending_post('uid', 'pid1', 'ptype', text='lore ipsum')
+    post2 = post_dynamo.add_pending_post('uid', 'pid2', 'ptype', text='lore ipsum')
+    assert post_dynamo.get_posts(['pid2', 'pid3', 'pid1']) == [post2, None, post1]
+
+
 def test_add_pending_post_sans_options(post_dynamo):
     user_id = 'pbuid'
     post_id = 'pid'
@@ -170,6 +179,43 @@ def test_generate_posts_by_user(post_dynamo):
     assert [p['postId'] for p in post_dynamo.generate_posts_by_user(user_id, completed=False)] == [post_id_2]
 
 
+def test_generate_completed_posts_by_user(post_dynamo):
+    user_id = 'uid'
+    assert list(post_dynamo.generate_completed_posts_by_user(user_id)) == []
+
+    # bait: a completed post by another user and a pending post by our user
+    post_item = post_dynamo.add_pending_post('other-uid', 'pidX', 'ptype', text='lore ipsum')
+    post_dynamo.set_post_status(post_item, PostStatus.COMPLETED)
+    post_dynamo.add_pending_post(user_id, 'pidP', 'ptype', text='lore ipsum')
+
+    post_items = []
+    for i in range(3):
+        post_item = post_dynamo.add_pending_post(user_id, f'pid{i}', 'ptype', text='lore ipsum')
+        post_items.append(post_dynamo.set_post_status(post_item, PostStatus.COMPLETED))
+
+    # most recently posted first
+    post_ids = [p['postId'] for p in post_dynamo.generate_completed_posts_by_user(user_id)]
+    assert post_ids == ['pid2', 'pid1', 'pid0']
+
+    # posted strictly before
+    before = post_items[1]['postedAt']
+    post_ids = [
+        p['postId'] for p in post_dynamo.generate_completed_posts_by_user(user_id, before_posted_at=before)
+    ]
+    assert post_ids == ['pid0']
+    post_ids = [
+        p['postId']
+        for p in post_dynamo.generate_completed_posts_by_user(user_id, page_size=1, before_posted_at='~')
+    ]
+    assert post_ids == ['pid2', 'pid1', 'pid0']
+
+    # or posted at the same time, before by post id
+    post_ids = [
+        p['postId'] for p in post_dynamo.generate_completed_posts_by_user(user_id, before, before_post_id='pid2')
+    ]
+    assert post_ids == ['pid1', 'pid0']
+
+
 def test_set_post_status(post_dynamo):
     post_id = 'my-post-id'
     user_id = 'my-user-id'
@@ -1049,3 +1095,14 @@ def test_increment_decrement_count(post_dynamo, caplog, incrementor_name, decrem
         assert caplog.records[0].levelname == 'WARNING'
         assert all(x in caplog.records[0].msg for x in ['Failed to decrement', attribute_name, post_id])
         assert post_dynamo.get_post(post_id)[attribute_name] == 0
+
+
+def test_expired_posts_scan_checkpoint(post_dynamo):
+    assert post_dynamo.get_expired_posts_scan_checkpoint() is None
+
+    checkpoint = {'0': None, '1': {'partitionKey': 'post/pid', 'sortKey': '-'}}
+    post_dynamo.set_expired_posts_scan_checkpoint(checkpoint)
+    assert post_dynamo.get_expired_posts_scan_checkpoint() == checkpoint
+
+    post_dynamo.set_expired_posts_scan_checkpoint(None)
+    assert post_dynamo.get_expired_posts_scan_checkpoint() is None
@@ -1,5 +1,6 @@
 import logging
 import uuid
+from unittest.mock import Mock, patch
 
 import pendulum
 import pytest
@@ -510,6 +511,91 @@ def test_delete_older_expired_posts(post_manager, user, caplog):
     assert post_expired_last_week.refresh_item().item is None
 
 
+def test_delete_older_expired_posts_resumes_where_it_stopped(post_manager, user, caplog):
+    now = pendulum.now('utc')
+    posts = [
+        post_manager.add_post(
+            user,
+            f'pid{i}',
+            PostType.TEXT_ONLY,
+            text='t',
+            lifetime_duration=pendulum.duration(hours=1),
+            now=(now - pendulum.duration(days=7)),
+        )
+        for i in range(3)
+    ]
+
+    # a run that is told to stop straight away deletes nothing, but saves its progress
+    post_manager.delete_older_expired_posts(should_stop=lambda: True)
+    assert len(caplog.records) == 0
+    assert all(post.refresh_item().item for post in posts)
+    assert post_manager.dynamo.get_expired_posts_scan_checkpoint() is not None
+
+    # the next run finishes the job and clears the checkpoint
+    post_manager.delete_older_expired_posts()
+    assert len(caplog.records) == 3
+    assert not any(post.refresh_item().item for post in posts)
+    assert post_manager.dynamo.get_expired_posts_scan_checkpoint() is None
+
+
+def test_delete_older_expired_posts_saves_progress_as_it_goes(post_manager, user, caplog):
+    now = pendulum.now('utc')
+    posts = [
+        post_manager.add_post(
+            user,
+            f'pid{i}',
+            PostType.TEXT_ONLY,
+            text='t',
+            lifetime_duration=pendulum.duration(hours=1),
+            now=(now - pendulum.duration(days=7)),
+        )
+        for i in range(3)
+    ]
+
+    # force the scan to return one item per page
+    client = post_manager.dynamo.client
+    scan = client.table.scan
+    table = Mock(wraps=client.table, **{'scan.side_effect': lambda **kwargs: scan(**kwargs, Limit=1)})
+
+    # a run that dies after its first deletion, without getting a chance to stop cleanly
+    def delete_once(post_item):
+        if len(caplog.records) > 1:
+            raise Exception('timed out')
+        return init_post(post_item)
+
+    init_post = post_manager.init_post
+    with patch.object(client, 'table', table), patch.object(post_manager, 'init_post', delete_once):
+        with pytest.raises(Exception, match='timed out'):
+            post_manager.delete_older_expired_posts()
+    assert sum(post.refresh_item().item is None for post in posts) == 1
+    checkpoint = post_manager.dynamo.get_expired_posts_scan_checkpoint()
+    assert checkpoint and any(checkpoint.values())
+
+    # a run that is told to stop once it has deleted another post, which happens between pages
+    caplog.clear()
+    with patch.object(client, 'table', table):
+        post_manager.delete_older_expired_posts(should_stop=lambda: len(caplog.records) > 0)
+    assert len(caplog.records) == 1
+    assert sum(post.refresh_item().item is None for post in posts) == 2
+    assert post_manager.dynamo.get_expired_posts_scan_checkpoint()
+
+    # the next run finishes the job from where the last one left off and clears the checkpoint
+    caplog.clear()
+    table.scan.reset_mock()
+    with patch.object(client, 'table', table):
+        post_manager.delete_older_expired_posts()
+    assert len(caplog.records) == 1
+    assert not any(post.refresh_item().item for post in posts)
+    assert post_manager.dynamo.get_expired_posts_scan_checkpoint() is None
+    resumed_scan_count = table.scan.call_count
+
+    # which took fewer pages than scanning the whole table
+    table.scan.reset_mock()
+    with patch.object(client, 'table', table):
+        post_manager.delete_older_expired_posts()
+    assert resumed_scan_count < table.scan.call_count
+
+
 def test_set_post_status_to_error(post_manager, user_manager, user):
     # create a COMPLETED post, verify cannot transition it to ERROR
     post = post_manager.add_post(user, 'pid1', PostType.TEXT_ONLY, text='t')
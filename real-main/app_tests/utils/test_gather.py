@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+from app.utils import gather
+
+
+def test_gather_returns_results_in_order():
+    assert gather() == []
+    assert gather(lambda: 1) == [1]
+    assert gather(lambda: 1, lambda: 'b', lambda: None) == [1, 'b', None]
+
+
+def test_gather_calls_concurrently():
+    # each call waits for all the others to start, so this would deadlock if they were serial
+    barrier = threading.Barrier(3, timeout=5)
+    start = time.monotonic()
+    assert gather(barrier.wait, barrier.wait, barrier.wait) is not None
+    assert time.monotonic() - start < 5
+
+
+def test_gather_max_workers():
+    active, most_active, lock = [0], [0], threading.Lock()
+
+    def call(i):
+        with lock:
+            active[0] += 1
+            most_active[0] = max(most_active[0], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        return i
+
+    assert gather(*(lambda i=i: call(i) for i in range(10)), max_workers=3) == list(range(10))
+    assert 1 < most_active[0] <= 3
+    most_active[0] = 0
+    assert gather(*(lambda i=i: call(i) for i in range(3)), max_workers=1) == [0, 1, 2]
+    assert most_active[0] == 1
+
+
+def test_gather_raises_first_exception():
+    def fail(msg):
+        raise Exception(msg)
+
+    with pytest.raises(Exception, match='first'):
+        gather(lambda: 1, lambda: fail('first'), lambda: fail('second'))
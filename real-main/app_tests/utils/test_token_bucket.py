@@ -0,0 +1,50 @@
+from unittest.mock import Mock
+
+import pytest
+
+from app.utils import TokenBucket
+
+
+@pytest.fixture
+def clock():
+    clock = Mock(return_value=100.0)
+    yield clock
+
+
+@pytest.fixture
+def sleep(clock):
+    # sleeping advances the clock
+    def inner(seconds):
+        clock.return_value += seconds
+
+    yield Mock(side_effect=inner)
+
+
+def test_bursts_up_to_capacity_then_waits(clock, sleep):
+    bucket = TokenBucket(2, clock=clock, sleep=sleep)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert sleep.call_count == 0
+
+    # bucket is empty, need to wait half a second for the next token
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert sleep.call_count == 1
+    assert bucket.acquire() == pytest.approx(0.5)
+
+
+def test_refills_over_time(clock, sleep):
+    bucket = TokenBucket(10, capacity=5, clock=clock, sleep=sleep)
+    assert bucket.acquire(5) == 0
+
+    # refills at the rate, but never past capacity
+    clock.return_value += 0.2
+    assert bucket.acquire(2) == 0
+    clock.return_value += 100
+    assert bucket.acquire(5) == 0
+    assert bucket.acquire() == pytest.approx(0.1)
+
+
+def test_fractional_rate(clock, sleep):
+    bucket = TokenBucket(0.5, clock=clock, sleep=sleep)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(2)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+# the stream handler builds its clients at import, which needs their config, though no calls are made
+for name, value in {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_XRAY_SDK_ENABLED': 'false',
+    'APPSYNC_GRAPHQL_URL': 'https://appsync.example.com/graphql',
+    'DYNAMO_TABLE': 'benchmark',
+    'DYNAMO_FEED_TABLE': 'benchmark-feed',
+    'DYNAMO_STREAM_LEDGER_TABLE': 'benchmark-stream-ledger',
+    'ELASTICSEARCH_DOMAIN': 'elasticsearch.example.com',
+    'PINPOINT_APPLICATION_ID': 'benchmark',
+    'S3_UPLOADS_BUCKET': 'benchmark',
+    'SQS_FEED_FAN_OUT_QUEUE_URL': 'https://sqs.us-east-1.amazonaws.com/000000000000/benchmark',
+}.items():
+    os.environ.setdefault(name, value)
+
+# https://stackoverflow.com/questions/16981921
+SCRIPT_PATH = os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(SCRIPT_PATH)))
+from app.handlers.dynamo.deserialize import LazyImage  # noqa E402
+from app.handlers.dynamo.handlers import dispatch  # noqa E402
+
+DEFAULT_RECORDS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(SCRIPT_PATH)), 'app_tests', 'fixtures', 'dynamo-stream-records.jsonl'
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark searching the stream listener registry with a linear scan vs the index'
+    )
+    parser.add_argument(
+        '-f', dest='path', default=DEFAULT_RECORDS_PATH, help='JSONL file of stream records, one per line',
+    )
+    parser.add_argument('-n', dest='number', type=int, default=1000, help='passes over the records to time')
+    args = parser.parse_args()
+    return args.path, args.number
+
+
+def linear_search(pk_prefix, sk_prefix, event_name, old_item, new_item):
+    "The search the index replaced: compares the attributes of every listener, one listener at a time"
+    matches = []
+    for listener in dispatch.listeners[pk_prefix][sk_prefix][event_name]:
+        if not listener['attributes']:
+            matches.append(listener['handler'])
+            continue
+        for attr_name, attr_default in listener['attributes'].items():
+            if old_item.get(attr_name, attr_default) != new_item.get(attr_name, attr_default):
+                matches.append(listener['handler'])
+                break
+    return matches
+
+
+def search_args(records):
+    for record in records:
+        pk_prefix = record['dynamodb']['Keys']['partitionKey']['S'].split('/')[0]
+        sk_prefix = record['dynamodb']['Keys']['sortKey']['S'].split('/')[0]
+        yield pk_prefix, sk_prefix, record['eventName'], record['dynamodb']
+
+
+def main():
+    path, number = parse_args()
+    with open(path) as fh:
+        records = [json.loads(line) for line in fh if line.strip()]
+    args = list(search_args(records))
+
+    # images are rebuilt every pass, as the stream handler builds them once per record
+    def run(search):
+        return [
+            search(
+                pk_prefix, sk_prefix, name, LazyImage(images.get('OldImage')), LazyImage(images.get('NewImage'))
+            )
+            for pk_prefix, sk_prefix, name, images in args
+        ]
+
+    assert run(linear_search) == run(dispatch.search), 'Searches disagree'
+    cases = {
+        'linear search': lambda: run(linear_search),
+        'indexed search': lambda: run(dispatch.search),
+    }
+
+    print(f'{len(records)} records, {number} passes')
+    baseline = None
+    for name, func in cases.items():
+        seconds = timeit.timeit(func, number=number)
+        baseline = baseline or seconds
+        per_record = seconds / number / len(records) * 1e6
+        print(f'{name:<36} {seconds:8.3f}s {per_record:8.1f}us/record {baseline / seconds:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+from boto3.dynamodb.types import TypeDeserializer
+
+# https://stackoverflow.com/questions/16981921
+SCRIPT_PATH = os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(SCRIPT_PATH)))
+from app.handlers.dynamo.deserialize import LazyImage, deserialize  # noqa E402
+
+DEFAULT_RECORDS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(SCRIPT_PATH)), 'app_tests', 'fixtures', 'dynamo-stream-records.jsonl'
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark deserialization of dynamo stream records with TypeDeserializer vs our own'
+    )
+    parser.add_argument(
+        '-f', dest='path', default=DEFAULT_RECORDS_PATH, help='JSONL file of stream records, one per line',
+    )
+    parser.add_argument('-n', dest='number', type=int, default=1000, help='passes over the records to time')
+    args = parser.parse_args()
+    return args.path, args.number
+
+
+def images(records):
+    return [
+        record['dynamodb'].get(image_name) or {} for record in records for image_name in ('OldImage', 'NewImage')
+    ]
+
+
+def main():
+    path, number = parse_args()
+    with open(path) as fh:
+        records = [json.loads(line) for line in fh if line.strip()]
+    typed_items = images(records)
+
+    type_deserialize = TypeDeserializer().deserialize
+    cases = {
+        'TypeDeserializer, all attributes': lambda: [
+            {k: type_deserialize(v) for k, v in typed_item.items()} for typed_item in typed_items
+        ],
+        'deserialize, all attributes': lambda: [
+            {k: deserialize(v) for k, v in typed_item.items()} for typed_item in typed_items
+        ],
+        # what the stream handler does for a record with no matching listeners, typically
+        'LazyImage, one attribute': lambda: [
+            LazyImage(typed_item).get('postStatus') for typed_item in typed_items
+        ],
+    }
+
+    print(f'{len(records)} records, {number} passes')
+    baseline = None
+    for name, func in cases.items():
+        seconds = timeit.timeit(func, number=number)
+        baseline = baseline or seconds
+        per_record = seconds / number / len(records) * 1e6
+        print(f'{name:<36} {seconds:8.3f}s {per_record:8.1f}us/record {baseline / seconds:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+import json
+import os
+import sys
+
+# the stream handler builds its clients at import, which needs their config, though no calls are made
+for name, value in {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_XRAY_SDK_ENABLED': 'false',
+    'APPSYNC_GRAPHQL_URL': 'https://appsync.example.com/graphql',
+    'DYNAMO_TABLE': 'filter-criteria',
+    'DYNAMO_FEED_TABLE': 'filter-criteria-feed',
+    'DYNAMO_STREAM_LEDGER_TABLE': 'filter-criteria-stream-ledger',
+    'ELASTICSEARCH_DOMAIN': 'elasticsearch.example.com',
+    'PINPOINT_APPLICATION_ID': 'filter-criteria',
+    'S3_UPLOADS_BUCKET': 'filter-criteria',
+    'SQS_FEED_FAN_OUT_QUEUE_URL': 'https://sqs.us-east-1.amazonaws.com/000000000000/filter-criteria',
+}.items():
+    os.environ.setdefault(name, value)
+
+# https://stackoverflow.com/questions/16981921
+SCRIPT_PATH = os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(SCRIPT_PATH)))
+from app.handlers.dynamo.handlers import dispatch  # noqa E402
+
+
+def main():
+    "Print the filter criteria of the stream handler's event source mapping, built from its listeners"
+    print(json.dumps(dispatch.filter_criteria(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+
+import argparse
+import collections
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from unittest import mock
+
+import boto3
+import moto
+import pendulum
+from boto3.dynamodb.types import TypeSerializer
+
+# the stream handler builds its clients at import, which needs their config. All aws calls are mocked.
+for name, value in {
+    'AWS_ACCESS_KEY_ID': 'replay',
+    'AWS_SECRET_ACCESS_KEY': 'replay',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_XRAY_SDK_ENABLED': 'false',
+    'APPSYNC_GRAPHQL_URL': 'https://appsync.example.com/graphql',
+    'DYNAMO_TABLE': 'replay',
+    'DYNAMO_FEED_TABLE': 'replay-feed',
+    'DYNAMO_STREAM_LEDGER_TABLE': 'replay-stream-ledger',
+    'ELASTICSEARCH_DOMAIN': 'elasticsearch.example.com',
+    'PINPOINT_APPLICATION_ID': 'replay',
+    'S3_UPLOADS_BUCKET': 'replay',
+    'SQS_FEED_FAN_OUT_QUEUE_URL': 'https://sqs.us-east-1.amazonaws.com/000000000000/replay',
+}.items():
+    os.environ.setdefault(name, value)
+
+# https://stackoverflow.com/questions/16981921
+SCRIPT_PATH = os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(SCRIPT_PATH)))
+from app.clients import LocalQueueClient  # noqa E402
+from app.handlers.dynamo.telemetry import ListenerTelemetry  # noqa E402
+from app.models.follower.enums import FollowStatus  # noqa E402
+from app.models.like.enums import LikeStatus  # noqa E402
+from app.models.post.enums import PostStatus, PostType  # noqa E402
+from app_tests.dynamodb.table_schema import (  # noqa E402
+    feed_table_schema,
+    main_table_schema,
+    stream_ledger_table_schema,
+)
+
+DEFAULT_RECORDS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(SCRIPT_PATH)), 'app_tests', 'fixtures', 'dynamo-stream-records.jsonl'
+)
+DEFAULT_MIX = 'post=1,like=4,follow=1,chatMessage=3,user=1'
+# clients of services other than dynamo, whose methods are replaced with mocks
+EXTERNAL_CLIENTS = ('appstore', 'appsync', 'elasticsearch', 'pinpoint', 's3_uploads')
+# except for these, which don't call the service themselves
+UNMOCKED_METHODS = (
+    'fire_notification',
+    'notification_batch',
+    'flush_notifications',
+    'debounce',
+    'send_notification_chunks',
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            'Replay dynamo stream records through the stream handler against a mocked table, and report '
+            'throughput, per-listener latency and dynamo operations per record'
+        )
+    )
+    parser.add_argument(
+        '-f', dest='path', default=DEFAULT_RECORDS_PATH, help='JSONL file of stream records, one per line',
+    )
+    parser.add_argument(
+        '--synthetic', type=int, metavar='N', help='replay N generated records instead of those of the file',
+    )
+    parser.add_argument(
+        '--mix', default=DEFAULT_MIX, help=f'relative weights of the kinds of generated records: {DEFAULT_MIX}',
+    )
+    parser.add_argument('--users', type=int, default=20, help='users to seed before generating records')
+    parser.add_argument('--batch-size', type=int, default=100, help='records per call of the handler')
+    parser.add_argument('--workers', type=int, default=1, help='max workers of the stream processor')
+    parser.add_argument('--fan-out-workers', type=int, default=1, help='workers draining feed fan-out jobs')
+    parser.add_argument('--lanes', help='lanes of the stream processor, ex: user,post+comment,chat+chatMessage')
+    parser.add_argument(
+        '--no-seed', dest='seed', action='store_false', help='do not seed the table with the items of the file',
+    )
+    return parser.parse_args()
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        kind, weight = part.split('=')
+        assert kind in SyntheticStream.kinds, f'Unknown kind of record `{kind}`'
+        weights[kind] = float(weight)
+    return weights
+
+
+def create_tables():
+    resource = boto3.resource('dynamodb')
+    for table_name, schema in (
+        (os.environ['DYNAMO_TABLE'], main_table_schema),
+        (os.environ['DYNAMO_FEED_TABLE'], feed_table_schema),
+        (os.environ['DYNAMO_STREAM_LEDGER_TABLE'], stream_ledger_table_schema),
+    ):
+        resource.create_table(**{**schema, 'TableName': table_name})
+
+
+def seed_items(dynamo_client, records):
+    "Put the latest image of each item in the `records` that still exists at the end of them"
+    items = {}
+    for record in records:
+        keys = record['dynamodb']['Keys']
+        items[(keys['partitionKey']['S'], keys['sortKey']['S'])] = record['dynamodb'].get('NewImage')
+    for item in filter(None, items.values()):
+        dynamo_client.boto3_client.put_item(TableName=dynamo_client.table_name, Item=item)
+
+
+class SyntheticStream:
+    """
+    Generates stream records by making writes to the table, the way the api would, and recording the item's
+    images from before and after each write. All the records are generated before any are processed, so
+    listeners see items in their state at the end of the stream, as they may when processing a lagging stream.
+    """
+
+    kinds = ('post', 'like', 'follow', 'chatMessage', 'user')
+
+    def __init__(self, managers, dynamo_client, weights):
+        self.managers = managers
+        self.client = dynamo_client
+        self.weights = weights
+        self.serialize = TypeSerializer().serialize
+        self.sequence_numbers = itertools.count(1)
+        self.user_ids, self.post_items, self.chats = [], [], []
+        self.likes, self.follows = set(), set()
+
+    def seed(self, user_count):
+        "Add users, each with a couple of posts and a direct chat with the next user"
+        for _ in range(user_count):
+            user_id = str(uuid.uuid4())
+            self.managers['user'].dynamo.add_user(user_id, f'user{user_id[:8]}')
+            self.user_ids.append(user_id)
+            for _ in range(2):
+                self.post_items.append(self.add_completed_post(user_id))
+        for user_id, with_user_id in zip(self.user_ids, self.user_ids[1:]):
+            chat_id = str(uuid.uuid4())
+            self.managers['chat'].add_direct_chat(chat_id, user_id, with_user_id)
+            self.chats.append((chat_id, (user_id, with_user_id)))
+
+    def add_completed_post(self, user_id):
+        post_dynamo = self.managers['post'].dynamo
+        post_item = post_dynamo.add_pending_post(
+            user_id, str(uuid.uuid4()), PostType.TEXT_ONLY, text='lore ipsum'
+        )
+        return post_dynamo.set_post_status(post_item, PostStatus.COMPLETED)
+
+    def generate(self, count):
+        kinds, weights = zip(*self.weights.items())
+        records = []
+        while len(records) < count:
+            records.extend(getattr(self, f'{random.choices(kinds, weights)[0]}_records')())
+        return records[:count]
+
+    def record(self, key, write):
+        "Make the `write` to the item of `key`, returning a stream record of the change, if any"
+        old_item = self.client.get_item(key)
+        write()
+        new_item = self.client.get_item(key)
+        if old_item is None and new_item is None:
+            return None
+        dynamodb = {
+            'Keys': {k: self.serialize(v) for k, v in key.items()},
+            'SequenceNumber': str(next(self.sequence_numbers)),
+            'StreamViewType': 'NEW_AND_OLD_IMAGES',
+        }
+        if old_item is not None:
+            dynamodb['OldImage'] = {k: self.serialize(v) for k, v in old_item.items()}
+        if new_item is not None:
+            dynamodb['NewImage'] = {k: self.serialize(v) for k, v in new_item.items()}
+        event_name = 'INSERT' if old_item is None else 'REMOVE' if new_item is None else 'MODIFY'
+        return {
+            'eventID': uuid.uuid4().hex,
+            'eventName': event_name,
+            'eventSource': 'aws:dynamodb',
+            'dynamodb': dynamodb,
+        }
+
+    def post_records(self):
+        post_dynamo = self.managers['post'].dynamo
+        user_id, post_id = random.choice(self.user_ids), str(uuid.uuid4())
+        key = post_dynamo.pk(post_id)
+        records = [
+            self.record(
+                key, lambda: post_dynamo.add_pending_post(user_id, post_id, PostType.TEXT_ONLY, text='hi')
+            ),
+            self.record(
+                key, lambda: post_dynamo.set_post_status(self.client.get_item(key), PostStatus.COMPLETED),
+            ),
+        ]
+        self.post_items.append(self.client.get_item(key))
+        return records
+
+    def like_records(self):
+        like_dynamo = self.managers['like'].dynamo
+        user_id, post_item = random.choice(self.user_ids), random.choice(self.post_items)
+        if (user_id, post_item['postId']) in self.likes:
+            return []
+        self.likes.add((user_id, post_item['postId']))
+        key = like_dynamo.pk(user_id, post_item['postId'])
+        return [self.record(key, lambda: like_dynamo.add_like(user_id, post_item, LikeStatus.ONYMOUSLY_LIKED))]
+
+    def follow_records(self):
+        follower_dynamo = self.managers['follower'].dynamo
+        follower_user_id, followed_user_id = random.sample(self.user_ids, 2)
+        if (follower_user_id, followed_user_id) in self.follows:
+            return []
+        self.follows.add((follower_user_id, followed_user_id))
+        key = follower_dynamo.pk(follower_user_id, followed_user_id)
+        return [
+            self.record(
+                key,
+                lambda: follower_dynamo.add_following(follower_user_id, followed_user_id, FollowStatus.FOLLOWING),
+            )
+        ]
+
+    def chatMessage_records(self):
+        chat_message_dynamo = self.managers['chat_message'].dynamo
+        chat_id, user_ids = random.choice(self.chats)
+        message_id = str(uuid.uuid4())
+        key = chat_message_dynamo.pk(message_id)
+        return [
+            self.record(
+                key,
+                lambda: chat_message_dynamo.add_chat_message(
+                    message_id, chat_id, random.choice(user_ids), 'hello', [], pendulum.now('utc')
+                ),
+            )
+        ]
+
+    def user_records(self):
+        user_dynamo = self.managers['user'].dynamo
+        user_id = random.choice(self.user_ids)
+        full_name = f'User {random.randint(0, 1000)}'
+        return [
+            self.record(
+                user_dynamo.pk(user_id), lambda: user_dynamo.set_user_details(user_id, full_name=full_name)
+            )
+        ]
+
+
+class CollectingTelemetry(ListenerTelemetry):
+    def emit(self):
+        pass  # stats are reported once the replay is done, rather than logged per batch
+
+
+class UsageCollector(logging.Handler):
+    "Sums the dynamo usage the stream handler logs, by operation"
+
+    def __init__(self):
+        super().__init__()
+        self.calls = collections.Counter()
+
+    def emit(self, record):
+        for stats in getattr(record, 'dynamo_usage', []):
+            self.calls[stats['operation']] += stats['calls']
+
+
+def report(record_count, seconds, failures, telemetry, usage, fan_out_jobs, fan_out_seconds, appsync_client):
+    print(f'{record_count} records in {seconds:.3f}s: {record_count / seconds:.1f} records/s, {failures} failed')
+    print(f'{fan_out_jobs} feed fan-out jobs then drained in {fan_out_seconds:.3f}s')
+    notifications = sum(len(c[0][0]) for c in appsync_client.send_notifications.call_args_list)
+    print(f'{notifications} notifications sent in {appsync_client.send_notifications.call_count} requests')
+    print()
+    width = max([len('listener'), *map(len, telemetry.stats)])
+    print(f'{"listener":<{width}} {"calls":>6} {"skips":>6} {"errors":>6} {"mean ms":>8} {"max ms":>8}')
+    for name, stats in sorted(telemetry.stats.items(), key=lambda kv: -kv[1]['seconds']):
+        mean_ms = stats['seconds'] / stats['invocations'] * 1000 if stats['invocations'] else 0
+        print(
+            f'{name:<{width}} {stats["invocations"]:>6} {stats["skips"]:>6} {stats["exceptions"]:>6} '
+            + f'{mean_ms:>8.2f} {stats["maxSeconds"] * 1000:>8.2f}'
+        )
+    print()
+    print(f'{"dynamo operation":<32} {"calls":>6} {"per record":>10}')
+    for operation, calls in usage.calls.most_common():
+        print(f'{operation:<32} {calls:>6} {calls / record_count:>10.2f}')
+    total = sum(usage.calls.values())
+    print(f'{"total":<32} {total:>6} {total / record_count:>10.2f}')
+
+
+def main():
+    args = parse_args()
+    # listener errors are shown, the info the stream handler logs per record is not
+    usage, warning_handler = UsageCollector(), logging.StreamHandler()
+    warning_handler.setLevel(logging.WARNING)
+    logging.getLogger().handlers = [usage, warning_handler]
+
+    with moto.mock_dynamodb2():
+        create_tables()
+        # imported only now, so its clients are built against the mocked tables
+        from app.handlers.dynamo import handlers
+
+        for name in EXTERNAL_CLIENTS:
+            client = handlers.clients[name]
+            for attr, value in vars(type(client)).items():
+                if not attr.startswith('_') and attr not in UNMOCKED_METHODS and callable(value):
+                    setattr(client, attr, mock.Mock())
+
+        if args.synthetic:
+            managers = {
+                'chat': handlers.chat_manager,
+                'chat_message': handlers.chat_message_manager,
+                'follower': handlers.follower_manager,
+                'like': handlers.post_manager.like_manager,
+                'post': handlers.post_manager,
+                'user': handlers.user_manager,
+            }
+            stream = SyntheticStream(managers, handlers.clients['dynamo'], parse_mix(args.mix))
+            stream.seed(args.users)
+            records = [record for record in stream.generate(args.synthetic) if record]
+        else:
+            with open(args.path) as fh:
+                records = [json.loads(line) for line in fh if line.strip()]
+            if args.seed:
+                seed_items(handlers.clients['dynamo'], records)
+
+        telemetry = CollectingTelemetry()
+        handlers.processor.telemetry = telemetry
+        handlers.processor.max_workers = args.workers
+        if args.lanes:
+            lanes = [lane.split('+') for lane in args.lanes.split(',')]
+            handlers.processor.lanes = {pk_prefix: i for i, lane in enumerate(lanes) for pk_prefix in lane}
+        for client in (handlers.clients['dynamo'], handlers.clients['dynamo_feed']):
+            client.track_usage = True
+        # fan-out jobs are queued in memory as the stream is processed, and drained after
+        fan_out_queue = handlers.feed_manager.fan_out_queue = LocalQueueClient()
+
+        failures = 0
+        start = time.perf_counter()
+        for offset in range(0, len(records), args.batch_size):
+            response = handlers.process_records({'Records': records[offset : offset + args.batch_size]}, None)
+            failures += len(response['batchItemFailures'])
+        seconds = time.perf_counter() - start
+
+        def fan_out(job):
+            # batching notifications per job, as the function draining the queue does per message
+            notifications = {}
+            with handlers.clients['appsync'].notification_batch(notifications):
+                handlers.feed_manager.process_fan_out_job(job)
+            handlers.clients['appsync'].flush_notifications(notifications)
+
+        start = time.perf_counter()
+        fan_out_jobs = fan_out_queue.drain(fan_out, max_workers=args.fan_out_workers)
+        fan_out_seconds = time.perf_counter() - start
+
+    report(
+        len(records),
+        seconds,
+        failures,
+        telemetry,
+        usage,
+        fan_out_jobs,
+        fan_out_seconds,
+        handlers.clients['appsync'],
+    )
+
+
+if __name__ == '__main__':
+    main()